@@ -0,0 +1 @@
+"""Đo hiệu năng trộn đề: sinh đề .docx giả lập (synthetic), chạy bộ đo (run), so sánh kết quả giữa các commit (compare)."""
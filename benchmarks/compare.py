@@ -0,0 +1,47 @@
+import argparse
+import json
+import sys
+
+# ==================== SO SÁNH 2 FILE KẾT QUẢ ĐO ====================
+# python -m benchmarks.compare truoc.json sau.json [--fail-above 1.10]
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    return report["meta"], {(r["name"], r["questions"], r["variants"], r.get("document")): r
+                            for r in report["results"]}
+
+def compare(old_path, new_path, metric="median_s"):
+    """Trả về list (name, questions, variants, document, cũ, mới, tỉ lệ mới/cũ) cho các bài đo có ở cả 2 file"""
+    _, old = load_results(old_path)
+    _, new = load_results(new_path)
+    rows = []
+    for key, entry in new.items():
+        if key not in old: continue
+        before, after = old[key][metric], entry[metric]
+        rows.append(key + (before, after, after / before if before else float("inf")))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="So sánh 2 lần chạy benchmarks.run")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--metric", default="median_s", choices=["min_s", "median_s", "mean_s"])
+    parser.add_argument("--fail-above", type=float, help="thoát mã 1 nếu có bài đo chậm hơn tỉ lệ này")
+    args = parser.parse_args(argv)
+
+    old_meta, _ = load_results(args.old)
+    new_meta, _ = load_results(args.new)
+    print(f"{old_meta['commit']} -> {new_meta['commit']} ({args.metric})")
+    print(f"{'bài đo':<28} {'câu':>5} {'mã đề':>6} {'cũ (ms)':>11} {'mới (ms)':>11} {'tỉ lệ':>7}")
+    regressions = 0
+    for name, q, v, _, before, after, ratio in compare(args.old, args.new, args.metric):
+        flag = ""
+        if args.fail_above and ratio > args.fail_above:
+            regressions += 1
+            flag = "  <-- chậm hơn"
+        print(f"{name:<28} {q:>5} {v if v is not None else '-':>6} {before * 1000:>11.1f} {after * 1000:>11.1f} {ratio:>6.2f}x{flag}")
+    if regressions: sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import zipfile
+
+from tron_de.core import (
+    check_exam_structure, build_exam_model, shuffle_docx_logic, fix_merged_options,
+    get_xml_backend, xml_backend_scope, DEFAULT_XML_BACKEND,
+)
+from tron_de.parallel import generate_variants
+from tron_de.summary import generate_summary_docx
+from tron_de.excel import generate_real_excel_xlsx
+from tron_de.batch import write_result_zip, regenerate_variant
+from tron_de.preview import preview_variant_html
+from tron_de.compression import COMPRESSION_PRESETS
+from .synthetic import scaled_exam_docx
+
+# ==================== BỘ ĐO HIỆU NĂNG ====================
+# Chạy: python -m benchmarks.run [--quick] [--out results.json]
+# So sánh 2 lần chạy (vd trước/sau 1 commit): python -m benchmarks.compare old.json new.json
+# Đo trên đề thật thay cho đề giả lập: --files de1.docx de2.docx (số câu lấy từ đề)
+# Chọn preset nén: python -m benchmarks.run --files de.docx --variants 20 --only result_zip (thời gian + kích thước zip)
+
+HEADER_INFO = {"enable": True, "so_gd": "SỞ GD&ĐT", "truong": "TRƯỜNG THPT", "ky_thi": "KIỂM TRA",
+               "mon_thi": "TOÁN", "thoi_gian": "90 phút", "nam_hoc": "2025 - 2026"}
+CONFIG = {"shuffle_pos_global": True, "shuffle_opt_global": True, "fixed_pos_set": set(),
+          "fixed_opt_set": set(), "fix_group_pos": True}
+
+def measure(fn, repeat, setup=None):
+    """Chạy fn() repeat lần, trả về các thời gian (giây). setup() chạy trước mỗi lần, không tính giờ,
+    kết quả của nó được truyền vào fn."""
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        if setup: fn(arg)
+        else: fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+def git_commit():
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def count_questions(model):
+    return sum(1 if item["type"] == "question" else len(item["questions"])
+               for section in model["sections"] if section["type"] == "part" for item in section["items"])
+
+def parse_for_fix(file_bytes, xml_backend):
+    with zipfile.ZipFile(io.BytesIO(file_bytes)) as zin:
+        return get_xml_backend(xml_backend).parse(zin.read("word/document.xml"))
+
+def run_suite(questions, variants, repeat, xml_backend, only=None, doc_options=None, log=print, files=None):
+    """files: đường dẫn các đề .docx thật (bỏ qua questions + doc_options, không dùng đề giả lập)"""
+    doc_options = doc_options or {}
+    results = []
+    document = None
+
+    def record(name, q, v, times, output_bytes=None):
+        entry = {"name": name, "questions": q, "variants": v, "repeat": len(times),
+                 "min_s": min(times), "median_s": statistics.median(times), "mean_s": statistics.fmean(times)}
+        if document: entry["document"] = document
+        if output_bytes is not None: entry["output_bytes"] = output_bytes
+        results.append(entry)
+        size = f"  {output_bytes / 1024:9.1f} KB" if output_bytes is not None else ""
+        log(f"{name:<28} q={q:<5} v={v if v is not None else '-':<4} min={entry['min_s'] * 1000:9.1f} ms  median={entry['median_s'] * 1000:9.1f} ms{size}")
+
+    def wanted(name):
+        return not only or name in only or name.split("[")[0] in only
+
+    def documents():
+        if not files:
+            for q in questions: yield None, q, scaled_exam_docx(q, **doc_options)
+            return
+        for path in files:
+            with open(path, "rb") as f:
+                file_bytes = f.read()
+            yield os.path.basename(path), count_questions(build_exam_model(file_bytes, "auto", xml_backend)), file_bytes
+
+    for document, q, file_bytes in documents():
+        if document: log(f"--- {document}")
+        if wanted("check_exam_structure"):
+            record("check_exam_structure", q, None, measure(lambda: check_exam_structure(file_bytes, xml_backend), repeat))
+        if wanted("fix_merged_options"):
+            def fix(doc):
+                with xml_backend_scope(xml_backend): fix_merged_options(doc)
+            record("fix_merged_options", q, None, measure(fix, repeat, setup=lambda: parse_for_fix(file_bytes, xml_backend)))
+        if wanted("build_exam_model"):
+            record("build_exam_model", q, None, measure(lambda: build_exam_model(file_bytes, "auto", xml_backend), repeat))
+
+        model = build_exam_model(file_bytes, "auto", xml_backend)
+        # Xem trước 1 mã đề (HTML) so với sinh lại đúng mã đề đó thành .docx
+        if wanted("preview_variant_html"):
+            record("preview_variant_html", q, None, measure(lambda: preview_variant_html(model, HEADER_INFO, "101", CONFIG, ["101"]), repeat))
+        if wanted("regenerate_variant"):
+            record("regenerate_variant", q, None, measure(lambda: regenerate_variant(model, HEADER_INFO, "101", CONFIG, ["101"]), repeat))
+        for v in variants:
+            codes = [str(101 + i) for i in range(v)]
+            if wanted("shuffle_docx_logic"):
+                def legacy():
+                    for code in codes: shuffle_docx_logic(file_bytes, "auto", HEADER_INFO, code, CONFIG, xml_backend, codes)
+                record("shuffle_docx_logic", q, v, measure(legacy, repeat))
+            if wanted("generate_variants"):
+                record("generate_variants", q, v, measure(
+                    lambda: generate_variants(model, HEADER_INFO, codes, CONFIG, seeds=list(range(v))), repeat))
+            answers = {code: keys for code, (_, keys) in zip(codes, generate_variants(model, HEADER_INFO, codes, CONFIG, seeds=list(range(v))))}
+            if wanted("generate_summary_docx"):
+                record("generate_summary_docx", q, v, measure(lambda: generate_summary_docx(file_bytes, answers), repeat))
+            if wanted("generate_real_excel_xlsx"):
+                record("generate_real_excel_xlsx", q, v, measure(lambda: generate_real_excel_xlsx(answers), repeat))
+            for preset in COMPRESSION_PRESETS:
+                # Cả zip kết quả (mã đề + đáp án Word/Excel), tuần tự, theo từng preset nén
+                name = f"result_zip[{preset}]"
+                if not wanted(name): continue
+                preset_config = {**CONFIG, "compression": preset}
+                buffer = io.BytesIO()
+                def write_zip():
+                    buffer.seek(0)
+                    buffer.truncate()
+                    write_result_zip(buffer, model, HEADER_INFO, codes, preset_config)
+                record(name, q, v, measure(write_zip, repeat), buffer.tell())
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo hiệu năng trộn đề trên đề giả lập")
+    parser.add_argument("--questions", type=int, nargs="+", default=[50, 200, 1000], help="tổng số câu của đề")
+    parser.add_argument("--variants", type=int, nargs="+", default=[1, 10, 50], help="số mã đề")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="chạy nhanh: 50 câu, 1 và 10 mã đề, 1 lần")
+    parser.add_argument("--only", nargs="+", help="chỉ chạy các bài đo có tên này")
+    parser.add_argument("--xml-backend", default=DEFAULT_XML_BACKEND)
+    parser.add_argument("--merged", type=float, default=0.3, help="tỉ lệ câu có đáp án dính 1 dòng")
+    parser.add_argument("--runs", type=int, default=2, help="số run mỗi đoạn văn")
+    parser.add_argument("--image-kb", type=int, nargs="*", default=[200], help="kích thước các ảnh nhúng (KB)")
+    parser.add_argument("--files", nargs="+", help="đo trên các đề .docx thật thay cho đề giả lập")
+    parser.add_argument("--out", help="file JSON kết quả (mặc định benchmarks/results/<commit>.json)")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.questions, args.variants, args.repeat = [50], [1, 10], 1
+
+    doc_options = {"merged_fraction": args.merged, "runs_per_paragraph": args.runs,
+                   "image_sizes": [kb * 1024 for kb in args.image_kb]}
+    commit = git_commit()
+    results = run_suite(args.questions, args.variants, args.repeat, args.xml_backend, args.only, doc_options,
+                        files=args.files)
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "xml_backend": args.xml_backend,
+            "repeat": args.repeat,
+            "document": {"files": [os.path.basename(path) for path in args.files]} if args.files else doc_options,
+        },
+        "results": results,
+    }
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Đã lưu kết quả: {out}")
+
+if __name__ == "__main__":
+    main()
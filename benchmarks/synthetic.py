@@ -0,0 +1,179 @@
+import io
+import random
+import zipfile
+
+# ==================== SINH FILE ĐỀ .DOCX GIẢ LẬP (PHỤC VỤ ĐO HIỆU NĂNG) ====================
+# Đề sinh ra đúng định dạng chuẩn của app: PHẦN 1 (trắc nghiệm A-D, gạch chân/tô đỏ đáp án đúng),
+# PHẦN 2 (đúng/sai a-d), PHẦN 3 (trả lời ngắn, dòng "Đáp án: ..."), nhóm @BẮT ĐẦU/KẾT THÚC DÙNG CHUNG@.
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+DOCUMENT_ROOT = (
+    '<w:document xmlns:wpc="http://schemas.microsoft.com/office/word/2010/wordprocessingCanvas" '
+    'xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006" '
+    'xmlns:o="urn:schemas-microsoft-com:office:office" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns:m="http://schemas.openxmlformats.org/officeDocument/2006/math" '
+    'xmlns:v="urn:schemas-microsoft-com:vml" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    f'xmlns:w="{W_NS}" '
+    'xmlns:w14="http://schemas.microsoft.com/office/word/2010/wordml" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture" mc:Ignorable="w14">'
+)
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="png" ContentType="image/png"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '</Types>'
+)
+
+PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    f'<w:styles xmlns:w="{W_NS}">'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/></w:style>'
+    '</w:styles>'
+)
+
+SECT_PR = (
+    '<w:sectPr><w:pgSz w:w="11906" w:h="16838"/>'
+    '<w:pgMar w:top="1134" w:right="850" w:bottom="1134" w:left="1701" w:header="708" w:footer="708" w:gutter="0"/>'
+    '</w:sectPr>'
+)
+
+def xml_text(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def make_run(text, underline=False, red=False, bold=False):
+    props = ""
+    if bold: props += "<w:b/>"
+    if red: props += '<w:color w:val="FF0000"/>'
+    if underline: props += '<w:u w:val="single"/>'
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    return f'<w:r>{"<w:rPr>" + props + "</w:rPr>" if props else ""}<w:t{space}>{xml_text(text)}</w:t></w:r>'
+
+def split_runs(text, n, **fmt):
+    """Cắt text thành n run liên tiếp (mô phỏng Word tách run do sửa chữa, gõ dấu...)"""
+    n = max(1, min(n, len(text)))
+    size = -(-len(text) // n)
+    return [make_run(text[i:i + size], **fmt) for i in range(0, len(text), size)]
+
+def make_paragraph(runs):
+    return f'<w:p w14:paraId="1A2B3C4D"><w:pPr><w:spacing w:after="0"/></w:pPr>{"".join(runs)}</w:p>'
+
+def make_image_paragraph(rel_id, index):
+    return make_paragraph([
+        f'<w:r><w:drawing><wp:inline><wp:docPr id="{index}" name="Picture {index}"/><a:graphic>'
+        f'<a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture"><pic:pic>'
+        f'<pic:blipFill><a:blip r:embed="{rel_id}"/></pic:blipFill></pic:pic></a:graphicData></a:graphic>'
+        f'</wp:inline></w:drawing></w:r>'
+    ])
+
+def make_exam_docx(part1=40, part2=8, part3=6, clusters=2, merged_fraction=0.3, runs_per_paragraph=2,
+                   image_sizes=(), seed=1):
+    """Sinh 1 file đề .docx hợp lệ.
+    part1/part2/part3: số câu mỗi phần (câu trong nhóm dùng chung tính vào Phần 1, mỗi nhóm 2 câu).
+    merged_fraction: tỉ lệ câu Phần 1 có 4 đáp án dính trên 1 dòng ("A. ...  B. ...").
+    runs_per_paragraph: số run mỗi đoạn văn bản. image_sizes: kích thước (bytes) từng ảnh nhúng."""
+    rnd = random.Random(seed)
+    runs = runs_per_paragraph
+    body = [
+        make_paragraph(split_runs("ĐỀ KIỂM TRA (ĐỀ GIẢ LẬP)", runs, bold=True)),
+        make_paragraph(split_runs("PHẦN 1. TRẮC NGHIỆM NHIỀU LỰA CHỌN", runs, bold=True)),
+        make_paragraph(split_runs("Thí sinh trả lời từ câu 1 đến câu cuối. Mỗi câu chỉ chọn một phương án.", runs)),
+    ]
+    images = list(image_sizes)
+    image_slots = {}
+    if images and part1:
+        step = max(1, part1 // len(images))
+        image_slots = {min(part1, 1 + k * step): k for k in range(len(images))}
+
+    def mcq(number):
+        out = [make_paragraph(split_runs(f"Câu {number}. ", 1, bold=True) +
+                              split_runs(f"Nội dung câu hỏi trắc nghiệm số {number}, chọn phương án đúng.", runs))]
+        if number in image_slots:
+            k = image_slots[number]
+            out.append(make_image_paragraph(f"rIdImg{k + 1}", k + 1))
+        correct = rnd.randrange(4)
+        options = [f"{'ABCD'[k]}. phương án {k + 1}" + " x" * rnd.choice([1, 5, 15]) for k in range(4)]
+        if rnd.random() < merged_fraction:
+            line = []
+            for k, opt in enumerate(options):
+                line += split_runs(opt + "    ", runs, underline=(k == correct))
+            out.append(make_paragraph(line))
+        else:
+            for k, opt in enumerate(options):
+                mark = {"red": True} if k == correct and number % 2 else {"underline": k == correct}
+                out.append(make_paragraph(split_runs(opt, runs, **mark)))
+        return out
+
+    number = 0
+    in_clusters = min(clusters * 2, part1)
+    for _ in range(part1 - in_clusters):
+        number += 1
+        body += mcq(number)
+    for c in range(in_clusters // 2):
+        body.append(make_paragraph([make_run("@BẮT ĐẦU DÙNG CHUNG@")]))
+        body.append(make_paragraph(split_runs(f"Đọc đoạn văn {c + 1} sau và trả lời các câu hỏi bên dưới.", runs)))
+        for _ in range(2):
+            number += 1
+            body += mcq(number)
+        body.append(make_paragraph([make_run("@KẾT THÚC DÙNG CHUNG@")]))
+
+    if part2:
+        body.append(make_paragraph(split_runs("PHẦN 2. TRẮC NGHIỆM ĐÚNG SAI", runs, bold=True)))
+        for i in range(part2):
+            body.append(make_paragraph(split_runs(f"Câu {i + 1}. ", 1, bold=True) +
+                                       split_runs(f"Cho mệnh đề số {i + 1}, xét tính đúng sai của các ý sau.", runs)))
+            for k in range(4):
+                body.append(make_paragraph([make_run(f"{'abcd'[k]}) ")] +
+                                           split_runs(f"ý {k + 1} của câu {i + 1}", runs, underline=rnd.random() < 0.5)))
+
+    if part3:
+        body.append(make_paragraph(split_runs("PHẦN 3. TRẢ LỜI NGẮN", runs, bold=True)))
+        for i in range(part3):
+            body.append(make_paragraph(split_runs(f"Câu {i + 1}. ", 1, bold=True) +
+                                       split_runs(f"Tính giá trị của biểu thức số {i + 1}.", runs)))
+            body.append(make_paragraph([make_run(f"Đáp án: {rnd.randrange(1000)}")]))
+
+    body.append(SECT_PR)
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n' + DOCUMENT_ROOT +
+                "<w:body>" + "".join(body) + "</w:body></w:document>")
+    doc_rels = ['<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>']
+    for k in range(len(images)):
+        doc_rels.append(f'<Relationship Id="rIdImg{k + 1}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" Target="media/image{k + 1}.png"/>')
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zout:
+        zout.writestr("[Content_Types].xml", CONTENT_TYPES)
+        zout.writestr("_rels/.rels", PACKAGE_RELS)
+        zout.writestr("word/document.xml", document)
+        zout.writestr("word/_rels/document.xml.rels",
+                      '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                      '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">' +
+                      "".join(doc_rels) + '</Relationships>')
+        zout.writestr("word/styles.xml", STYLES)
+        for k, size in enumerate(images):
+            # Ảnh thật đã nén sẵn (PNG/JPEG) nên dùng bytes ngẫu nhiên, không nén được
+            zout.writestr(f"word/media/image{k + 1}.png", rnd.randbytes(size))
+    return buffer.getvalue()
+
+def scaled_exam_docx(questions, **kwargs):
+    """Đề có tổng số câu xấp xỉ questions, chia theo tỉ lệ đề chuẩn 40/8/6"""
+    part2 = max(1, round(questions * 8 / 54))
+    part3 = max(1, round(questions * 6 / 54))
+    part1 = max(1, questions - part2 - part3)
+    kwargs.setdefault("clusters", max(1, part1 // 20))
+    return make_exam_docx(part1, part2, part3, **kwargs)
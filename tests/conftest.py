@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Chạy pytest từ bất kỳ đâu vẫn import được tron_de và benchmarks (repo không đóng gói cài đặt)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
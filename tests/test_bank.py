@@ -0,0 +1,128 @@
+import io
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from benchmarks.synthetic import make_exam_docx
+from tron_de import bank
+from tron_de.core import R_NS, W_NS, build_exam_model
+
+W = f"{{{W_NS}}}"
+OTHER_NS = "urn:example:other"
+NUMBERING_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.numbering+xml"
+
+def numbering_xml(lvl_text):
+    return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:numbering xmlns:w="{W_NS}">'
+            f'<w:abstractNum w:abstractNumId="0"><w:nsid w:val="11223344"/><w:lvl w:ilvl="0"><w:start w:val="1"/>'
+            f'<w:lvlText w:val="{lvl_text}"/></w:lvl></w:abstractNum>'
+            '<w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num></w:numbering>')
+
+def list_paragraph(text):
+    return (f'<w:p><w:pPr><w:numPr><w:ilvl w:val="0"/><w:numId w:val="1"/></w:numPr></w:pPr>'
+            f'<w:r><w:t>{text}</w:t></w:r></w:p>')
+
+def after_question(document, number, xml):
+    """Chèn xml ngay sau đoạn "Câu number." đầu tiên"""
+    start = document.index(f"Câu {number}. ")
+    end = document.index("</w:p>", start) + len("</w:p>")
+    return document[:end] + xml + document[end:]
+
+def repack(docx, edit_document, numbering=None):
+    out = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(docx)) as zin, zipfile.ZipFile(out, "w") as zout:
+        for info in zin.infolist():
+            data = zin.read(info.filename)
+            if info.filename == "word/document.xml":
+                data = edit_document(data.decode("utf-8")).encode("utf-8")
+            elif numbering and info.filename == "word/_rels/document.xml.rels":
+                data = data.replace(b"</Relationships>", b'<Relationship Id="rIdNum" Type="' +
+                                    bank.NUMBERING_REL_TYPE.encode() + b'" Target="numbering.xml"/></Relationships>')
+            elif numbering and info.filename == "[Content_Types].xml":
+                data = data.replace(b"</Types>", b'<Override PartName="/word/numbering.xml" ContentType="' +
+                                    NUMBERING_TYPE.encode() + b'"/></Types>')
+            zout.writestr(info, data)
+        if numbering: zout.writestr("word/numbering.xml", numbering)
+    return out.getvalue()
+
+def source_a(document):
+    document = after_question(document, 1, list_paragraph("liệt kê nguồn A"))
+    document = after_question(document, 2, '<w:p><w:r><w:t>chú thích</w:t></w:r>'
+                                           '<w:r><w:footnoteReference w:id="1"/></w:r></w:p>')
+    return after_question(document, 3, '<w:p><w:commentRangeStart w:id="0"/><w:r><w:t>có bình luận</w:t></w:r>'
+                                       '<w:commentRangeEnd w:id="0"/><w:r><w:commentReference w:id="0"/></w:r></w:p>')
+
+def source_b(document):
+    # R_NS dưới prefix "rel", prefix "v" gắn URI khác (trùng tên với VML của nguồn A)
+    document = document.replace('xmlns:r="', 'xmlns:rel="').replace(' r:embed="', ' rel:embed="')
+    document = document.replace('xmlns:v="urn:schemas-microsoft-com:vml"', f'xmlns:v="{OTHER_NS}"')
+    document = after_question(document, 1, list_paragraph("liệt kê nguồn B"))
+    return after_question(document, 2, '<w:p><w:r><v:note v:id="7"/><w:t>ghi chú</w:t></w:r></w:p>')
+
+@pytest.fixture()
+def conn(tmp_path):
+    conn = bank.open_bank(str(tmp_path / "bank.sqlite"))
+    yield conn
+    conn.close()
+
+@pytest.fixture()
+def imported(conn):
+    a = repack(make_exam_docx(4, 2, 2, clusters=0, merged_fraction=0, seed=1), source_a, numbering_xml("%1)"))
+    b = repack(make_exam_docx(4, 2, 2, clusters=0, merged_fraction=0, image_sizes=(64,), seed=2), source_b,
+               numbering_xml("•"))
+    return bank.import_docx(conn, a, "a.docx"), bank.import_docx(conn, b, "b.docx")
+
+def assembled_parts(conn):
+    matrix = [{"part": 1, "count": 7}, {"part": 2, "count": 4}, {"part": 3, "count": 4}]
+    docx, _ = bank.assemble_exam(conn, matrix, seed=1)
+    with zipfile.ZipFile(io.BytesIO(docx)) as z:
+        parts = {name: z.read(name) for name in z.namelist()}
+    return docx, parts
+
+def test_footnote_items_are_skipped(imported):
+    result_a, result_b = imported
+    assert [d["code"] for d in result_a["diagnostics"]] == ["bank_notes_skipped"]
+    assert result_a["diagnostics"][0]["part"] == 1 and result_a["diagnostics"][0]["question"] == 2
+    assert result_a["questions"] == 7 and result_b["questions"] == 8 and not result_b["diagnostics"]
+
+def test_numbering_merged_per_source(conn, imported):
+    docx, parts = assembled_parts(conn)
+    document = ET.fromstring(parts["word/document.xml"])
+    numbering = ET.fromstring(parts["word/numbering.xml"])
+    abstract = {a.get(W + "abstractNumId"): a.find(f"{W}lvl/{W}lvlText").get(W + "val")
+                for a in numbering.iter(W + "abstractNum")}
+    nums = {n.get(W + "numId"): n.find(W + "abstractNumId").get(W + "val") for n in numbering.iter(W + "num")}
+    assert len(abstract) == 2 and len(nums) == 2
+    found = {}
+    for p in document.iter(W + "p"):
+        num_id = p.find(f"{W}pPr/{W}numPr/{W}numId")
+        if num_id is not None:
+            found["".join(t.text for t in p.iter(W + "t"))] = abstract[nums[num_id.get(W + "val")]]
+    assert found == {"liệt kê nguồn A": "%1)", "liệt kê nguồn B": "•"}
+    assert b"commentRange" not in parts["word/document.xml"] and b"commentReference" not in parts["word/document.xml"]
+    assert build_exam_model(docx)["validation"][0]
+
+def test_namespace_prefixes_merged_by_uri(conn, imported):
+    _, parts = assembled_parts(conn)
+    document = parts["word/document.xml"].decode("utf-8")
+    root = ET.fromstring(document)
+    assert f'xmlns:v="urn:schemas-microsoft-com:vml"' in document
+    assert re.search(r'xmlns:v2="%s"' % re.escape(OTHER_NS), document)
+    note = next(root.iter(f"{{{OTHER_NS}}}note"))
+    assert note.get(f"{{{OTHER_NS}}}id") == "7"
+    # Ảnh của nguồn B (R_NS dưới prefix "rel") vẫn được đổi rId và chép kèm
+    rels = ET.fromstring(parts["word/_rels/document.xml.rels"])
+    targets = {r.get("Id"): r.get("Target") for r in rels}
+    blips = [b.get(f"{{{R_NS}}}embed") for b in root.iter("{http://schemas.openxmlformats.org/drawingml/2006/main}blip")]
+    assert blips and all("word/" + targets[rid] in parts for rid in blips)
+
+def test_cli_seed_is_int(conn, imported, tmp_path):
+    matrix = tmp_path / "matrix.json"
+    matrix.write_text('[{"part": 1, "count": 7}, {"part": 2, "count": 4}, {"part": 3, "count": 4}]')
+    conn.commit()
+    out = tmp_path / "de.docx"
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    assert bank.main(["assemble", path, str(matrix), "--out", str(out), "--seed", "3"]) == 0
+    expected, _ = bank.assemble_exam(conn, [{"part": 1, "count": 7}, {"part": 2, "count": 4}, {"part": 3, "count": 4}], 3)
+    assert out.read_bytes() == expected
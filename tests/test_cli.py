@@ -0,0 +1,12 @@
+import pytest
+
+from tron_de.cli import main
+
+@pytest.mark.parametrize("content", [None, "{", "[1]", '{"compression": "fastest-ever"}'])
+def test_bad_config_exits_with_message(tmp_path, capsys, content):
+    config = tmp_path / "config.json"
+    if content is not None: config.write_text(content, encoding="utf-8")
+    assert main(["exam.docx", "--config", str(config), "--out-dir", str(tmp_path)]) == 1
+    err = capsys.readouterr().err
+    assert err.startswith(f"✗ {config}: ")
+    assert not (tmp_path / "exam.zip").exists()
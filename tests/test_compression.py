@@ -0,0 +1,29 @@
+import io
+import random
+import zipfile
+
+import pytest
+
+from tron_de.compression import COMPRESSION_PRESETS, write_member
+
+TEXT = "".join(f"<w:p><w:r><w:t>câu {random.Random(k).randrange(10 ** 6)}</w:t></w:r></w:p>"
+               for k in range(4000)).encode("utf-8")
+
+def write(name, data, compression, **kwargs):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zout:
+        write_member(zout, name, data, compression, **kwargs)
+    with zipfile.ZipFile(buffer) as zin:
+        info = zin.infolist()[0]
+        assert zin.read(info) == data
+    return info
+
+def test_levels_follow_preset():
+    sizes = {preset: write("word/document.xml", TEXT, preset).compress_size for preset in COMPRESSION_PRESETS}
+    assert sizes["smallest"] <= sizes["balanced"] < sizes["fastest"]
+
+@pytest.mark.parametrize("preset, method", [("balanced", zipfile.ZIP_STORED), ("smallest", zipfile.ZIP_DEFLATED)])
+def test_compressed_members(preset, method):
+    assert write("De_Tron_Ma_101.docx", TEXT, preset).compress_type == method
+    # kind ghi đè loại đoán theo tên (file đáp án .docx được nén như văn bản)
+    assert write("Dap_an.docx", TEXT, preset, kind="text").compress_type == zipfile.ZIP_DEFLATED
@@ -0,0 +1,100 @@
+import html
+import io
+import re
+import zipfile
+
+import pytest
+
+from benchmarks.synthetic import make_exam_docx
+from tron_de import core
+from tron_de.core import (CLUSTER_END, CLUSTER_START, XML_BACKENDS, LimitedReader, build_exam_model,
+                          check_exam_structure, render_variant)
+
+NO_SHUFFLE = {"shuffle_pos_global": False, "shuffle_opt_global": False}
+HEADER = {"enable": False}
+PARAGRAPH_RE = re.compile(r"<w:p[ >].*?</w:p>", re.S)
+RUN_RE = re.compile(r"<w:r>(.*?)</w:r>", re.S)
+TEXT_RE = re.compile(r"<w:t(?: [^>]*)?>([^<]*)</w:t>")
+MARK_RE = re.compile(r'<w:u w:val="single"/>|<w:color w:val="FF0000"/>')
+
+@pytest.fixture(scope="module")
+def source():
+    return make_exam_docx(part1=20, part2=4, part3=3, clusters=2, merged_fraction=0.3, seed=11)
+
+def document_xml(docx):
+    with zipfile.ZipFile(io.BytesIO(docx)) as z:
+        return z.read("word/document.xml").decode("utf-8")
+
+def body_text(docx):
+    """Toàn bộ chữ trong document.xml, bỏ khoảng trắng (tách đáp án dính dòng / gộp cột chỉ đổi khoảng trắng),
+    bỏ dòng đánh dấu nhóm câu dùng chung và dòng đáp án Phần 3 (đề xuất ra không giữ các dòng này)"""
+    out = []
+    for p in PARAGRAPH_RE.findall(document_xml(docx)):
+        text = html.unescape("".join(TEXT_RE.findall(p)))
+        if text in (CLUSTER_START, CLUSTER_END) or text.startswith("Đáp án:"): continue
+        out.append(text)
+    return re.sub(r"\s+", "", "".join(out))
+
+def source_keys(docx):
+    """Đáp án đọc thẳng từ đề giả lập (đáp án đúng gạch chân hoặc tô đỏ), không qua tron_de"""
+    keys = {"PHAN1": [], "PHAN2": [], "PHAN3": []}
+    part = "PHAN1"
+    for p in PARAGRAPH_RE.findall(document_xml(docx)):
+        runs = [(bool(MARK_RE.search(r)), html.unescape("".join(TEXT_RE.findall(r)))) for r in RUN_RE.findall(p)]
+        text = "".join(t for _, t in runs)
+        header = re.match(r"PHẦN (\d)", text)
+        if header:
+            part = f"PHAN{header.group(1)}"
+        elif text.startswith("Câu "):
+            keys[part].append([] if part == "PHAN2" else None)
+        elif part == "PHAN1":
+            label = None
+            for marked, run_text in runs:
+                found = re.findall(r"(?:^|\s)([A-D])\.", run_text)
+                if found: label = found[-1]
+                if marked and label and keys[part][-1] is None: keys[part][-1] = label
+        elif part == "PHAN2" and re.match(r"[a-d]\) ", text):
+            keys[part][-1].append("D" if any(marked for marked, _ in runs) else "S")
+        elif part == "PHAN3" and text.startswith("Đáp án: "):
+            keys[part][-1] = text[len("Đáp án: "):]
+    return keys
+
+@pytest.mark.parametrize("backend", sorted(XML_BACKENDS))
+def test_no_shuffle_keeps_text_and_keys(source, backend):
+    model = build_exam_model(source, xml_backend=backend)
+    docx, keys = render_variant(model, HEADER, "", NO_SHUFFLE, ma_de_list=[""])
+    assert body_text(docx) == body_text(source)
+    expected = source_keys(source)
+    assert len(expected["PHAN1"]) == 20 and None not in expected["PHAN1"]
+    for part, part_keys in expected.items():
+        assert keys[part] == part_keys
+        assert keys["ORDER"][part] == list(range(1, len(part_keys) + 1))
+
+def test_backends_render_identical_variants(source):
+    codes = ["101", "102", "103"]
+    models = {backend: build_exam_model(source, xml_backend=backend) for backend in sorted(XML_BACKENDS)}
+    models["streaming"] = build_exam_model(source, streaming=True)
+    outputs = []
+    for model in models.values():
+        variants = (render_variant(model, HEADER, code, ma_de_list=codes) for code in codes)
+        outputs.append([(document_xml(docx), keys) for docx, keys in variants])
+    for other in outputs[1:]:
+        assert other == outputs[0]
+
+@pytest.mark.parametrize("backend", sorted(XML_BACKENDS))
+def test_document_size_limit_on_every_backend(source, backend, monkeypatch):
+    monkeypatch.setattr(core, "MAX_DOCUMENT_XML_BYTES", 1024)
+    with pytest.raises(ValueError, match="quá lớn"):
+        build_exam_model(source, xml_backend=backend)
+    ok, errors = check_exam_structure(source, xml_backend=backend)
+    assert not ok and "quá lớn" in str(errors[0])
+
+def test_limited_reader_ignores_declared_size():
+    reader = LimitedReader(io.BytesIO(b"x" * 100), limit=64)
+    with pytest.raises(ValueError, match="quá lớn"):
+        while reader.read(16): pass
+
+def test_streaming_requires_etree(source):
+    with pytest.raises(ValueError, match="streaming"):
+        build_exam_model(source, xml_backend="minidom", streaming=True)
+    assert build_exam_model(source, xml_backend="minidom")["xml_backend"] == "minidom"
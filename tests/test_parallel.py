@@ -0,0 +1,39 @@
+import os
+import signal
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from benchmarks.synthetic import make_exam_docx
+from tron_de.core import build_exam_model
+from tron_de.parallel import create_process_pool, generate_variants, iter_variant_files
+
+CODES = [str(101 + k) for k in range(6)]
+HEADER = {"enable": False}
+
+def _kill_self():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+@pytest.fixture(scope="module")
+def model():
+    return build_exam_model(make_exam_docx(part1=30, part2=4, part3=3))
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = create_process_pool(2)
+    yield pool
+    pool.shutdown()
+
+def test_parallel_matches_sequential(model, pool):
+    expected = generate_variants(model, HEADER, CODES)
+    assert generate_variants(model, HEADER, CODES, executor=pool, workers=2) == expected
+    files = [(f.read(), keys) for _, f, keys in iter_variant_files(model, HEADER, CODES, executor=pool, workers=2)]
+    assert files == expected
+
+def test_pool_rebuilds_after_worker_dies(model, pool):
+    with pytest.raises(BrokenProcessPool):
+        pool.submit(_kill_self).result()
+    expected = generate_variants(model, HEADER, CODES)
+    # Lô đang dở chạy tuần tự (hoặc trên pool mới), lô sau chạy trên pool đã dựng lại
+    assert generate_variants(model, HEADER, CODES, executor=pool, workers=2) == expected
+    assert pool.submit(os.getpid).result() != os.getpid()
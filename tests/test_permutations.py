@@ -0,0 +1,115 @@
+from collections import Counter
+from itertools import combinations
+
+import pytest
+
+from benchmarks.synthetic import make_exam_docx
+from tron_de.core import build_exam_model, plan_variants, render_variant_xml
+from tron_de.permutations import MAX_RANK_CORRELATION, plan_batch
+
+CODES = [str(101 + k) for k in range(12)]
+HEADER = {"enable": False}
+
+@pytest.fixture(scope="module")
+def model():
+    return build_exam_model(make_exam_docx(part1=24, part2=6, part3=5, clusters=2, seed=7))
+
+def parts(model):
+    return [s for s in model["sections"] if s["type"] == "part"]
+
+def item_questions(item):
+    return [item["question"]] if item["type"] == "question" else item["questions"]
+
+def movable_items(model, config):
+    """Chỉ số câu/nhóm di chuyển được của từng phần, tính lại độc lập với part_layout"""
+    out = []
+    q_idx = 0
+    for part in parts(model):
+        movable = []
+        for i, item in enumerate(part["items"]):
+            fixed = q_idx + 1 in config.get("fixed_pos_set", set()) or \
+                    (config.get("fix_group_pos", False) and item["type"] == "cluster")
+            if not fixed: movable.append(i)
+            q_idx += len(item_questions(item))
+        out.append(movable)
+    return out
+
+def centered_ranks(plan, movable):
+    """Vector hạng (đã trừ trung bình) của các câu/nhóm di chuyển được, nối qua các phần"""
+    ranks = []
+    for part_plan, items in zip(plan, movable):
+        if len(items) < 2: continue
+        slot_of = {item: slot for slot, item in enumerate(part_plan["order"])}
+        slots = sorted(slot_of[i] for i in items)
+        ranks += [slots.index(slot_of[i]) - (len(items) - 1) / 2 for i in items]
+    return ranks
+
+def spearman(a, b):
+    norm = sum(x * x for x in a)
+    return sum(x * y for x, y in zip(a, b)) / norm
+
+def test_fixed_positions_and_options_stay(model):
+    config = {"fixed_pos_set": {1, 4, 26}, "fixed_opt_set": {2, 4, 26}, "fix_group_pos": True}
+    plans = plan_variants(model, CODES, config)
+    movable = movable_items(model, config)
+    # Các câu cố định vẫn ở đúng vị trí cũ (câu 1, 4 Phần 1, câu 2 Phần 2; nhóm dùng chung không đổi chỗ)
+    assert any(len(part["items"]) > len(items) for part, items in zip(parts(model), movable))
+    for plan in plans:
+        for part, part_plan, items in zip(parts(model), plan, movable):
+            for slot in range(len(part["items"])):
+                if slot not in items: assert part_plan["order"][slot] == slot
+
+    q_idx = 0
+    fixed_opt = []
+    for p, part in enumerate(parts(model)):
+        j = 0
+        for item in part["items"]:
+            for question in item_questions(item):
+                q_idx += 1
+                if q_idx in config["fixed_opt_set"]: fixed_opt.append((p, j))
+                j += 1
+    assert len(fixed_opt) == 3
+    for plan in plans:
+        for p, j in fixed_opt:
+            assert plan[p]["options"][j] is None
+
+    # Đề xuất ra: câu cố định đúng số thứ tự gốc, câu không trộn đáp án giữ chữ cái đáp án đúng
+    source_keys = render_variant_xml(model, HEADER, "", {"shuffle_pos_global": False, "shuffle_opt_global": False},
+                                     ma_de_list=[""])[1]
+    for code, plan in zip(CODES, plans):
+        keys = render_variant_xml(model, HEADER, code, config, plan=plan)[1]
+        assert keys["ORDER"]["PHAN1"][0] == 1 and keys["ORDER"]["PHAN1"][3] == 4
+        assert keys["ORDER"]["PHAN2"][1] == 2
+        for part, number in (("PHAN1", 2), ("PHAN1", 4), ("PHAN2", 2)):
+            slot = keys["ORDER"][part].index(number)
+            assert keys[part][slot] == source_keys[part][number - 1]
+
+@pytest.mark.parametrize("config", [{}, {"fixed_opt_set": {3, 9}}])
+def test_answer_letters_balanced(model, config):
+    plans = plan_variants(model, CODES, config)
+    for code, plan in zip(CODES, plans):
+        keys = render_variant_xml(model, HEADER, code, config, plan=plan)[1]["PHAN1"]
+        counts = Counter(keys)
+        assert set(counts) <= set("ABCD")
+        letters = [counts.get(letter, 0) for letter in "ABCD"]
+        assert max(letters) - min(letters) <= 1, (code, counts)
+
+@pytest.mark.parametrize("threshold", [MAX_RANK_CORRELATION, 0.3])
+def test_rank_correlation_below_threshold(model, threshold):
+    config = {"max_rank_correlation": threshold}
+    plans = plan_variants(model, CODES, config)
+    ranks = [centered_ranks(plan, movable_items(model, config)) for plan in plans]
+    worst = max(spearman(a, b) for a, b in combinations(ranks, 2))
+    assert worst <= threshold + 1e-9
+    # Ngưỡng thấp thật sự buộc đổi ứng viên: khác kế hoạch của cùng seed khi không giới hạn
+    if threshold < MAX_RANK_CORRELATION:
+        assert plans != plan_variants(model, CODES, {"max_rank_correlation": 1.0})
+
+def test_same_seeds_same_plan(model):
+    seeds = list(range(1000, 1010))
+    sections = model["sections"]
+    assert plan_batch(sections, seeds) == plan_batch(sections, seeds)
+    assert plan_batch(sections, seeds) != plan_batch(sections, seeds[::-1])
+    assert plan_variants(model, CODES) == plan_variants(model, CODES)
+    # Mã đề đầu lô không phụ thuộc các mã đề sau nó
+    assert plan_variants(model, CODES[:1]) == plan_variants(model, CODES)[:1]
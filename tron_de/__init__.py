@@ -0,0 +1,19 @@
+"""Lõi trộn đề Word: phân tích đề gốc, sinh mã đề, tạo file đáp án (không phụ thuộc Streamlit)."""
+from .core import (
+    parse_range_string,
+    check_exam_structure,
+    build_exam_model,
+    model_nbytes,
+    render_variant,
+    variant_seed,
+    plan_variants,
+    plan_for_variant,
+    shuffle_docx_logic,
+)
+from .validation import validate_sections, format_diagnostic
+from .preview import preview_variant_html
+from .summary import generate_summary_docx
+from .excel import generate_real_excel_xlsx
+from .compression import COMPRESSION_PRESETS, DEFAULT_COMPRESSION
+from .cache import BoundedCache, content_hash
+from .parallel import create_process_pool, default_workers, generate_variants
@@ -0,0 +1,599 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import posixpath
+import random
+import re
+import sqlite3
+import sys
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+
+from .core import (
+    W_NS, R_NS, QUESTION_RE, CLUSTER_START, CLUSTER_END, xml_backend_scope, text_cache_scope, fix_merged_options,
+    classify_blocks, split_sections, parse_questions_in_range, get_text, update_question_label, escape_xml,
+    build_exam_model, bake_style_marks,
+)
+from .styles import load_styles
+from .package import compress_member, write_package
+from .summary import STYLES, SECT_PR
+from .validation import PART_NUMBERS, diagnostic, format_diagnostic, snippet_text
+
+# ==================== NGÂN HÀNG CÂU HỎI (SQLITE) + GHÉP ĐỀ THEO MA TRẬN ====================
+# Nhập nhiều file đề .docx vào 1 file SQLite: mỗi câu hỏi (hoặc cả nhóm câu dùng chung) là 1 mục, lưu sẵn XML
+# các block (đã tách đáp án dính), phần (PHAN1/2/3), số câu, các thẻ và ảnh/công thức/OLE mà câu đó dùng.
+# Thẻ lấy từ dòng đánh dấu "@CHỦ ĐỀ: Đại số@", "@MỨC ĐỘ: Nhận biết@"... (tên thẻ tuỳ ý): áp cho các câu
+# phía sau tới khi gặp dòng đánh dấu cùng tên khác ("@CHỦ ĐỀ:@" để bỏ thẻ) hoặc hết phần (sang PHẦN mới thì mọi thẻ
+# được bỏ, đặt lại dòng đánh dấu ở đầu phần đó nếu cần); các dòng này không được lưu vào câu.
+# Ghép đề: mỗi dòng ma trận {"part": 1, "count": 10, "tags": {"chủ đề": "Đại số", "mức độ": "Dễ"}} lấy ngẫu nhiên
+# (theo seed) đủ số câu khớp thẻ, dựng thành 1 file .docx chuẩn (PHẦN 1/2/3, đánh lại số câu) rồi đưa vào
+# build_exam_model như file tải lên, nên các bước trộn / đáp án phía sau giữ nguyên.
+# Part đi kèm: styles.xml + theme lấy của file nguồn đầu tiên; numbering.xml của mọi file nguồn được gộp (đổi số
+# numId / abstractNumId theo từng nguồn); prefix namespace được gộp theo URI (trùng prefix khác URI thì đổi tên).
+# Câu có chú thích cuối trang / cuối bài không được nhập (báo lưu ý), dấu bình luận (comment) bị bỏ.
+#
+# python -m tron_de.bank import ngan_hang.sqlite de1.docx de2.docx
+# python -m tron_de.bank stats ngan_hang.sqlite
+# python -m tron_de.bank assemble ngan_hang.sqlite ma_tran.json --out de_moi.docx --seed 1 [--codes 101-104]
+
+TAG_MARKER_RE = re.compile(r'^@\s*([^@:]+?)\s*:\s*([^@]*?)\s*@$')
+NAMESPACE_RE = re.compile(rb'xmlns:(\w+)="([^"]*)"')
+IGNORABLE_RE = re.compile(rb'\bmc:Ignorable="([^"]*)"')
+PARA_ID_RE = re.compile(r'\s\w+:(?:paraId|textId)="[^"]*"')
+PACKAGE_DATE = (1980, 1, 1, 0, 0, 0)   # mốc thời gian cố định: cùng seed ra đúng từng byte
+RELS_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+CT_NS = "{http://schemas.openxmlformats.org/package/2006/content-types}"
+STYLES_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"
+NUMBERING_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/numbering"
+THEME_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/theme"
+NOTE_REF_RE = re.compile(r'<\w+:(footnote|endnote)Reference\b')
+COMMENT_MARK_RE = re.compile(r'<\w+:comment(?:RangeStart|RangeEnd|Reference)\b[^>]*/>')
+TAG_RE = re.compile(r'<(/?)([^\s<>/]+)([^<>]*)>')
+ATTR_RE = re.compile(r'(\s)([^\s=]+)="([^"]*)"')
+ABSTRACT_NUM_RE = re.compile(r'<w:abstractNum\b.*?</w:abstractNum>', re.S)
+NUM_RE = re.compile(r'<w:num\b[^>]*?(?:/>|>.*?</w:num>)', re.S)
+NUM_ID_RE = re.compile(r'(<w:numId w:val=")(\d+)(")')
+NOTE_KINDS = {"footnote": "cuối trang", "endnote": "cuối bài"}
+
+PART_TYPES = {"PHAN1": "PHAN1", "MCQ_ALL": "PHAN1", "PHAN2": "PHAN2", "TF_ALL": "PHAN2", "PHAN3": "PHAN3"}
+PART_TITLES = {
+    "PHAN1": "PHẦN 1. Câu trắc nghiệm nhiều phương án lựa chọn",
+    "PHAN2": "PHẦN 2. Câu trắc nghiệm đúng sai",
+    "PHAN3": "PHẦN 3. Câu trắc nghiệm trả lời ngắn",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY, name TEXT NOT NULL, hash TEXT NOT NULL UNIQUE, imported_at TEXT NOT NULL,
+    namespaces TEXT NOT NULL, styles BLOB, numbering BLOB, theme BLOB
+);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY, source_id INTEGER NOT NULL REFERENCES sources(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL, part TEXT NOT NULL, kind TEXT NOT NULL, n_questions INTEGER NOT NULL,
+    text TEXT NOT NULL, xml BLOB NOT NULL, refs TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_part_kind ON items(part, kind);
+CREATE TABLE IF NOT EXISTS tags (
+    key TEXT NOT NULL, value_norm TEXT NOT NULL, item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+    value TEXT NOT NULL, PRIMARY KEY (key, value_norm, item_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tags_item ON tags(item_id);
+CREATE TABLE IF NOT EXISTS media (
+    hash TEXT PRIMARY KEY, ext TEXT NOT NULL, content_type TEXT NOT NULL, data BLOB NOT NULL
+);
+"""
+
+def normalize_tag(text):
+    """Tên / giá trị thẻ để so khớp: bỏ khoảng trắng thừa, không phân biệt hoa thường"""
+    return " ".join(str(text).split()).casefold()
+
+def open_bank(path):
+    """Mở (tạo nếu chưa có) file ngân hàng câu hỏi"""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript(SCHEMA)
+    # Ngân hàng tạo từ bản cũ chưa có cột numbering / theme
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(sources)")}
+    for column in ("numbering", "theme"):
+        if column not in columns: conn.execute(f"ALTER TABLE sources ADD COLUMN {column} BLOB")
+    return conn
+
+# --- NHẬP FILE ĐỀ ---
+
+def _part_name(base, target):
+    """Tên part trong gói từ Target (tương đối với thư mục của part nguồn)"""
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base), target)).lstrip("/")
+
+def _content_types(zin):
+    root = ET.fromstring(zin.read("[Content_Types].xml"))
+    defaults = {el.get("Extension", "").lower(): el.get("ContentType") for el in root.iter(CT_NS + "Default")}
+    overrides = {el.get("PartName", "").lstrip("/"): el.get("ContentType") for el in root.iter(CT_NS + "Override")}
+    def content_type(name):
+        return overrides.get(name) or defaults.get(posixpath.splitext(name)[1][1:].lower(), "application/octet-stream")
+    return content_type
+
+def _relationships(zin):
+    """{rId: (Type, Target, TargetMode)} của document.xml"""
+    try:
+        root = ET.fromstring(zin.read("word/_rels/document.xml.rels"))
+    except KeyError:
+        return {}
+    return {el.get("Id"): (el.get("Type"), el.get("Target"), el.get("TargetMode"))
+            for el in root.iter(RELS_NS + "Relationship")}
+
+def _related_part(zin, rels, rel_type):
+    """(tên part, bytes) của part nối với document.xml theo kiểu quan hệ; không có thì (None, None)"""
+    for kind, target, mode in rels.values():
+        if kind != rel_type or mode == "External": continue
+        name = _part_name("word/document.xml", target)
+        try: return name, zin.read(name)
+        except KeyError: return name, None
+    return None, None
+
+def _marker_paragraph(text):
+    return f'<w:p><w:r><w:t>{escape_xml(text)}</w:t></w:r></w:p>'
+
+def analyze_source(file_bytes, xml_backend=None):
+    """Tách 1 file đề thành các mục ngân hàng (không ghi gì vào CSDL).
+    Trả về (thông tin nguồn, [mục], {hash: (đuôi file, content type, bytes)} của ảnh/OLE được dùng)."""
+    with zipfile.ZipFile(io.BytesIO(file_bytes)) as zin, xml_backend_scope(xml_backend) as xml, text_cache_scope():
+        doc_bytes = zin.read("word/document.xml")
+        styles = load_styles(zin)
+        try: styles_xml = zin.read("word/styles.xml")
+        except KeyError: styles_xml = None
+        rels = _relationships(zin)
+        content_type = _content_types(zin)
+        _, numbering_xml = _related_part(zin, rels, NUMBERING_REL_TYPE)
+        theme_name, theme_xml = _related_part(zin, rels, THEME_REL_TYPE)
+        # Theme có quan hệ riêng (ảnh nền...) thì không chép được trọn, bỏ
+        if theme_name and posixpath.join(posixpath.dirname(theme_name), "_rels",
+                                         posixpath.basename(theme_name) + ".rels") in zin.namelist():
+            theme_xml = None
+        doc = xml.parse(doc_bytes)
+        fix_merged_options(doc)
+        blocks = [b for b in xml.children(xml.body(doc)) if xml.local_name(b) in ("p", "tbl")]
+        tags = classify_blocks(blocks, styles)
+        # styles.xml của gói ghép đề là của 1 file nguồn khác: dấu đáp án đúng đặt qua style phải thành định dạng trực tiếp
+        for block in blocks: bake_style_marks(block, styles)
+
+        root_tag = doc_bytes[:doc_bytes.index(b">", doc_bytes.index(b"<w:document"))]
+        namespaces = {p.decode(): uri.decode() for p, uri in NAMESPACE_RE.findall(root_tag)}
+        ignorable = IGNORABLE_RE.search(root_tag)
+        source = {"namespaces": namespaces, "ignorable": ignorable.group(1).decode().split() if ignorable else [],
+                  "styles": styles_xml, "numbering": numbering_xml, "theme": theme_xml, "diagnostics": []}
+        r_prefix = next((p for p, uri in namespaces.items() if uri == R_NS), "r")
+        ref_re = re.compile(r'\b%s:\w+="([^"]*)"' % re.escape(r_prefix))
+
+        markers = {}
+        for i, tag in enumerate(tags):
+            m = TAG_MARKER_RE.match(tag["text"])
+            if m and not tag["cluster_start"] and not tag["cluster_end"]: markers[i] = m.groups()
+        marker_positions = sorted(markers)
+
+        media = {}
+        items = []
+        current = {}
+        next_marker = 0
+
+        def serialize(indices):
+            # Gói ghép đề không có comments.xml: bỏ dấu bình luận, giữ nguyên chữ
+            return "".join(COMMENT_MARK_RE.sub("", PARA_ID_RE.sub("", xml.to_xml(doc, blocks[i])))
+                           for i in indices if i not in markers)
+
+        def refs_of(item_xml):
+            refs = {}
+            for rid in set(ref_re.findall(item_xml)):
+                if rid not in rels: continue
+                rel_type, target, mode = rels[rid]
+                if mode == "External":
+                    refs[rid] = {"type": rel_type, "target": target, "external": True}
+                    continue
+                name = _part_name("word/document.xml", target)
+                try: data = zin.read(name)
+                except KeyError: continue
+                digest = hashlib.sha256(data).hexdigest()
+                media[digest] = (posixpath.splitext(name)[1], content_type(name), data)
+                refs[rid] = {"type": rel_type, "media": digest}
+            return refs
+
+        for section in split_sections(tags):
+            if section[0] != "part": continue
+            _, start, end, part_type, _ = section
+            _, parsed = parse_questions_in_range(tags, start, end)
+            # Thẻ không kéo sang phần sau; dòng đánh dấu nằm giữa 2 phần (kể cả trước dòng "PHẦN n") áp cho phần mới
+            current = {}
+            part_no = PART_NUMBERS[PART_TYPES[part_type]]
+            q_in_part = 0
+            for item in parsed:
+                if item["type"] == "question":
+                    indices = item["blocks"]
+                    item_xml = serialize(indices)
+                    text, n_questions = tags[indices[0]]["text"], 1
+                else:
+                    indices = item["header"] + [i for q in item["questions"] for i in q]
+                    if not item["questions"]: continue
+                    item_xml = (_marker_paragraph(CLUSTER_START) + serialize(item["header"]) +
+                                "".join(serialize(q) for q in item["questions"]) + _marker_paragraph(CLUSTER_END))
+                    first = item["header"] or item["questions"][0]
+                    text, n_questions = tags[first[0]]["text"], len(item["questions"])
+                q_in_part += n_questions
+                # Thẻ của mục = các dòng đánh dấu đứng trước block đầu tiên của mục
+                while next_marker < len(marker_positions) and marker_positions[next_marker] < min(indices):
+                    key, value = markers[marker_positions[next_marker]]
+                    if value: current[normalize_tag(key)] = value
+                    else: current.pop(normalize_tag(key), None)
+                    next_marker += 1
+                note = NOTE_REF_RE.search(item_xml)
+                if note:
+                    # Chú thích nằm trong footnotes.xml / endnotes.xml (kèm quan hệ riêng), gói ghép đề không có
+                    source["diagnostics"].append(diagnostic(
+                        "bank_notes_skipped", part_no, (q_in_part - n_questions + 1, None), min(indices),
+                        snippet_text(text), kind=NOTE_KINDS[note.group(1)]))
+                    continue
+                items.append({"part": PART_TYPES[part_type], "kind": item["type"], "n_questions": n_questions,
+                              "text": text[:300], "xml": item_xml.encode('utf-8'), "refs": refs_of(item_xml),
+                              "tags": dict(current)})
+    return source, items, media
+
+def import_docx(conn, file_bytes, name, xml_backend=None):
+    """Nhập 1 file đề vào ngân hàng (1 transaction). File đã nhập (cùng nội dung) thì bỏ qua.
+    Trả về {"source_id", "items", "questions", "skipped", "diagnostics": câu không nhập được (xem validation.py)}."""
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    row = conn.execute("SELECT id FROM sources WHERE hash = ?", (digest,)).fetchone()
+    if row:
+        count = conn.execute("SELECT COUNT(*), COALESCE(SUM(n_questions), 0) FROM items WHERE source_id = ?", row).fetchone()
+        return {"source_id": row[0], "items": count[0], "questions": count[1], "skipped": True, "diagnostics": []}
+    source, items, media = analyze_source(file_bytes, xml_backend)
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO sources (name, hash, imported_at, namespaces, styles, numbering, theme) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (name, digest, time.strftime("%Y-%m-%d %H:%M:%S"),
+             json.dumps({"namespaces": source["namespaces"], "ignorable": source["ignorable"]}), source["styles"],
+             source["numbering"], source["theme"]))
+        source_id = cur.lastrowid
+        conn.executemany("INSERT OR IGNORE INTO media (hash, ext, content_type, data) VALUES (?, ?, ?, ?)",
+                         [(h, ext, ct, data) for h, (ext, ct, data) in media.items()])
+        tag_rows = []
+        for position, item in enumerate(items):
+            cur = conn.execute(
+                "INSERT INTO items (source_id, position, part, kind, n_questions, text, xml, refs) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source_id, position, item["part"], item["kind"], item["n_questions"], item["text"], item["xml"],
+                 json.dumps(item["refs"])))
+            tag_rows.extend((key, normalize_tag(value), cur.lastrowid, value) for key, value in item["tags"].items())
+        conn.executemany("INSERT INTO tags (key, value_norm, item_id, value) VALUES (?, ?, ?, ?)", tag_rows)
+    return {"source_id": source_id, "items": len(items), "questions": sum(i["n_questions"] for i in items),
+            "skipped": False, "diagnostics": source["diagnostics"]}
+
+def bank_stats(conn):
+    """Thống kê ngân hàng: số mục / số câu theo phần + số câu theo từng thẻ"""
+    parts = [{"part": part, "kind": kind, "items": n, "questions": q} for part, kind, n, q in conn.execute(
+        "SELECT part, kind, COUNT(*), SUM(n_questions) FROM items GROUP BY part, kind ORDER BY part, kind")]
+    tags = [{"part": part, "key": key, "value": value, "items": n} for part, key, value, n in conn.execute(
+        "SELECT i.part, t.key, MIN(t.value), COUNT(*) FROM tags t JOIN items i ON i.id = t.item_id "
+        "GROUP BY i.part, t.key, t.value_norm ORDER BY i.part, t.key, t.value_norm")]
+    return {"sources": conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0], "parts": parts, "tags": tags}
+
+# --- GHÉP ĐỀ THEO MA TRẬN ---
+
+def normalize_part(part):
+    """1 / "1" / "P1" / "PHAN1" / "Phần 1" / "MCQ_ALL" -> "PHAN1"..."""
+    text = str(part).strip().upper()
+    if text in PART_TYPES: return PART_TYPES[text]
+    digits = re.findall(r'\d', text)
+    if len(digits) == 1 and digits[0] in "123": return f"PHAN{digits[0]}"
+    raise ValueError(f"Phần không hợp lệ trong ma trận: {part} (chọn 1, 2 hoặc 3)")
+
+def find_items(conn, part, tags=None, clusters=False):
+    """Mã các mục thuộc phần part, khớp mọi thẻ trong tags ({tên: giá trị}); clusters=True: chỉ lấy nhóm câu
+    dùng chung, ngược lại chỉ lấy câu lẻ. Lọc bằng chỉ mục (part, kind) và (key, value_norm)."""
+    sql = ["SELECT id FROM items WHERE part = ? AND kind = ?"]
+    params = [normalize_part(part), "cluster" if clusters else "question"]
+    for key, value in (tags or {}).items():
+        sql.append("AND id IN (SELECT item_id FROM tags WHERE key = ? AND value_norm = ?)")
+        params += [normalize_tag(key), normalize_tag(value)]
+    sql.append("ORDER BY id")
+    return [row[0] for row in conn.execute(" ".join(sql), params)]
+
+def select_items(conn, matrix, seed=None):
+    """Chọn mục cho từng dòng ma trận (không chọn trùng giữa các dòng). Dòng ma trận:
+    {"part": 1, "count": 10, "tags": {"chủ đề": "Đại số"}, "clusters": false} (clusters: count là số nhóm).
+    Trả về [{"part", "count", "tags", "clusters", "available", "items": [mã mục]}]; không đủ câu thì ValueError."""
+    rng = random.Random(seed)
+    used = set()
+    selection = []
+    for n, row in enumerate(matrix, start=1):
+        part = normalize_part(row.get("part", 1))
+        count = int(row.get("count", 0))
+        tags = row.get("tags") or {}
+        clusters = bool(row.get("clusters", False))
+        candidates = [i for i in find_items(conn, part, tags, clusters) if i not in used]
+        if count > len(candidates):
+            what = "nhóm câu" if clusters else "câu"
+            raise ValueError(f"Dòng {n} của ma trận cần {count} {what} {part} {tags or ''} nhưng ngân hàng chỉ còn {len(candidates)}")
+        chosen = rng.sample(candidates, count)
+        used.update(chosen)
+        selection.append({"part": part, "count": count, "tags": tags, "clusters": clusters,
+                          "available": len(candidates), "items": chosen})
+    return selection
+
+def _load_items(conn, ids):
+    rows = {}
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        for row in conn.execute(f"SELECT id, source_id, xml, refs FROM items WHERE id IN ({','.join('?' * len(chunk))})", chunk):
+            rows[row[0]] = {"source_id": row[1], "xml": row[2].decode('utf-8'), "refs": json.loads(row[3])}
+    return [rows[i] for i in ids]
+
+def _renumber_questions(doc_xml):
+    """Đánh lại "Câu n." theo thứ tự trong đề ghép, mỗi phần bắt đầu lại từ Câu 1"""
+    with xml_backend_scope() as xml, text_cache_scope():
+        doc = xml.parse(doc_xml)
+        number = 0
+        for block in xml.children(xml.body(doc)):
+            if xml.local_name(block) != "p": continue
+            text = get_text(block)
+            if text in PART_TITLES.values(): number = 0
+            elif QUESTION_RE.match(text):
+                number += 1
+                update_question_label(block, f"Câu {number}.")
+        return xml.doc_to_xml(doc).encode('utf-8')
+
+def _bind_namespaces(namespaces, declared):
+    """Gộp khai báo namespace {prefix: URI} của 1 nguồn vào namespaces của gói ghép. Trả về {prefix cũ: prefix mới}
+    cần đổi trong XML của nguồn: URI đã có prefix thì dùng prefix đó, prefix đã gắn URI khác thì đặt tên mới."""
+    by_uri = {}
+    for prefix, uri in namespaces.items(): by_uri.setdefault(uri, prefix)
+    rename = {}
+    for prefix, uri in declared.items():
+        target = by_uri.get(uri)
+        if target is None:
+            target = prefix
+            k = 2
+            while target in namespaces:
+                target = f"{prefix}{k}"
+                k += 1
+            namespaces[target] = uri
+            by_uri[uri] = target
+        if target != prefix: rename[prefix] = target
+    return rename
+
+def _rename_prefixes(xml_text, rename):
+    """Đổi prefix namespace trong XML: tên thẻ, tên thuộc tính, khai báo xmlns:, danh sách prefix của
+    mc:Choice Requires / mc:Ignorable"""
+    if not rename: return xml_text
+    def qname(name):
+        prefix, sep, local = name.partition(":")
+        if not sep: return name
+        if prefix == "xmlns": return f"xmlns:{rename.get(local, local)}"
+        return f"{rename.get(prefix, prefix)}:{local}"
+    def attr(m):
+        name, value = qname(m.group(2)), m.group(3)
+        if name == "Requires" or name.endswith(":Ignorable"): value = " ".join(rename.get(p, p) for p in value.split())
+        return f'{m.group(1)}{name}="{value}"'
+    return TAG_RE.sub(lambda m: f"<{m.group(1)}{qname(m.group(2))}{ATTR_RE.sub(attr, m.group(3))}>", xml_text)
+
+def _shift_ids(xml_text, pattern, offset, keep_zero=False):
+    """Cộng offset vào các số khớp nhóm 2 của pattern (keep_zero: giữ số 0, vd numId 0 là "không đánh số")"""
+    def shift(m):
+        value = int(m.group(2))
+        return f"{m.group(1)}{value if keep_zero and value == 0 else value + offset}{m.group(3)}"
+    return re.sub(pattern, shift, xml_text)
+
+def _merge_numbering(sources):
+    """Gộp numbering.xml của các nguồn (theo thứ tự, đã đổi prefix): [(mã nguồn, numbering)] ->
+    (abstractNum + num đã đổi số, {mã nguồn: số cộng thêm vào numId}). Nguồn đầu giữ nguyên số (styles.xml của
+    gói ghép là của nguồn đầu, có thể trỏ tới numId của nó); ảnh đầu dòng (numPicBullet) không được chép."""
+    abstract, nums, offsets = [], [], {}
+    next_abstract = next_num = 0
+    for source_id, numbering in sources:
+        source_abstract = [re.sub(r'<w:lvlPicBulletId\b[^>]*/>', "", a) for a in ABSTRACT_NUM_RE.findall(numbering)]
+        source_nums = NUM_RE.findall(numbering)
+        abstract_ids = [int(i) for a in source_abstract for i in re.findall(r'w:abstractNumId="(\d+)"', a)]
+        num_ids = [int(i) for n in source_nums for i in re.findall(r'w:numId="(\d+)"', n)]
+        abstract_offset, num_offset = next_abstract, next_num
+        if abstract_offset or num_offset:
+            # nsid trùng giữa các nguồn (cùng file mẫu) làm Word nối các danh sách với nhau
+            source_abstract = [re.sub(r'<w:nsid\b[^>]*/>', "", a) for a in source_abstract]
+        abstract.extend(_shift_ids(a, r'(w:abstractNumId=")(\d+)(")', abstract_offset) for a in source_abstract)
+        nums.extend(_shift_ids(_shift_ids(n, r'(w:numId=")(\d+)(")', num_offset),
+                               r'(<w:abstractNumId w:val=")(\d+)(")', abstract_offset) for n in source_nums)
+        offsets[source_id] = num_offset
+        next_abstract = max([abstract_offset + i + 1 for i in abstract_ids], default=next_abstract)
+        next_num = max([num_offset + i for i in num_ids], default=next_num)
+    return "".join(abstract) + "".join(nums), offsets
+
+def build_assembled_docx(conn, selection):
+    """Dựng file .docx từ các mục đã chọn: PHẦN 1/2/3 theo thứ tự, câu theo thứ tự dòng ma trận,
+    chép kèm ảnh/OLE (đổi rId), styles.xml + theme lấy của file nguồn đầu tiên (gạch chân / màu chữ đặt qua style
+    của các file khác đã được chép thành định dạng trực tiếp lúc nhập, xem analyze_source), numbering.xml gộp từ
+    mọi file nguồn (đổi numId), prefix namespace của từng nguồn đổi về prefix chung của gói."""
+    by_part = {part: [] for part in PART_TITLES}
+    for row in selection: by_part[row["part"]].extend(row["items"])
+    all_ids = [i for ids in by_part.values() for i in ids]
+    items = dict(zip(all_ids, _load_items(conn, all_ids)))
+
+    source_ids = list(dict.fromkeys(item["source_id"] for item in items.values()))
+    namespaces = {"w": W_NS, "r": R_NS}
+    ignorable = []
+    renames = {}
+    numbering_parts = []
+    styles_xml = theme_xml = None
+    for source_id in source_ids:
+        ns_json, source_styles, numbering, theme = conn.execute(
+            "SELECT namespaces, styles, numbering, theme FROM sources WHERE id = ?", (source_id,)).fetchone()
+        info = json.loads(ns_json)
+        rename = renames[source_id] = _bind_namespaces(namespaces, info["namespaces"])
+        ignorable.extend(p for p in (rename.get(p, p) for p in info["ignorable"]) if p not in ignorable)
+        if numbering:
+            numbering = numbering.decode('utf-8')
+            root = re.search(r'<\w+:numbering\b[^>]*>', numbering)
+            if root:
+                root_tag = root.group(0).encode('utf-8')
+                rename = _bind_namespaces(namespaces, {p.decode(): uri.decode() for p, uri in NAMESPACE_RE.findall(root_tag)})
+                numbering_ignorable = IGNORABLE_RE.search(root_tag)
+                if numbering_ignorable:
+                    ignorable.extend(p for p in (rename.get(p, p) for p in numbering_ignorable.group(1).decode().split())
+                                     if p not in ignorable)
+                numbering_parts.append((source_id, _rename_prefixes(numbering[root.end():], rename)))
+        if styles_xml is None: styles_xml, theme_xml = source_styles, theme
+    numbering_xml, num_offsets = _merge_numbering(numbering_parts)
+
+    rels = [f'<Relationship Id="rIdStyles" Type="{STYLES_REL_TYPE}" Target="styles.xml"/>']
+    overrides = []
+    media_parts = {}   # hash media -> (rId mới, tên part)
+    media_members = []
+
+    def remap(item):
+        item_xml = _rename_prefixes(item["xml"], renames[item["source_id"]])
+        if num_offsets.get(item["source_id"]):
+            item_xml = _shift_ids(item_xml, NUM_ID_RE, num_offsets[item["source_id"]], keep_zero=True)
+        mapping = {}
+        for rid, ref in item["refs"].items():
+            if ref.get("external"):
+                new_id = f"rIdB{len(rels)}"
+                rels.append(f'<Relationship Id="{new_id}" Type="{ref["type"]}" Target="{escape_xml(ref["target"])}" TargetMode="External"/>')
+            elif ref["media"] in media_parts:
+                new_id = media_parts[ref["media"]][0]
+            else:
+                ext, content_type, data = conn.execute(
+                    "SELECT ext, content_type, data FROM media WHERE hash = ?", (ref["media"],)).fetchone()
+                new_id = f"rIdB{len(rels)}"
+                name = f"word/media/bank_{ref['media'][:16]}{ext}"
+                media_parts[ref["media"]] = (new_id, name)
+                rels.append(f'<Relationship Id="{new_id}" Type="{ref["type"]}" Target="{name[5:]}"/>')
+                overrides.append(f'<Override PartName="/{name}" ContentType="{content_type}"/>')
+                media_members.append(compress_member(name, data, PACKAGE_DATE))
+            mapping[rid] = new_id
+        if not mapping: return item_xml
+        # Prefix đã đổi về prefix chung: R_NS luôn là "r"
+        return re.sub(r'(\br:\w+=")([^"]*)(")',
+                      lambda m: m.group(1) + mapping.get(m.group(2), m.group(2)) + m.group(3), item_xml)
+
+    body = []
+    for part, ids in by_part.items():
+        if not ids: continue
+        body.append(f'<w:p><w:r><w:rPr><w:b/></w:rPr><w:t>{PART_TITLES[part]}</w:t></w:r></w:p>')
+        body.extend(remap(items[i]) for i in ids)
+    decls = " ".join(f'xmlns:{p}="{escape_xml(uri)}"' for p, uri in namespaces.items())
+    ignorable_attr = f' mc:Ignorable="{" ".join(p for p in ignorable if p in namespaces)}"' if "mc" in namespaces and ignorable else ""
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                f'<w:document {decls}{ignorable_attr}><w:body>' + "".join(body) + SECT_PR + '</w:body></w:document>')
+    extra_members = []
+    if numbering_xml:
+        rels.append(f'<Relationship Id="rIdNumbering" Type="{NUMBERING_REL_TYPE}" Target="numbering.xml"/>')
+        overrides.append('<Override PartName="/word/numbering.xml" '
+                         'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.numbering+xml"/>')
+        numbering_doc = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                         f'<w:numbering {decls}{ignorable_attr}>{numbering_xml}</w:numbering>')
+        extra_members.append(compress_member("word/numbering.xml", numbering_doc.encode('utf-8'), PACKAGE_DATE))
+    if theme_xml:
+        rels.append(f'<Relationship Id="rIdTheme" Type="{THEME_REL_TYPE}" Target="theme/theme1.xml"/>')
+        overrides.append('<Override PartName="/word/theme/theme1.xml" '
+                         'ContentType="application/vnd.openxmlformats-officedocument.theme+xml"/>')
+        extra_members.append(compress_member("word/theme/theme1.xml", theme_xml, PACKAGE_DATE))
+
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+        + "".join(overrides) + '</Types>')
+    package_rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+        '</Relationships>')
+    document_rels = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                     + "".join(rels) + '</Relationships>')
+    members = [
+        compress_member("[Content_Types].xml", content_types.encode('utf-8'), PACKAGE_DATE),
+        compress_member("_rels/.rels", package_rels.encode('utf-8'), PACKAGE_DATE),
+        compress_member("word/document.xml", _renumber_questions(document.encode('utf-8')), PACKAGE_DATE),
+        compress_member("word/_rels/document.xml.rels", document_rels.encode('utf-8'), PACKAGE_DATE),
+        compress_member("word/styles.xml", styles_xml or STYLES.encode('utf-8'), PACKAGE_DATE),
+    ] + extra_members + media_members
+    output = io.BytesIO()
+    write_package(output, {"source": b"", "members": members}, {})
+    return output.getvalue()
+
+def assemble_exam(conn, matrix, seed=None):
+    """Ghép đề theo ma trận: (file .docx bytes, bảng chọn câu của từng dòng ma trận)"""
+    selection = select_items(conn, matrix, seed)
+    return build_assembled_docx(conn, selection), selection
+
+def assemble_exam_model(conn, matrix, seed=None, xml_backend=None):
+    """Ghép đề theo ma trận rồi phân tích luôn: (model cho render_variant / write_result_zip..., bảng chọn câu)"""
+    docx_bytes, selection = assemble_exam(conn, matrix, seed)
+    return build_exam_model(docx_bytes, "auto", xml_backend), selection
+
+# --- DÒNG LỆNH ---
+
+def main(argv=None):
+    from .cli import parse_code_list
+    from .batch import write_result_zip
+    parser = argparse.ArgumentParser(prog="python -m tron_de.bank", description="Ngân hàng câu hỏi + ghép đề theo ma trận")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_import = sub.add_parser("import", help="nhập file đề .docx vào ngân hàng")
+    p_import.add_argument("bank")
+    p_import.add_argument("files", nargs="+")
+    p_stats = sub.add_parser("stats", help="thống kê số câu theo phần / thẻ")
+    p_stats.add_argument("bank")
+    p_assemble = sub.add_parser("assemble", help="ghép đề theo ma trận (file JSON: list các dòng ma trận)")
+    p_assemble.add_argument("bank")
+    p_assemble.add_argument("matrix")
+    p_assemble.add_argument("--out", required=True, help="file .docx đề ghép")
+    p_assemble.add_argument("--seed", type=int, help="cùng seed + ngân hàng + ma trận thì ra cùng đề")
+    p_assemble.add_argument("--codes", help='trộn luôn đề ghép thành các mã đề này (vd "101-104"), ghi zip cạnh file --out')
+    args = parser.parse_args(argv)
+
+    conn = open_bank(args.bank)
+    try:
+        if args.command == "import":
+            for path in args.files:
+                with open(path, "rb") as f:
+                    result = import_docx(conn, f.read(), os.path.basename(path))
+                state = "đã có, bỏ qua" if result["skipped"] else "đã nhập"
+                print(f"{path}: {state} {result['items']} mục ({result['questions']} câu)")
+                for d in result["diagnostics"]: print(f"  {format_diagnostic(d)}")
+        elif args.command == "stats":
+            stats = bank_stats(conn)
+            print(f"{stats['sources']} file nguồn")
+            for row in stats["parts"]: print(f"  {row['part']} {row['kind']}: {row['items']} mục, {row['questions']} câu")
+            for row in stats["tags"]: print(f"  {row['part']} [{row['key']}: {row['value']}]: {row['items']} mục")
+        else:
+            with open(args.matrix, encoding="utf-8") as f:
+                matrix = json.load(f)
+            try:
+                docx_bytes, selection = assemble_exam(conn, matrix, args.seed)
+            except ValueError as e:
+                print(f"✗ {e}", file=sys.stderr)
+                return 1
+            with open(args.out, "wb") as f:
+                f.write(docx_bytes)
+            print(f"✓ {args.out}: {sum(len(r['items']) for r in selection)} mục")
+            if args.codes:
+                zip_path = os.path.splitext(args.out)[0] + "_tron_de.zip"
+                model = build_exam_model(docx_bytes)
+                is_valid, diagnostics = model["validation"]
+                for d in diagnostics: print(f"  {format_diagnostic(d)}")
+                if not is_valid:
+                    print(f"✗ {args.out}: đề ghép chưa hợp lệ, không trộn mã đề", file=sys.stderr)
+                    return 1
+                with open(zip_path, "wb") as f:
+                    errors = write_result_zip(f, model, {"enable": False}, parse_code_list(args.codes), {})
+                print(f"✓ {zip_path}")
+                for err in errors: print(f"  {err}", file=sys.stderr)
+                if errors: return 1
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+import io
+import os
+import contextlib
+import tempfile
+import zipfile
+
+from concurrent.futures.process import BrokenProcessPool
+
+from .core import render_variant, plan_for_variant, build_exam_model
+from .summary import generate_summary_docx
+from .excel import generate_real_excel_xlsx
+from .parallel import iter_variant_files
+from .compression import write_member
+from .validation import diagnostic, format_diagnostic
+from .profiling import stage, add_bytes, note, profile_scope, current_profile, merge_profile
+
+# ==================== GÓI KẾT QUẢ CHO 1 FILE ĐỀ (DÙNG CHUNG CHO WEB VÀ CLI) ====================
+
+SUMMARY_DOCX_NAME = "Dap_an_tong_hop.docx"
+EXCEL_NAME = "Dap_an_Excel_Chuan.xlsx"
+REPORT_NAME = "Bao_cao_kiem_tra.txt"
+
+SPOOL_MAX_MEMORY = 16 * 1024 * 1024   # zip kết quả nhỏ hơn mức này thì giữ trong RAM, lớn hơn thì ghi xuống đĩa
+
+def variant_filename(ma_de):
+    return f"De_Tron_Ma_{ma_de}.docx"
+
+def regenerate_variant(model, header_info, ma_de, config, ma_de_list):
+    """Sinh lại đúng 1 mã đề (.docx bytes), giống hệt file cùng mã trong zip kết quả sinh với danh sách ma_de_list
+    (hoán vị lập cho cả lô nên cần đúng danh sách đó; kế hoạch rẻ, chỉ render đúng 1 mã đề)"""
+    plan = plan_for_variant(model, ma_de, ma_de_list, config)
+    return render_variant(model, header_info, ma_de, config, plan)[0]
+
+def write_result_entries(zout, model, header_info, ma_de_list, config, executor=None, workers=None,
+                         question_order=False, prefix="", progress=None):
+    """Sinh mọi mã đề từ model + file đáp án tổng hợp (Word, Excel), ghi vào zip đang mở zout,
+    tên entry có thêm prefix (vd "Toan_12/"), nén theo config["compression"]. progress(số mã đề đã xong, tổng) được gọi sau mỗi mã đề
+    (ném lỗi từ progress để dừng giữa chừng). Trả về danh sách lỗi khi tạo file đáp án."""
+    errors = []
+    compression = (config or {}).get("compression")
+    all_answers_summary = {}
+    if progress: progress(0, len(ma_de_list))
+    for ma_de, variant_file, keys_by_part in iter_variant_files(model, header_info, ma_de_list, config,
+                                                                executor=executor, workers=workers):
+        all_answers_summary[ma_de] = keys_by_part
+        with stage("result_zip"):
+            # Đọc trọn 1 mã đề (RAM vẫn chỉ cỡ 1 mã đề) để ghi bằng writestr, nhận được mức nén
+            data = variant_file.read()
+            write_member(zout, prefix + variant_filename(ma_de), data, compression)
+        add_bytes("result_zip", len(data))
+        if progress: progress(len(all_answers_summary), len(ma_de_list))
+    note(variants=len(all_answers_summary))
+
+    # Tạo file tổng hợp
+    try:
+        with stage("summary_docx"):
+            summary_bytes = generate_summary_docx(None, all_answers_summary, compression)
+        add_bytes("summary_docx", len(summary_bytes))
+        # Bảng đáp án lặp lại rất nhiều, vượt cửa sổ 32KB của deflate: nén thêm 1 lần vẫn nhỏ đi ~30%,
+        # nên 2 file đáp án được nén như văn bản (chỉ 2 file, không đáng kể thời gian)
+        write_member(zout, prefix + SUMMARY_DOCX_NAME, summary_bytes, compression, kind="text")
+    except Exception as e:
+        errors.append(f"Lỗi tạo file Word đáp án: {e}")
+
+    try:
+        with stage("excel"):
+            excel_bytes = generate_real_excel_xlsx(all_answers_summary, question_order)
+        add_bytes("excel", len(excel_bytes))
+        write_member(zout, prefix + EXCEL_NAME, excel_bytes, compression, kind="text")
+    except Exception as e:
+        errors.append(f"Lỗi tạo file Excel: {e}")
+    return errors
+
+def write_result_zip(fp, model, header_info, ma_de_list, config, executor=None, workers=None, question_order=False,
+                     progress=None):
+    """Sinh mọi mã đề từ model + file đáp án tổng hợp (Word, Excel), ghi dần thành zip vào fp.
+    Mỗi mã đề được chép vào zip ngay khi sinh xong (qua file tạm) nên RAM chỉ cỡ 1 mã đề, không phụ thuộc
+    số mã đề. question_order: thêm sheet thứ tự câu vào file Excel. Trả về danh sách lỗi khi tạo file đáp án."""
+    with zipfile.ZipFile(fp, 'w', zipfile.ZIP_DEFLATED) as zout:
+        return write_result_entries(zout, model, header_info, ma_de_list, config, executor, workers, question_order,
+                                    progress=progress)
+
+def _spool(write, max_memory):
+    # Ghi qua write(fp) vào file tạm (trong RAM khi còn nhỏ hơn max_memory, lớn hơn thì xuống đĩa)
+    fp = tempfile.SpooledTemporaryFile(max_size=max_memory, prefix="tron_de_", suffix=".zip")
+    try:
+        result = write(fp)
+    except BaseException:
+        fp.close()
+        raise
+    fp.seek(0)
+    return fp, result
+
+def spool_result_zip(model, header_info, ma_de_list, config, executor=None, workers=None, question_order=False,
+                     max_memory=SPOOL_MAX_MEMORY, progress=None):
+    """Như write_result_zip nhưng ghi vào file tạm (giữ trong RAM khi còn nhỏ hơn max_memory, lớn hơn thì
+    chuyển xuống đĩa). Trả về (file tạm đã tua về đầu, danh sách lỗi); file tự xoá khi đóng."""
+    return _spool(lambda fp: write_result_zip(fp, model, header_info, ma_de_list, config, executor=executor,
+                                              workers=workers, question_order=question_order,
+                                              progress=progress), max_memory)
+
+def build_result_zip(model, header_info, ma_de_list, config, executor=None, workers=None, question_order=False):
+    """Như write_result_zip nhưng trả về (zip bytes, danh sách lỗi); chỉ nên dùng cho ít mã đề"""
+    zip_buffer = io.BytesIO()
+    errors = write_result_zip(zip_buffer, model, header_info, ma_de_list, config, executor=executor, workers=workers,
+                              question_order=question_order)
+    return zip_buffer.getvalue(), errors
+
+# ==================== NHIỀU FILE ĐỀ: 1 ZIP CHUNG, MỖI FILE 1 THƯ MỤC ====================
+# Các file được phân tích song song (mỗi file 1 tiến trình), sau đó mã đề của từng file được sinh song song
+# theo mã đề và ghi thẳng vào zip chung dưới thư mục riêng, kèm báo cáo kiểm tra cấu trúc của từng file.
+
+def folder_names(filenames):
+    """Tên thư mục trong zip chung cho từng file đề: tên file bỏ đuôi, trùng thì thêm _2, _3..."""
+    names = []
+    used = set()
+    for filename in filenames:
+        stem = os.path.splitext(os.path.basename(filename))[0] or "de"
+        name = stem
+        k = 2
+        while name in used:
+            name = f"{stem}_{k}"
+            k += 1
+        used.add(name)
+        names.append(name)
+    return names
+
+def _build_model_safe(file_bytes, xml_backend, profiled=False):
+    # Có thể chạy trong tiến trình con: trả về (model, lỗi, profile); file hỏng thì model None
+    with (profile_scope() if profiled else contextlib.nullcontext()) as profile:
+        try:
+            return build_exam_model(file_bytes, "auto", xml_backend), None, profile
+        except Exception as e:
+            return None, str(e), profile
+
+def build_exam_models(file_list, xml_backend=None, executor=None):
+    """Phân tích nhiều file đề (bytes), song song mỗi file 1 tiến trình nếu có executor.
+    Trả về list (model, lỗi) đúng thứ tự file_list; file không đọc được thì model là None."""
+    results = None
+    profile = current_profile()
+    if executor is not None and len(file_list) > 1:
+        try:
+            futures = [executor.submit(_build_model_safe, b, xml_backend, profile is not None) for b in file_list]
+            results = [fut.result() for fut in futures]
+        except BrokenProcessPool:
+            # Pool hỏng -> phân tích tuần tự
+            results = None
+    if results is None:
+        return [_build_model_safe(b, xml_backend)[:2] for b in file_list]
+    for _, _, file_profile in results:
+        if file_profile is not None: merge_profile(profile, file_profile)
+    return [(model, error) for model, error, _ in results]
+
+def format_batch_report(report):
+    """Báo cáo kiểm tra + kết quả trộn từng file dạng text (ghi kèm vào zip chung)"""
+    lines = []
+    for entry in report:
+        if entry["skipped"]: status = "BỎ QUA (đề chưa hợp lệ)"
+        elif entry["valid"]: status = "HỢP LỆ"
+        else: status = "CÓ LỖI CẤU TRÚC"
+        lines.append(f"{entry['name']} -> {entry['folder']}/: {status}, {entry['variants']} mã đề")
+        lines.extend(f"    {format_diagnostic(d)}" for d in entry["diagnostics"])
+        lines.extend(f"    {err}" for err in entry["errors"])
+    return "\n".join(lines) + "\n"
+
+def write_batch_zip(fp, jobs, config, executor=None, workers=None, question_order=False, skip_invalid=False,
+                    progress=None):
+    """Trộn nhiều file đề vào 1 zip chung: mỗi file 1 thư mục (các mã đề + đáp án Word/Excel) + REPORT_NAME.
+    jobs: list {"name": tên file, "model": model (None nếu không đọc được), "error": lỗi đọc file,
+    "header_info": tiêu đề riêng của file, "ma_de_list": mã đề riêng của file}.
+    skip_invalid: không trộn file chưa qua bước kiểm tra cấu trúc.
+    progress(số mã đề đã xong, tổng số mã đề của mọi file) được gọi sau mỗi mã đề.
+    Trả về báo cáo từng file: {"name", "folder", "valid", "diagnostics" (lỗi cấu trúc, xem validation.py),
+    "errors" (lỗi khi trộn), "variants", "skipped"}."""
+    report = []
+    for job, folder in zip(jobs, folder_names([job["name"] for job in jobs])):
+        model = job["model"]
+        if model is None: is_valid, diagnostics = False, [diagnostic("read_error", error=job["error"])]
+        else: is_valid, diagnostics = model["validation"]
+        report.append({"name": job["name"], "folder": folder, "valid": is_valid, "diagnostics": list(diagnostics),
+                       "errors": [], "variants": 0, "skipped": model is None or (skip_invalid and not is_valid)})
+    total = sum(len(job["ma_de_list"]) for job, entry in zip(jobs, report) if not entry["skipped"])
+    offset = 0
+    with zipfile.ZipFile(fp, 'w', zipfile.ZIP_DEFLATED) as zout:
+        for job, entry in zip(jobs, report):
+            if entry["skipped"]: continue
+            file_progress = (lambda done, _, start=offset: progress(start + done, total)) if progress else None
+            try:
+                entry["errors"] = write_result_entries(zout, job["model"], job["header_info"], job["ma_de_list"], config,
+                                                       executor, workers, question_order, prefix=entry["folder"] + "/",
+                                                       progress=file_progress)
+                entry["variants"] = len(job["ma_de_list"])
+            except Exception as e:
+                # Lỗi của 1 file không làm hỏng cả lượt
+                entry["errors"].append(f"Lỗi khi trộn: {e}")
+            offset += len(job["ma_de_list"])
+        write_member(zout, REPORT_NAME, format_batch_report(report).encode('utf-8'), (config or {}).get("compression"))
+    return report
+
+def spool_batch_zip(jobs, config, executor=None, workers=None, question_order=False, skip_invalid=False,
+                    max_memory=SPOOL_MAX_MEMORY, progress=None):
+    """Như write_batch_zip nhưng ghi vào file tạm, trả về (file tạm đã tua về đầu, báo cáo từng file)"""
+    return _spool(lambda fp: write_batch_zip(fp, jobs, config, executor=executor, workers=workers,
+                                             question_order=question_order, skip_invalid=skip_invalid,
+                                             progress=progress), max_memory)
@@ -0,0 +1,51 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+# ==================== CACHE THEO NỘI DUNG FILE (GIỚI HẠN DUNG LƯỢNG) ====================
+# Streamlit chạy lại toàn bộ script mỗi lần đổi cấu hình / bấm nút. Kết quả nặng (model đề đã phân tích,
+# kết quả kiểm tra, file zip) được nhớ theo mã băm nội dung file, dùng chung giữa các lần rerun và phiên.
+# Khi vượt tổng dung lượng / số mục cho phép thì bỏ mục lâu không dùng nhất (LRU).
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+class BoundedCache:
+    """Cache LRU giới hạn theo tổng dung lượng (bytes, đo bằng sizeof) và số mục; an toàn đa luồng"""
+
+    def __init__(self, max_bytes, max_entries=None, sizeof=len):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.sizeof = sizeof
+        self._items = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items: return default
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._items: self._total -= self._items.pop(key)[1]
+            # Mục lớn hơn cả giới hạn thì không giữ lại
+            if size > self.max_bytes: return value
+            self._items[key] = (value, size)
+            self._total += size
+            while self._total > self.max_bytes or (self.max_entries and len(self._items) > self.max_entries):
+                _, (_, old_size) = self._items.popitem(last=False)
+                self._total -= old_size
+        return value
+
+    def get_or_create(self, key, factory):
+        """Lấy từ cache, nếu chưa có thì gọi factory() rồi lưu lại"""
+        value = self.get(key, self)
+        if value is self: value = self.put(key, factory())
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._total, "max_bytes": self.max_bytes}
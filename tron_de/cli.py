@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from .core import parse_range_string, build_exam_model, DEFAULT_XML_BACKEND
+from .parallel import create_process_pool, default_workers
+from .batch import write_result_zip
+from .profiling import profile_scope, profile_report, format_report
+from .validation import format_diagnostic
+from .compression import COMPRESSION_PRESETS, DEFAULT_COMPRESSION, resolve_compression
+
+# ==================== TRỘN ĐỀ HÀNG LOẠT TỪ DÒNG LỆNH (KHÔNG CẦN STREAMLIT) ====================
+# python -m tron_de de_toan.docx de_ly.docx --codes 101-124 --config cau_hinh.json --out-dir ket_qua --jobs 4
+#
+# File cấu hình (JSON), mọi khoá đều không bắt buộc:
+# {
+#   "header": {"so_gd": "...", "truong": "...", "ky_thi": "...", "mon_thi": "...", "thoi_gian": "...", "nam_hoc": "..."},
+#   "codes": "101-104",
+#   "shuffle_questions": true, "shuffle_options": true, "fix_group_pos": true,
+#   "fixed_questions": "1, 40", "fixed_options": "1-5",
+#   "seed_salt": "",   <- đổi chuỗi này để ra bộ đề khác; giữ nguyên thì chạy lại luôn ra đúng bộ đề cũ
+#   "balance_answers": true,   <- mỗi mã đề có số câu đáp án A/B/C/D (Phần 1) đều nhau
+#   "max_rank_correlation": 0.8,   <- ngưỡng giống nhau về thứ tự câu giữa 2 mã đề (tương quan hạng Spearman)
+#   "question_order": false   <- thêm sheet thứ tự câu (câu trong mã đề -> câu gốc) vào file Excel
+#   "compression": "balanced",   <- "fastest" | "balanced" | "smallest" (xem tron_de/compression.py), không đổi nội dung đề
+#   "xml_backend": "etree"
+# }
+
+def parse_code_list(s):
+    """"101-104, 201, A1" -> ["101", "102", "103", "104", "201", "A1"] (giữ thứ tự, bỏ trùng)"""
+    codes = []
+    for part in str(s).split(','):
+        part = part.strip()
+        if not part: continue
+        start, sep, end = part.partition('-')
+        if sep and start.strip().isdigit() and end.strip().isdigit():
+            codes.extend(str(n) for n in range(int(start), int(end) + 1))
+        else:
+            codes.append(part)
+    return list(dict.fromkeys(codes))
+
+def load_settings(config_path=None, codes=None, compression=None):
+    """Đọc file cấu hình, trả về (header_info, config, ma_de_list, xml_backend, question_order).
+    Không đọc được file: OSError; file / giá trị không hợp lệ: ValueError."""
+    raw = {}
+    if config_path:
+        with open(config_path, encoding="utf-8") as f:
+            raw = json.load(f)
+        if not isinstance(raw, dict): raise ValueError("file cấu hình phải là 1 object JSON")
+    header = raw.get("header")
+    header_info = {"enable": bool(header)}
+    if header: header_info.update({"enable": True, **header})
+    config = {
+        "shuffle_pos_global": raw.get("shuffle_questions", True),
+        "shuffle_opt_global": raw.get("shuffle_options", True),
+        "fixed_pos_set": parse_range_string(raw.get("fixed_questions", "")),
+        "fixed_opt_set": parse_range_string(raw.get("fixed_options", "")),
+        "fix_group_pos": raw.get("fix_group_pos", True),
+        "seed_salt": str(raw.get("seed_salt", "")),
+        "balance_answers": bool(raw.get("balance_answers", True)),
+        "compression": compression or raw.get("compression", DEFAULT_COMPRESSION),
+    }
+    resolve_compression(config["compression"])
+    if "max_rank_correlation" in raw: config["max_rank_correlation"] = float(raw["max_rank_correlation"])
+    code_spec = codes if codes is not None else raw.get("codes", "101-104")
+    ma_de_list = parse_code_list(",".join(code_spec) if isinstance(code_spec, list) else code_spec)
+    return header_info, config, ma_de_list, raw.get("xml_backend", DEFAULT_XML_BACKEND), bool(raw.get("question_order", False))
+
+def output_paths(files, out_dir):
+    """Tên file zip kết quả cho từng file đề, không trùng nhau"""
+    paths = []
+    used = set()
+    for path in files:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name = f"{stem}_tron_de.zip"
+        k = 2
+        while name in used:
+            name = f"{stem}_tron_de_{k}.zip"
+            k += 1
+        used.add(name)
+        paths.append(os.path.join(out_dir, name))
+    return paths
+
+def process_file(path, out_path, header_info, config, ma_de_list, xml_backend, strict=False, executor=None, workers=None,
+                 question_order=False, profile=False):
+    """Trộn 1 file đề, ghi zip kết quả. Trả về (ok, các dòng thông báo).
+    profile=True: thêm bảng thời gian từng bước vào cuối thông báo."""
+    if profile:
+        with profile_scope() as prof:
+            ok, lines = process_file(path, out_path, header_info, config, ma_de_list, xml_backend, strict, executor,
+                                     workers, question_order)
+        return ok, lines + [f"  {line}" for line in format_report(profile_report(prof))]
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        file_bytes = f.read()
+    model = build_exam_model(file_bytes, "auto", xml_backend)
+    is_valid, diagnostics = model["validation"]
+    lines = [f"  {format_diagnostic(d)}" for d in diagnostics]
+    if strict and not is_valid:
+        return False, [f"✗ {path}: đề chưa hợp lệ, bỏ qua (--strict)"] + lines
+    # Ghi thẳng ra đĩa (qua file .part, xong mới đổi tên) để không giữ cả file zip trong RAM
+    part_path = out_path + ".part"
+    try:
+        with open(part_path, "wb") as f:
+            errors = write_result_zip(f, model, header_info, ma_de_list, config, executor=executor, workers=workers,
+                                      question_order=question_order)
+        os.replace(part_path, out_path)
+    finally:
+        if os.path.exists(part_path): os.remove(part_path)
+    lines += [f"  {err}" for err in errors]
+    elapsed = time.perf_counter() - start
+    return not errors, [f"✓ {path} -> {out_path} ({len(ma_de_list)} mã đề, {elapsed:.1f}s)"] + lines
+
+def _process_file_safe(*args, **kwargs):
+    try:
+        return process_file(*args, **kwargs)
+    except Exception as e:
+        return False, [f"✗ {args[0]}: {e}"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m tron_de", description="Trộn đề Word hàng loạt (không cần giao diện web)")
+    parser.add_argument("files", nargs="+", help="các file đề gốc .docx")
+    parser.add_argument("--config", help="file cấu hình JSON (tiêu đề, tuỳ chọn trộn, mã đề...)")
+    parser.add_argument("--codes", help='danh sách mã đề, vd "101-124" hoặc "101,102,103" (ghi đè file cấu hình)')
+    parser.add_argument("--out-dir", default=".", help="thư mục ghi file zip kết quả")
+    parser.add_argument("--jobs", "-j", type=int, default=default_workers(), help="số tiến trình song song")
+    parser.add_argument("--strict", action="store_true", help="bỏ qua file chưa qua được bước kiểm tra cấu trúc")
+    parser.add_argument("--question-order", action="store_true", help="thêm sheet thứ tự câu vào file Excel đáp án")
+    parser.add_argument("--compression", choices=list(COMPRESSION_PRESETS),
+                        help="kiểu nén file kết quả (ghi đè file cấu hình, mặc định balanced)")
+    parser.add_argument("--profile", action="store_true", help="in thời gian từng bước xử lý của mỗi file (chẩn đoán chạy chậm)")
+    args = parser.parse_args(argv)
+
+    codes = [args.codes] if args.codes else None
+    try:
+        header_info, config, ma_de_list, xml_backend, question_order = load_settings(args.config, codes, args.compression)
+    except (OSError, ValueError) as e:
+        print(f"✗ {args.config}: {e}" if args.config else f"✗ {e}", file=sys.stderr)
+        return 1
+    question_order = question_order or args.question_order
+    if not ma_de_list: parser.error("chưa có mã đề nào")
+    os.makedirs(args.out_dir, exist_ok=True)
+    outputs = output_paths(args.files, args.out_dir)
+    jobs = max(1, args.jobs)
+
+    failed = 0
+    if jobs > 1 and len(args.files) > 1:
+        # Nhiều file: mỗi tiến trình xử lý trọn 1 file
+        with create_process_pool(min(jobs, len(args.files))) as pool:
+            futures = [pool.submit(_process_file_safe, path, out, header_info, config, ma_de_list, xml_backend, args.strict,
+                                   question_order=question_order, profile=args.profile)
+                       for path, out in zip(args.files, outputs)]
+            for fut in futures:
+                ok, lines = fut.result()
+                failed += not ok
+                print("\n".join(lines), flush=True)
+    else:
+        # 1 file (hoặc --jobs 1): song song theo mã đề
+        pool = create_process_pool(jobs) if jobs > 1 and len(ma_de_list) > 1 else None
+        try:
+            for path, out in zip(args.files, outputs):
+                ok, lines = _process_file_safe(path, out, header_info, config, ma_de_list, xml_backend, args.strict,
+                                               executor=pool, workers=jobs, question_order=question_order,
+                                               profile=args.profile)
+                failed += not ok
+                print("\n".join(lines), flush=True)
+        finally:
+            if pool is not None: pool.shutdown()
+    if failed:
+        print(f"{failed}/{len(args.files)} file lỗi", file=sys.stderr)
+    return 1 if failed else 0
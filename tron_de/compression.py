@@ -0,0 +1,68 @@
+import os
+import time
+import zipfile
+
+# ==================== CHÍNH SÁCH NÉN: KIỂU NÉN + MỨC NÉN THEO LOẠI ENTRY ====================
+# Áp cho mọi entry zip tự ghi: part mới/thay theo mã đề trong gói .docx (document.xml, footer, file đáp án Word)
+# và các file trong zip kết quả (mã đề .docx, đáp án Word/Excel, báo cáo). Part chép nguyên từ file gốc
+# (ảnh, OLE, styles...) giữ nguyên luồng đã nén, không nén lại ở preset nào.
+# - Đã nén sẵn (ảnh png/jpg/gif, âm thanh/video, gói .docx/.xlsx/.zip): lưu nguyên (STORED), deflate lại chỉ
+#   tốn CPU mà nhỏ đi chưa tới 2%.
+# - XML/.rels/văn bản: deflate theo mức của preset (chiếm gần hết thời gian nén, nhất là document.xml).
+# - Nhị phân khác (OLE/MathType .bin, .emf/.wmf...): deflate theo mức của preset.
+# Preset, đo zip kết quả 20 mã đề (python -m benchmarks.run --files de.docx --variants 20 --only result_zip):
+#   "fastest":  mức 1; đề 1500 câu nhanh hơn "balanced" ~10% nhưng zip lớn gần gấp đôi
+#   "balanced": mức 6 (mặc định); so với trước (deflate mọi thứ mức 6) đề nhiều ảnh nhanh hơn 3-7 lần,
+#               đề toàn chữ như cũ, zip lớn hơn chưa tới 2%
+#   "smallest": mức 9 + deflate cả file đã nén; zip nhỏ hơn "balanced" ~15% với đề dài, chậm hơn ~1,5 lần
+#               (đề nhiều ảnh chậm như trước, ảnh gần như không nhỏ đi)
+
+COMPRESSION_PRESETS = {
+    "fastest": {"text_level": 1, "binary_level": 1, "store_compressed": True},
+    "balanced": {"text_level": 6, "binary_level": 6, "store_compressed": True},
+    "smallest": {"text_level": 9, "binary_level": 9, "store_compressed": False},
+}
+DEFAULT_COMPRESSION = "balanced"
+
+COMPRESSED_EXTENSIONS = frozenset({
+    ".png", ".jpg", ".jpeg", ".jpe", ".gif", ".webp", ".mp3", ".mp4", ".m4a", ".wma", ".wmv",
+    ".docx", ".docm", ".xlsx", ".xlsm", ".pptx", ".zip",
+})
+TEXT_EXTENSIONS = frozenset({".xml", ".rels", ".vml", ".txt", ".json", ".csv"})
+
+def resolve_compression(compression=None):
+    """Tên preset (hoặc dict preset, None: mặc định) -> dict preset"""
+    if compression is None: compression = DEFAULT_COMPRESSION
+    if isinstance(compression, dict): return compression
+    if compression not in COMPRESSION_PRESETS:
+        raise ValueError(f"Kiểu nén không hợp lệ: {compression!r} (chọn {', '.join(COMPRESSION_PRESETS)})")
+    return COMPRESSION_PRESETS[compression]
+
+def member_kind(name):
+    """Loại entry theo đuôi file: compressed (đã nén sẵn), text hoặc binary"""
+    ext = os.path.splitext(name)[1].lower()
+    if ext in COMPRESSED_EXTENSIONS: return "compressed"
+    if ext in TEXT_EXTENSIONS: return "text"
+    return "binary"
+
+def member_compression(name, compression=None, kind=None):
+    """(kiểu nén zipfile, mức nén) cho 1 entry theo loại (mặc định đoán theo tên); STORED thì mức nén là None"""
+    preset = resolve_compression(compression)
+    kind = kind or member_kind(name)
+    if kind == "compressed" and preset["store_compressed"]: return zipfile.ZIP_STORED, None
+    if kind == "text": return zipfile.ZIP_DEFLATED, preset["text_level"]
+    return zipfile.ZIP_DEFLATED, preset["binary_level"]
+
+def zip_info(name, compression=None, date_time=None, kind=None):
+    """ZipInfo theo chính sách nén (kiểu nén, chưa có mức nén: ghi bằng write_member để truyền mức nén)"""
+    method, _ = member_compression(name, compression, kind)
+    info = zipfile.ZipInfo(name, date_time=date_time or time.localtime(time.time())[:6])
+    info.compress_type = method
+    info.external_attr = 0o600 << 16
+    return info
+
+def write_member(zout, name, data, compression=None, date_time=None, kind=None):
+    """Ghi 1 entry vào zip đang mở zout theo chính sách nén; mức nén truyền qua writestr(compresslevel=)
+    (zout.open(info, 'w') không nhận mức nén)"""
+    _, level = member_compression(name, compression, kind)
+    zout.writestr(zip_info(name, compression, date_time, kind), data, compresslevel=level)
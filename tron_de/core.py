@@ -0,0 +1,1321 @@
+import re
+import bisect
+import zipfile
+import io
+import os
+import contextlib
+import contextvars
+import hashlib
+import json
+from xml.dom import minidom
+
+from .package import build_package_template, write_package
+from .cache import content_hash
+from .styles import EMPTY_STYLES, NO_MARKS, MARK_PROPS, merge_marks, load_styles
+from .profiling import stage, add_bytes, note
+from .permutations import plan_batch
+from .validation import validate_sections, diagnostic
+from . import xml_minidom, xml_etree
+
+# ==================== PHẦN 1: LOGIC XỬ LÝ (CORE) ====================
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+# --- XML BACKEND: CHỌN THƯ VIỆN XML CHO TỪNG LƯỢT PHÂN TÍCH ---
+# Các hàm thao tác XML (get_text, is_correct_option, tách/gộp dòng, đổi nhãn...) gọi qua backend đang
+# chọn trong xml_backend_scope(). minidom là cài đặt gốc; etree (ElementTree) nhẹ và nhanh hơn nhiều,
+# cho ra đúng cùng chuỗi XML. Ngoài scope, các hàm này làm việc với node minidom như trước.
+
+XML_BACKENDS = {xml_minidom.NAME: xml_minidom, xml_etree.NAME: xml_etree}
+DEFAULT_XML_BACKEND = xml_etree.NAME
+
+_xml_backend = contextvars.ContextVar("xml_backend", default=xml_minidom)
+
+def get_xml_backend(name=None):
+    name = name or DEFAULT_XML_BACKEND
+    if name not in XML_BACKENDS:
+        raise ValueError(f"XML backend không hợp lệ: {name} (chọn {', '.join(XML_BACKENDS)})")
+    return XML_BACKENDS[name]
+
+@contextlib.contextmanager
+def xml_backend_scope(name=None):
+    xml = get_xml_backend(name)
+    token = _xml_backend.set(xml)
+    try:
+        yield xml
+    finally:
+        _xml_backend.reset(token)
+
+def parse_range_string(s):
+    res = set()
+    if not s: return res
+    parts = str(s).split(',')
+    for part in parts:
+        part = part.strip()
+        if not part: continue
+        if '-' in part:
+            try:
+                start, end = map(int, part.split('-'))
+                res.update(range(start, end + 1))
+            except: pass
+        else:
+            try:
+                res.add(int(part))
+            except: pass
+    return res
+
+def escape_xml(text):
+    if not text: return ""
+    return str(text).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;").replace("'", "&apos;")
+
+# Các mã màu đỏ thường gặp trong Word
+RED_COLORS = frozenset(["FF0000", "RED", "C00000", "FF3333"])
+
+def _is_marked(marks):
+    u, color = marks
+    return bool(u and u != "none") or bool(color and color.upper() in RED_COLORS)
+
+def _run_props(xml, node, rpr_name, style_name):
+    """(styleId, (u, color)) khai báo trực tiếp trong pPr/rPr đầu tiên của node"""
+    for child in xml.children(node):
+        if xml.local_name(child) != rpr_name: continue
+        style_id, u, color = None, None, None
+        for prop in xml.children(child):
+            name = xml.local_name(prop)
+            if name == style_name: style_id = xml.get_attr(prop, W_NS, "val")
+            elif name == "u": u = xml.get_attr(prop, W_NS, "val")
+            elif name == "color": color = xml.get_attr(prop, W_NS, "val")
+        return style_id, (u, color)
+    return None, NO_MARKS
+
+# Phần tử không chứa run bên trong, bỏ qua khi tìm run để đỡ duyệt thừa
+_LEAF_NAMES = frozenset(["pPr", "rPr", "t", "tab", "br", "cr", "delText", "instrText", "fldChar", "sym",
+                         "lastRenderedPageBreak", "noBreakHyphen", "softHyphen", "proofErr", "bookmarkStart", "bookmarkEnd"])
+
+def _paragraph_marks(xml, p, styles):
+    style_id, _ = _run_props(xml, p, "pPr", "pStyle")
+    return styles["paragraph"].get(style_id, styles["default_paragraph"])
+
+def _run_marked(xml, r, para, styles):
+    style_id, direct = _run_props(xml, r, "rPr", "rStyle")
+    return _is_marked(merge_marks(direct, styles["styles"].get(style_id, NO_MARKS), para))
+
+def _any_run_marked(xml, node, para, styles):
+    """Duyệt cây tìm run có đánh dấu; đoạn lồng bên trong (textbox...) dùng paragraph style của chính nó"""
+    for child in xml.children(node):
+        name = xml.local_name(child)
+        if name == "p":
+            if _any_run_marked(xml, child, _paragraph_marks(xml, child, styles), styles): return True
+        elif name == "r":
+            if _run_marked(xml, child, para, styles) or _any_run_marked(xml, child, para, styles): return True
+        elif name not in _LEAF_NAMES:
+            if _any_run_marked(xml, child, para, styles): return True
+    return False
+
+def is_correct_option(block, styles=None):
+    """Kiểm tra xem block (đoạn văn) có chứa dấu hiệu đáp án đúng không (gạch chân hoặc đỏ), tính cả định dạng
+    kế thừa từ character/paragraph style. styles: bảng từ load_styles(), None thì chỉ xét định dạng trực tiếp."""
+    xml = _xml_backend.get()
+    if styles is None: styles = EMPTY_STYLES
+    para = _paragraph_marks(xml, block, styles) if xml.local_name(block) == "p" else styles["default_paragraph"]
+    return _any_run_marked(xml, block, para, styles)
+
+# Thứ tự phần tử con của rPr theo schema (Word báo lỗi file nếu sai thứ tự), dùng khi chèn u / color
+RPR_ORDER = ("rStyle", "rFonts", "b", "bCs", "i", "iCs", "caps", "smallCaps", "strike", "dstrike", "outline",
+             "shadow", "emboss", "imprint", "noProof", "snapToGrid", "vanish", "webHidden", "color", "spacing", "w",
+             "kern", "position", "sz", "szCs", "highlight", "u", "effect", "bdr", "shd", "fitText", "vertAlign",
+             "rtl", "cs", "em", "lang", "eastAsianLayout", "specVanish", "oMath")
+
+def _set_direct_mark(xml, run, name, value):
+    rpr = next((c for c in xml.children(run) if xml.local_name(c) == "rPr"), None)
+    if rpr is None:
+        rpr = xml.new_element(run, W_NS, "w:rPr")
+        xml.prepend(run, rpr)
+    el = xml.new_element(run, W_NS, f"w:{name}")
+    xml.set_attr(el, W_NS, "w:val", value)
+    rank = RPR_ORDER.index(name)
+    after = next((c for c in xml.children(rpr)
+                  if xml.local_name(c) in RPR_ORDER and RPR_ORDER.index(xml.local_name(c)) > rank), None)
+    if after is None: xml.append(rpr, el)
+    else: xml.insert_before(rpr, el, after)
+
+def _bake_runs(xml, node, para, styles):
+    for child in xml.children(node):
+        name = xml.local_name(child)
+        if name == "p": _bake_runs(xml, child, _paragraph_marks(xml, child, styles), styles)
+        elif name == "r":
+            style_id, direct = _run_props(xml, child, "rPr", "rStyle")
+            inherited = merge_marks(styles["styles"].get(style_id, NO_MARKS), para)
+            for prop, own, value in zip(MARK_PROPS, direct, inherited):
+                if own is None and value is not None: _set_direct_mark(xml, child, prop, value)
+            _bake_runs(xml, child, para, styles)
+        elif name not in _LEAF_NAMES: _bake_runs(xml, child, para, styles)
+
+def bake_style_marks(block, styles):
+    """Chép gạch chân / màu chữ kế thừa từ character/paragraph style (và docDefaults) thành định dạng trực tiếp
+    của từng run: block mang sang gói có styles.xml khác (ghép đề từ ngân hàng) vẫn giữ dấu đáp án đúng."""
+    xml = _xml_backend.get()
+    para = _paragraph_marks(xml, block, styles) if xml.local_name(block) == "p" else styles["default_paragraph"]
+    _bake_runs(xml, block, para, styles)
+
+def extract_short_answer_key(q_tags):
+    """Tách dòng đáp án/lời giải khỏi câu Phần 3: trả về vị trí các dòng còn lại và đáp án"""
+    key = ""
+    clean = []
+    for i, tag in enumerate(q_tags):
+        if tag["answer"] is not None:
+            key = tag["answer"]
+            continue
+        clean.append(i)
+    return clean, key
+
+# --- TEXT CACHE: MỖI BLOCK CHỈ TRÍCH TEXT 1 LẦN TRONG 1 LƯỢT PHÂN TÍCH ---
+# get_text được gọi lặp lại trên cùng 1 block (tách đáp án dính, gắn nhãn block, chọn bố cục đáp án...).
+# Trong text_cache_scope(), kết quả được nhớ theo từng block; các hàm sửa text của block
+# (tách dòng, đổi nhãn, gộp dòng) gọi invalidate_text() để xoá cache của block đó.
+
+_text_cache = contextvars.ContextVar("text_cache", default=None)
+
+@contextlib.contextmanager
+def text_cache_scope():
+    cache = {"texts": {}, "hits": 0, "misses": 0, "invalidations": 0}
+    token = _text_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _text_cache.reset(token)
+        cache["texts"] = {}
+
+@contextlib.contextmanager
+def text_cache_disabled():
+    """Tạm tắt cache text (chế độ streaming: cache giữ tham chiếu tới block nên sẽ giữ lại cả cây)"""
+    token = _text_cache.set(None)
+    try:
+        yield
+    finally:
+        _text_cache.reset(token)
+
+def text_cache_stats(cache):
+    total = cache["hits"] + cache["misses"]
+    return {
+        "hits": cache["hits"],
+        "misses": cache["misses"],
+        "invalidations": cache["invalidations"],
+        "hit_rate": round(cache["hits"] / total, 4) if total else 0.0,
+    }
+
+def invalidate_text(block):
+    cache = _text_cache.get()
+    if cache is not None and cache["texts"].pop(id(block), None) is not None:
+        cache["invalidations"] += 1
+
+def get_text(block):
+    cache = _text_cache.get()
+    if cache is not None:
+        # Lưu kèm block để id() không bị tái sử dụng cho node khác khi node cũ bị huỷ
+        entry = cache["texts"].get(id(block))
+        if entry is not None and entry[0] is block:
+            cache["hits"] += 1
+            return entry[1]
+        cache["misses"] += 1
+    xml = _xml_backend.get()
+    texts = []
+    for t in xml.descendants(block, W_NS, "t"):
+        value = xml.text(t)
+        if value: texts.append(value)
+    text = "".join(texts).strip()
+    if cache is not None: cache["texts"][id(block)] = (block, text)
+    return text
+
+# --- AUTO-SPLIT MERGED OPTIONS LOGIC ---
+
+# B., C., D. nằm giữa dòng (có khoảng trắng phía trước). VD: " ...  B. "
+# Group 1: Whitespace, Group 2: Letter (B-D), Group 3: Dot/Paren
+MERGED_OPTION_RE = re.compile(r'(\s+)([B-D])([\.\)])')
+
+def _trim_text_range(node, offset, lo, hi):
+    """Chỉ giữ phần text trong [lo, hi) của node (offset: vị trí text đầu tiên của node trong paragraph).
+    w:t nằm ngoài khoảng bị xoá, w:r mất hết text (chỉ còn rPr) cũng bị xoá. Trả về offset sau node."""
+    xml = _xml_backend.get()
+    for child in xml.children(node):
+        name = xml.local_name(child)
+        if name == "t" and xml.namespace(child) == W_NS:
+            txt = xml.text(child) or ""
+            end = offset + len(txt)
+            keep_lo, keep_hi = max(lo, offset), min(hi, end)
+            if keep_lo < keep_hi:
+                if keep_hi - keep_lo < len(txt): xml.set_text(child, txt[keep_lo - offset:keep_hi - offset])
+            else:
+                xml.remove(node, child)
+            offset = end
+        else:
+            start, offset = offset, _trim_text_range(child, offset, lo, hi)
+            if name == "r" and offset > start and all(xml.local_name(c) == "rPr" for c in xml.children(child)):
+                xml.remove(node, child)
+    return offset
+
+def split_paragraph_at_text_indices(p, cuts):
+    """Chia paragraph p tại các vị trí text cuts (tăng dần) thành len(cuts)+1 đoạn trong 1 lượt.
+    Phần tử nằm trọn trong 1 đoạn được chuyển nguyên sang đoạn đó; chỉ phần tử chứa điểm cắt mới bị nhân bản
+    rồi cắt text, run rỗng sau khi cắt bị bỏ. p giữ đoạn đầu, trả về các paragraph mới (chưa chèn vào body)."""
+    xml = _xml_backend.get()
+    bounds = [0] + list(cuts) + [float("inf")]
+    pieces = [[] for _ in range(len(cuts) + 1)]
+    ppr = None
+    offset = 0
+    for child in xml.children(p):
+        if xml.local_name(child) == "pPr":
+            ppr = child
+            pieces[0].append(child)
+            continue
+        length = sum(len(xml.text(t) or "") for t, _ in xml.text_nodes(child, W_NS))
+        if not length:
+            # Không có text (bookmark, ảnh...): theo đoạn chứa vị trí hiện tại, đứng ngay trước điểm cắt thì thuộc đoạn trước
+            pieces[bisect.bisect_left(cuts, offset)].append(child)
+            continue
+        first = bisect.bisect_right(cuts, offset)
+        last = bisect.bisect_right(cuts, offset + length - 1)
+        if first == last:
+            pieces[first].append(child)
+        else:
+            for j in range(first, last + 1):
+                part = child if j == first else xml.clone(child)
+                _trim_text_range(part, offset, bounds[j], bounds[j + 1])
+                pieces[j].append(part)
+        offset += length
+
+    new_paragraphs = []
+    for elems in pieces[1:]:
+        p_new = xml.shallow_clone(p)
+        if ppr is not None:
+            ppr_new = xml.clone(ppr)
+            # Ngắt section (nếu có) chỉ giữ ở đoạn đầu
+            for sect in xml.descendants(ppr_new, W_NS, "sectPr"): xml.remove(ppr_new, sect)
+            elems = [ppr_new] + elems
+        xml.replace_children(p_new, elems)
+        new_paragraphs.append(p_new)
+    xml.replace_children(p, pieces[0])
+    invalidate_text(p)
+    return new_paragraphs
+
+def merged_option_cuts(p):
+    """Vị trí text (trong paragraph) của mọi nhãn B./C./D. nằm giữa dòng đáp án"""
+    xml = _xml_backend.get()
+    raw = "".join(xml.text(t) or "" for t in xml.descendants(p, W_NS, "t"))
+    lead = len(raw) - len(raw.lstrip())
+    return [m.start(2) for m in MERGED_OPTION_RE.finditer(raw, lead)]
+
+def split_merged_option(block):
+    """Tách 1 dòng đáp án dính (A. ... B. ... C. ...): block giữ đáp án đầu, trả về các paragraph mới
+    (chưa chèn vào body) theo thứ tự; [] nếu block không phải dòng đáp án dính"""
+    xml = _xml_backend.get()
+    # Chỉ xử lý nếu dòng này có vẻ là dòng đáp án (chứa A. hoặc a.)
+    if xml.local_name(block) != "p" or not MCQ_OPTION_RE.match(get_text(block)): return []
+    cuts = merged_option_cuts(block)
+    if not cuts: return []
+    return split_paragraph_at_text_indices(block, cuts)
+
+def fix_merged_options(doc):
+    """Tự động tách các đáp án A. B. C. D. nằm chung 1 dòng thành các dòng riêng.
+    Mọi điểm cắt của 1 dòng được tìm trong 1 lượt và tách cùng lúc; body chỉ dựng lại 1 lần ở cuối."""
+    xml = _xml_backend.get()
+    body = xml.body(doc)
+    new_children = []
+    fixed_count = 0
+    for child in xml.children(body):
+        new_children.append(child)
+        split = split_merged_option(child)
+        new_children.extend(split)
+        fixed_count += len(split)
+    if fixed_count: xml.replace_children(body, new_children)
+    return fixed_count
+
+# --- END AUTO-SPLIT LOGIC ---
+
+def set_paragraph_tabs(paragraph, tab_positions):
+    xml = _xml_backend.get()
+    pPr_list = xml.descendants(paragraph, W_NS, "pPr")
+    if not pPr_list:
+        pPr = xml.new_element(paragraph, W_NS, "w:pPr")
+        xml.prepend(paragraph, pPr)
+    else: pPr = pPr_list[0]
+    tabs_list = xml.descendants(pPr, W_NS, "tabs")
+    for tabs in tabs_list: xml.remove(pPr, tabs)
+    w_tabs = xml.new_element(paragraph, W_NS, "w:tabs")
+    for pos in tab_positions:
+        w_tab = xml.new_element(paragraph, W_NS, "w:tab")
+        xml.set_attr(w_tab, W_NS, "w:val", "left")
+        xml.set_attr(w_tab, W_NS, "w:pos", str(pos))
+        xml.append(w_tabs, w_tab)
+    xml.append(pPr, w_tabs)
+
+def merge_paragraphs(p_dest, p_src):
+    xml = _xml_backend.get()
+    r_tab = xml.new_element(p_dest, W_NS, "w:r")
+    tab = xml.new_element(p_dest, W_NS, "w:tab")
+    xml.append(r_tab, tab)
+    xml.append(p_dest, r_tab)
+    xml.move_children(p_dest, p_src, ["pPr", "proofErr", "bookmarkStart", "bookmarkEnd"])
+    invalidate_text(p_dest)
+    invalidate_text(p_src)
+    return p_dest
+
+# Vị trí tab khi gộp 4 đáp án trên 1 dòng (4) hoặc 2 dòng (2)
+MCQ_LAYOUT_TABS = {4: [3000, 6000, 9000], 2: [6000]}
+
+def mcq_layout_mode(opt_blocks):
+    """Chọn bố cục đáp án theo độ dài đáp án dài nhất: 4 (1 dòng), 2 (2 dòng), 1 (mỗi đáp án 1 dòng)"""
+    if len(opt_blocks) != 4: return 1
+    max_len = max(len(get_text(b)) for b in opt_blocks)
+    if max_len < 20: return 4
+    elif max_len < 45: return 2
+    return 1
+
+def style_run_blue_bold(run):
+    xml = _xml_backend.get()
+    rPr_list = xml.descendants(run, W_NS, "rPr")
+    if rPr_list: rPr = rPr_list[0]
+    else:
+        rPr = xml.new_element(run, W_NS, "w:rPr")
+        xml.prepend(run, rPr)
+    color_list = xml.descendants(rPr, W_NS, "color")
+    if color_list: color_el = color_list[0]
+    else:
+        color_el = xml.new_element(run, W_NS, "w:color")
+        xml.append(rPr, color_el)
+    xml.set_attr(color_el, W_NS, "w:val", "0000FF")
+    b_list = xml.descendants(rPr, W_NS, "b")
+    if not b_list:
+        b_el = xml.new_element(run, W_NS, "w:b")
+        xml.append(rPr, b_el)
+
+def update_mcq_label(paragraph, new_label):
+    xml = _xml_backend.get()
+    t_nodes = xml.text_nodes(paragraph, W_NS)
+    if not t_nodes: return
+    invalidate_text(paragraph)
+    new_letter = new_label[0].upper()
+    for i, (t, run) in enumerate(t_nodes):
+        txt = xml.text(t)
+        if txt is None: continue
+        m = re.match(r'^(\s*)([A-D])([\.\)])?', txt, re.IGNORECASE)
+        if not m: continue
+        leading_space = m.group(1) or ""
+        old_punct = m.group(3) or ""
+        after_match = txt[m.end():]
+        xml.set_text(t, leading_space + new_letter + ("." if not old_punct else old_punct) + " " + after_match.strip())
+        if run is not None and xml.local_name(run) == "r": style_run_blue_bold(run)
+        for j in range(i + 1, len(t_nodes)):
+            t2 = t_nodes[j][0]
+            val2 = xml.text(t2)
+            if val2 is None: continue
+            if re.match(r'^[\s\.]+$', val2): xml.set_text(t2, "")
+            elif re.match(r'^\.', val2): 
+                xml.set_text(t2, val2[1:])
+                break
+            else: break
+        break
+
+def update_tf_label(paragraph, new_label):
+    xml = _xml_backend.get()
+    t_nodes = xml.text_nodes(paragraph, W_NS)
+    if not t_nodes: return
+    invalidate_text(paragraph)
+    new_letter = new_label[0].lower()
+    for i, (t, run) in enumerate(t_nodes):
+        txt = xml.text(t)
+        if txt is None: continue
+        m = re.match(r'^(\s*)([a-d])(\))?', txt, re.IGNORECASE)
+        if not m: continue
+        leading_space = m.group(1) or ""
+        after_match = txt[m.end():]
+        xml.set_text(t, leading_space + new_letter + ")" + after_match)
+        if run is not None and xml.local_name(run) == "r": style_run_blue_bold(run)
+        for j in range(i + 1, len(t_nodes)):
+            t2 = t_nodes[j][0]
+            val2 = xml.text(t2)
+            if val2 is None: continue
+            if re.match(r'^[\s\)]+$', val2): xml.set_text(t2, "")
+            elif re.match(r'^\s*\)', val2):
+                xml.set_text(t2, re.sub(r'^\s*\)', '', val2, count=1))
+                break
+            else: break
+        break
+
+def update_question_label(paragraph, new_label):
+    xml = _xml_backend.get()
+    t_nodes = xml.text_nodes(paragraph, W_NS)
+    if not t_nodes: return
+    invalidate_text(paragraph)
+    for i, (t, run) in enumerate(t_nodes):
+        txt = xml.text(t)
+        if txt is None: continue
+        m = re.match(r'^(\s*)(Câu\s*)(\d+)(\.)?', txt, re.IGNORECASE)
+        if not m: continue
+        leading_space = m.group(1) or ""
+        after_match = txt[m.end():]
+        xml.set_text(t, leading_space + new_label + after_match)
+        if run is not None and xml.local_name(run) == "r": style_run_blue_bold(run)
+        for j in range(i + 1, len(t_nodes)):
+            t2 = t_nodes[j][0]
+            val2 = xml.text(t2)
+            if val2 is None: continue
+            if re.match(r'^[\s0-9\.]*$', val2): xml.set_text(t2, "")
+            else: break
+        break
+
+# --- BLOCK CLASSIFIER: NHẬN DIỆN MỖI BLOCK 1 LẦN ---
+# Mọi regex được biên dịch sẵn; classify_blocks() duyệt block 1 lượt và gắn nhãn (tag).
+# Tìm PHẦN, tách câu/nhóm, nhận diện đáp án, kiểm tra cấu trúc đều đọc tag thay vì chạy lại regex.
+
+PART_HEADER_RE = re.compile(r'PHẦN\s*(\d+)\b', re.IGNORECASE)
+QUESTION_RE = re.compile(r'^Câu\s*\d+\b', re.IGNORECASE)
+MCQ_OPTION_RE = re.compile(r'^\s*([A-D])[\.\)]', re.IGNORECASE)
+TF_OPTION_RE = re.compile(r'^\s*([a-d])\)', re.IGNORECASE)
+ANSWER_LINE_RE = re.compile(r'^\s*(?:Đáp án|DA|Lời giải|HD|Hướng dẫn)\s*[:\.]?\s*(.*)', re.IGNORECASE)
+CLUSTER_START = "@BẮT ĐẦU DÙNG CHUNG@"
+CLUSTER_END = "@KẾT THÚC DÙNG CHUNG@"
+
+def classify_block(block, styles=None):
+    """Gắn nhãn 1 block. kind là vai trò chính; các cờ riêng vẫn giữ đủ vì 1 dòng có thể khớp nhiều
+    mẫu (vd "a)" vừa là đáp án trắc nghiệm vừa là ý đúng/sai, tuỳ phần đang xét).
+    correct: dòng đáp án có đánh dấu đúng không, tính 1 lần ở đây rồi dùng lại khi kiểm tra và phân tích."""
+    text = get_text(block)
+    upper = text.upper()
+    mcq = MCQ_OPTION_RE.match(text)
+    tf = TF_OPTION_RE.match(text)
+    answer = ANSWER_LINE_RE.match(text)
+    tag = {
+        "text": text,
+        "parts": tuple(int(n) for n in PART_HEADER_RE.findall(text)),
+        "question": QUESTION_RE.match(text) is not None,
+        "cluster_start": CLUSTER_START in upper,
+        "cluster_end": CLUSTER_END in upper,
+        "mcq": mcq.group(1).upper() if mcq else None,
+        "tf": tf.group(1).lower() if tf else None,
+        "answer": answer.group(1).strip() if answer else None,
+    }
+    tag["correct"] = bool(tag["mcq"] or tag["tf"]) and is_correct_option(block, styles)
+    if tag["cluster_start"]: tag["kind"] = "cluster_start"
+    elif tag["cluster_end"]: tag["kind"] = "cluster_end"
+    elif tag["question"]: tag["kind"] = "question"
+    elif tag["parts"]: tag["kind"] = "part"
+    elif tag["mcq"]: tag["kind"] = "mcq_option"
+    elif tag["tf"]: tag["kind"] = "tf_option"
+    elif tag["answer"] is not None: tag["kind"] = "answer"
+    else: tag["kind"] = "content"
+    return tag
+
+def classify_blocks(blocks, styles=None):
+    return [classify_block(b, styles) for b in blocks]
+
+def find_part_index(tags, part_number):
+    for i, tag in enumerate(tags):
+        if part_number in tag["parts"]: return i
+    return -1
+
+def split_sections(tags, shuffle_mode="auto"):
+    """Chia đề theo các dòng "PHẦN n": list các đoạn ("static", [chỉ số block]) giữ nguyên vị trí
+    hoặc ("part", start, end, part_type, key_name) là 1 phần cần trộn (block [start, end)).
+    Không có dòng "PHẦN" nào (hoặc chọn trộn cả đề 1 kiểu) thì cả đề là 1 phần."""
+    n = len(tags)
+    p1 = find_part_index(tags, 1)
+    p2 = find_part_index(tags, 2)
+    p3 = find_part_index(tags, 3)
+    if shuffle_mode != "auto" or (p1 == -1 and p2 == -1 and p3 == -1):
+        p_type = "PHAN1" if shuffle_mode == "mcq" or shuffle_mode == "auto" else "PHAN2"
+        key_name = 'MCQ_ALL' if p_type == "PHAN1" else 'TF_ALL'
+        return [("part", 0, n, p_type, key_name)]
+    sections = []
+    if p1 >= 0:
+        sections.append(("static", list(range(0, p1 + 1))))
+        sections.append(("part", p1 + 1, p2 if p2 >= 0 else n, "PHAN1", "PHAN1"))
+    if p2 >= 0:
+        sections.append(("static", [p2]))
+        sections.append(("part", p2 + 1, p3 if p3 >= 0 else n, "PHAN2", "PHAN2"))
+    if p3 >= 0:
+        sections.append(("static", [p3]))
+        sections.append(("part", p3 + 1, n, "PHAN3", "PHAN3"))
+    return sections
+
+def parse_questions_in_range(tags, start, end):
+    """Chia các block [start, end) thành phần mở đầu + câu hỏi/nhóm câu (trả về chỉ số block)"""
+    items = [] 
+    intro = []
+    i = start
+    while i < end:
+        if tags[i]["question"] or tags[i]["cluster_start"]: break
+        intro.append(i)
+        i += 1
+    while i < end:
+        tag = tags[i]
+        if tag["cluster_start"]:
+            cluster_header = []
+            cluster_questions = []
+            i += 1 
+            while i < end:
+                if tags[i]["cluster_end"]:
+                    i += 1 
+                    break
+                if tags[i]["question"]:
+                    one_q = [i]
+                    i += 1
+                    while i < end:
+                        if tags[i]["cluster_end"] or tags[i]["question"]: break
+                        one_q.append(i)
+                        i += 1
+                    cluster_questions.append(one_q)
+                else:
+                    if cluster_questions: cluster_questions[-1].append(i)
+                    else: cluster_header.append(i)
+                    i += 1
+            items.append({"type": "cluster", "header": cluster_header, "questions": cluster_questions})
+            continue
+        if tag["question"]:
+            group = [i]
+            i += 1
+            # Dòng "PHẦN n" lọt vào giữa phần vẫn thuộc câu đang xét, nên chỉ dừng ở câu/nhóm mới
+            while i < end:
+                if tags[i]["question"] or tags[i]["cluster_start"]: break
+                group.append(i)
+                i += 1
+            items.append({"type": "question", "blocks": group})
+        else:
+            if items and items[-1]["type"] == "question": items[-1]["blocks"].append(i)
+            elif not items: intro.append(i)
+            i += 1
+    return intro, items
+
+# --- NEW: VALIDATION FUNCTION WITH AUTO-FIX ---
+def check_exam_structure(file_bytes, xml_backend=None, shuffle_mode="auto"):
+    """Kiểm tra cấu trúc mọi phần của đề trước khi trộn (có tự động tách dòng đáp án dính liền), không dựng model.
+    Trả về (hợp lệ?, list lỗi dạng dict, xem validation.py)."""
+    input_buffer = io.BytesIO(file_bytes)
+    
+    try:
+        with zipfile.ZipFile(input_buffer, 'r') as zin, xml_backend_scope(xml_backend) as xml, text_cache_scope():
+            doc = xml.parse(read_document_bytes(open_document_xml(zin)))
+            styles = load_styles(zin)
+            
+            # 1. AUTO FIX: Tách các đáp án dính liền
+            fixed_cnt = fix_merged_options(doc)
+            
+            body = xml.body(doc)
+            blocks = []
+            for child in xml.children(body):
+                if xml.local_name(child) in ["p", "tbl"]:
+                    blocks.append(child)
+            tags = classify_blocks(blocks, styles)
+            return validate_sections(tags, analyze_sections(blocks, tags, shuffle_mode), fixed_cnt)
+    except Exception as e:
+        return False, [diagnostic("read_error", error=str(e))]
+
+# --- HELPER FUNCTIONS FOR WORD XML GENERATION ---
+def create_header_xml(doc, info):
+    so_gd = escape_xml(info.get("so_gd", "").upper())
+    truong = escape_xml(info.get("truong", ""))
+    ky_thi = escape_xml(info.get("ky_thi", "").upper())
+    mon_thi = escape_xml(info.get("mon_thi", "").upper())
+    thoi_gian = escape_xml(info.get("thoi_gian", ""))
+    nam_hoc = escape_xml(info.get("nam_hoc", ""))
+    xml_str = f"""
+    <w:tbl xmlns:w="{W_NS}">
+        <w:tblPr>
+            <w:tblW w:w="0" w:type="auto"/>
+            <w:jc w:val="center"/>
+            <w:tblBorders>
+                <w:top w:val="none" w:sz="0" w:space="0" w:color="auto"/>
+                <w:left w:val="none" w:sz="0" w:space="0" w:color="auto"/>
+                <w:bottom w:val="none" w:sz="0" w:space="0" w:color="auto"/>
+                <w:right w:val="none" w:sz="0" w:space="0" w:color="auto"/>
+                <w:insideH w:val="none" w:sz="0" w:space="0" w:color="auto"/>
+                <w:insideV w:val="none" w:sz="0" w:space="0" w:color="auto"/>
+            </w:tblBorders>
+        </w:tblPr>
+        <w:tr>
+            <w:tc>
+                <w:tcPr><w:tcW w:w="4500" w:type="dxa"/></w:tcPr>
+                <w:p>
+                    <w:pPr><w:jc w:val="center"/></w:pPr>
+                    <w:r><w:rPr><w:b/></w:rPr><w:t>{so_gd}</w:t></w:r>
+                </w:p>
+                <w:p>
+                    <w:pPr><w:jc w:val="center"/></w:pPr>
+                    <w:r><w:rPr><w:b/></w:rPr><w:t>{truong}</w:t></w:r>
+                </w:p>
+                <w:p>
+                    <w:pPr><w:jc w:val="center"/></w:pPr>
+                    <w:r><w:t>------------------</w:t></w:r>
+                </w:p>
+            </w:tc>
+            <w:tc>
+                <w:tcPr><w:tcW w:w="4500" w:type="dxa"/></w:tcPr>
+                <w:p>
+                    <w:pPr><w:jc w:val="center"/></w:pPr>
+                    <w:r><w:rPr><w:b/></w:rPr><w:t>{ky_thi}</w:t></w:r>
+                </w:p>
+                <w:p>
+                    <w:pPr><w:jc w:val="center"/></w:pPr>
+                    <w:r><w:rPr><w:b/></w:rPr><w:t>MÔN: {mon_thi}</w:t></w:r>
+                </w:p>
+                <w:p>
+                    <w:pPr><w:jc w:val="center"/></w:pPr>
+                    <w:r><w:t>Thời gian làm bài: {thoi_gian}</w:t></w:r>
+                </w:p>
+                 <w:p>
+                    <w:pPr><w:jc w:val="center"/></w:pPr>
+                    <w:r><w:t>(Năm học: {nam_hoc})</w:t></w:r>
+                </w:p>
+            </w:tc>
+        </w:tr>
+    </w:tbl>
+    """
+    return minidom.parseString(xml_str).documentElement
+
+def create_footer_xml_content(ma_de):
+    xml_str = f"""
+    <w:ftr xmlns:w="{W_NS}">
+        <w:p>
+            <w:pPr>
+                <w:pStyle w:val="Footer"/>
+                <w:jc w:val="right"/>
+                <w:pBdr>
+                    <w:top w:val="single" w:sz="6" w:space="1" w:color="auto"/>
+                </w:pBdr>
+            </w:pPr>
+            <w:r>
+                <w:t xml:space="preserve">Mã đề {ma_de} - Trang </w:t>
+            </w:r>
+            <w:fldSimple w:instr="PAGE"/>
+        </w:p>
+    </w:ftr>
+    """
+    return xml_str.strip()
+
+def shuffle_mcq_options(question, perm=None):
+    """Áp hoán vị đáp án A-D (vị trí mới -> vị trí cũ, None: giữ nguyên) cho 1 câu đã phân tích sẵn,
+    trả về vị trí block mới + đáp án đúng"""
+    positions = list(range(len(question["blocks"])))
+    indices = question["options"]
+    if len(indices) < 2: return positions, ""
+    if perm is None: perm = range(len(indices))
+    shuffled_options = [indices[p] for p in perm]
+    new_correct_char = ""
+    if question["correct"] != -1:
+        for new_pos, old_pos in enumerate(perm):
+            if old_pos == question["correct"]:
+                letters = ["A", "B", "C", "D", "E", "F"]
+                if new_pos < len(letters): new_correct_char = letters[new_pos]
+                break
+    min_idx, max_idx = min(indices), max(indices)
+    before = positions[:min_idx]
+    after = positions[max_idx + 1:]
+    return before + shuffled_options + after, new_correct_char
+
+def shuffle_tf_options(question, perm=None):
+    """Áp hoán vị ý a, b, c (giữ ý d; None: giữ nguyên) cho 1 câu đúng/sai, trả về vị trí block mới + key Đ/S"""
+    positions = list(range(len(question["blocks"])))
+    option_indices = question["tf_options"]
+    abc_idx = [option_indices.get(k) for k in ["a", "b", "c"] if option_indices.get(k) is not None]
+    if len(abc_idx) < 2: return positions, ["", "", "", ""]
+    shuffled_abc = [abc_idx[p] for p in perm] if perm is not None else abc_idx.copy()
+    all_vals = [v for v in option_indices.values() if v is not None]
+    min_idx, max_idx = min(all_vals), max(all_vals)
+    before = positions[:min_idx]
+    after = positions[max_idx + 1:]
+    middle = shuffled_abc.copy()
+    if "d" in option_indices: middle.append(option_indices["d"])
+    current_key_status = []
+    for pos in middle:
+        status = "D" if question["tf_correct"][pos] else "S"
+        current_key_status.append(status)
+    return before + middle + after, current_key_status
+
+def process_single_question_logic(question, part_type, perm=None):
+    key = ""
+    if part_type == "PHAN1":
+        positions, key = shuffle_mcq_options(question, perm)
+    elif part_type == "PHAN2":
+        positions, key = shuffle_tf_options(question, perm)
+    elif part_type == "PHAN3":
+        positions, key = question["clean"], question["key"]
+    else:
+        positions = list(range(len(question["blocks"])))
+    return [question["blocks"][p] for p in positions], key
+
+# --- EXAM MODEL: PHÂN TÍCH ĐỀ GỐC 1 LẦN, SINH NHIỀU MÃ ĐỀ ---
+
+def analyze_question(q_indices, part_type, blocks, tags):
+    """Tiền xử lý 1 câu hỏi: vị trí đáp án, đáp án đúng, lời giải (chỉ chạy 1 lần cho mỗi file)"""
+    question = {"blocks": list(q_indices), "relabel": [], "layout": 1}
+    q_tags = [tags[idx] for idx in q_indices]
+    if part_type == "PHAN1":
+        options = []
+        correct = -1
+        for i, tag in enumerate(q_tags):
+            if tag["mcq"]:
+                if correct == -1 and tag["correct"]: correct = len(options)
+                options.append(i)
+        question["options"] = options
+        question["correct"] = correct
+        question["relabel"] = [question["blocks"][i] for i in options]
+    elif part_type == "PHAN2":
+        option_indices = {}
+        for i, tag in enumerate(q_tags):
+            if tag["tf"]:
+                option_indices[tag["tf"]] = i
+                question["relabel"].append(question["blocks"][i])
+        question["tf_options"] = option_indices
+        question["tf_correct"] = {i: q_tags[i]["correct"] for i in option_indices.values()}
+    elif part_type == "PHAN3":
+        question["clean"], question["key"] = extract_short_answer_key(q_tags)
+    return question
+
+def analyze_part(blocks, tags, start, end, part_type, key_name):
+    intro, items = parse_questions_in_range(tags, start, end)
+    part = {"type": "part", "part_type": part_type, "key_name": key_name, "start": start, "end": end, "intro": intro,
+            "items": []}
+    for item in items:
+        if item["type"] == "question":
+            part["items"].append({"type": "question", "question": analyze_question(item["blocks"], part_type, blocks, tags)})
+        elif item["type"] == "cluster":
+            part["items"].append({
+                "type": "cluster",
+                "header": item["header"],
+                "questions": [analyze_question(q, part_type, blocks, tags) for q in item["questions"]]
+            })
+    return part
+
+def analyze_sections(blocks, tags, shuffle_mode="auto"):
+    """Các đoạn của đề theo split_sections: {"type": "static", "blocks"} hoặc phần đã phân tích (analyze_part)"""
+    sections = []
+    for section in split_sections(tags, shuffle_mode):
+        if section[0] == "static": sections.append({"type": "static", "blocks": section[1]})
+        else: sections.append(analyze_part(blocks, tags, *section[1:]))
+    return sections
+
+def iter_model_questions(model):
+    for section in model["sections"]:
+        if section["type"] != "part": continue
+        for item in section["items"]:
+            if item["type"] == "question": yield section["part_type"], item["question"]
+            else:
+                for q in item["questions"]: yield section["part_type"], q
+
+# --- FRAGMENT SERIALIZER: MỖI BLOCK CHỈ SERIALIZE 1 LẦN ---
+# Block cần đổi nhãn được relabel 1 lần bằng ký tự giữ chỗ (sentinel) rồi serialize,
+# sau đó cắt tại sentinel: mỗi mã đề chỉ việc nối các mảnh bytes và điền nhãn mới.
+
+FOOTER_REL_ID = "rIdFooterNew"
+FOOTER_PART_NAME = "word/footer_new.xml"
+
+def patch_content_types(xml_bytes):
+    """Khai báo content type cho footer mã đề (chạy 1 lần cho mỗi file tải lên)"""
+    ct_dom = minidom.parseString(xml_bytes.decode('utf-8'))
+    types = ct_dom.getElementsByTagName("Types")[0]
+    for ov in types.getElementsByTagName("Override"):
+        if ov.getAttribute("PartName") == "/" + FOOTER_PART_NAME: return xml_bytes
+    ov = ct_dom.createElement("Override")
+    ov.setAttribute("PartName", "/" + FOOTER_PART_NAME)
+    ov.setAttribute("ContentType", "application/vnd.openxmlformats-officedocument.wordprocessingml.footer+xml")
+    types.appendChild(ov)
+    return ct_dom.toxml().encode('utf-8')
+
+def patch_document_rels(xml_bytes):
+    """Thêm relationship tới footer mã đề (chạy 1 lần cho mỗi file tải lên)"""
+    rels_dom = minidom.parseString(xml_bytes.decode('utf-8'))
+    relationships = rels_dom.getElementsByTagName("Relationships")[0]
+    for rel in relationships.getElementsByTagName("Relationship"):
+        if rel.getAttribute("Id") == FOOTER_REL_ID: return xml_bytes
+    rel = rels_dom.createElement("Relationship")
+    rel.setAttribute("Id", FOOTER_REL_ID)
+    rel.setAttribute("Type", "http://schemas.openxmlformats.org/officeDocument/2006/relationships/footer")
+    rel.setAttribute("Target", "footer_new.xml")
+    relationships.appendChild(rel)
+    return rels_dom.toxml().encode('utf-8')
+
+def pick_sentinel(text):
+    for code in range(0xE000, 0xF900):
+        ch = chr(code)
+        if ch not in text: return ch
+    raise ValueError("Không tìm được ký tự giữ chỗ cho nhãn")
+
+def split_template(xml_str, sentinel):
+    return [part.encode('utf-8') for part in xml_str.split(sentinel)]
+
+def fill_template(parts, label):
+    return label.encode('utf-8').join(parts)
+
+def build_label_templates(model, doc, blocks, sentinel):
+    """Tạo template nhãn câu ("Câu n."), nhãn đáp án và template gộp dòng đáp án cho từng block"""
+    xml = _xml_backend.get()
+    templates = {}
+    rows = {}
+    for part_type, question in iter_model_questions(model):
+        head = xml.clone(blocks[question["blocks"][0]])
+        update_question_label(head, sentinel)
+        templates[question["blocks"][0]] = split_template(xml.to_xml(doc, head), sentinel)
+
+        relabeled = []
+        for idx in question["relabel"]:
+            opt = xml.clone(blocks[idx])
+            if part_type == "PHAN1": update_mcq_label(opt, sentinel + ".")
+            else: update_tf_label(opt, sentinel + ")")
+            templates[idx] = split_template(xml.to_xml(doc, opt), sentinel)
+            relabeled.append((idx, opt))
+
+        if part_type != "PHAN1": continue
+        question["layout"] = mcq_layout_mode([opt for _, opt in relabeled])
+        if question["layout"] == 1: continue
+        # Dòng gộp = phần đầu của đáp án đứng đầu (kèm tab) + phần thân của các đáp án sau + thẻ đóng
+        for idx, opt in relabeled:
+            root = xml.clone(opt)
+            set_paragraph_tabs(root, MCQ_LAYOUT_TABS[question["layout"]])
+            root_xml = xml.to_xml(doc, root)
+            close_at = root_xml.rindex("</")
+            tail_holder = xml.new_element(opt, W_NS, "w:p")
+            merge_paragraphs(tail_holder, opt)
+            tail_xml = xml.to_xml(doc, tail_holder)
+            rows[idx] = (
+                split_template(root_xml[:close_at], sentinel),
+                split_template(tail_xml[tail_xml.index(">") + 1:tail_xml.rindex("</")], sentinel),
+                root_xml[close_at:].encode('utf-8'),
+            )
+    return templates, rows
+
+def build_body_tail(doc, other_nodes):
+    """Serialize các node cuối body (sectPr...) 1 lần, gắn footer mã đề vào sectPr cuối cùng"""
+    xml = _xml_backend.get()
+    sectPr = None
+    for node in other_nodes:
+        if xml.local_name(node) == "sectPr" and xml.namespace(node) == W_NS: sectPr = node
+    tail = []
+    if sectPr is None:
+        sectPr = xml.new_element(doc, W_NS, "w:sectPr")
+        other_nodes = other_nodes + [sectPr]
+    for node in other_nodes:
+        if node is not sectPr:
+            tail.append(xml.to_xml(doc, node))
+            continue
+        sect = xml.clone(node)
+        for child in xml.children(sect):
+            if xml.local_name(child) == "footerReference": xml.remove(sect, child)
+        # footerReference phải đứng cùng nhóm headerReference, trước pgSz/pgMar...
+        insert_before = None
+        for child in xml.children(sect):
+            if xml.local_name(child) != "headerReference":
+                insert_before = child
+                break
+        fr = xml.new_element(doc, W_NS, "w:footerReference")
+        xml.set_attr(fr, W_NS, "w:type", "default")
+        xml.set_attr(fr, R_NS, "r:id", FOOTER_REL_ID)
+        xml.insert_before(sect, fr, insert_before)
+        tail.append(xml.to_xml(doc, sect))
+    return "".join(tail).encode('utf-8')
+
+def build_exam_model(file_bytes, shuffle_mode="auto", xml_backend=None, streaming=None):
+    """Đọc + phân tích đề gốc MỘT lần (unzip, parse XML, tách đáp án dính, chia phần/câu/nhóm)
+    và serialize sẵn từng block. Mỗi mã đề sau đó chỉ áp hoán vị lên model này (xem render_variant).
+    xml_backend: "etree" (mặc định) hoặc "minidom", cho ra cùng model.
+    streaming: đọc document.xml kiểu streaming (None: tự bật khi file lớn, chỉ với etree; True với minidom thì báo lỗi)."""
+    with xml_backend_scope(xml_backend) as xml, text_cache_scope() as text_cache, stage("build_exam_model", len(file_bytes)):
+        model = analyze_exam(file_bytes, shuffle_mode, streaming)
+    model["xml_backend"] = xml.NAME
+    model["text_cache"] = text_cache_stats(text_cache)
+    return model
+
+MEDIA_RE = re.compile(rb'<(w:drawing|w:pict|w:object|m:oMath)\b')
+
+def block_media_index(fragments):
+    """{chỉ số block: (loại ảnh/công thức có trong block, theo thứ tự gặp đầu tiên)}, chỉ các block có"""
+    index = {}
+    for i, fragment in enumerate(fragments):
+        found = MEDIA_RE.findall(fragment)
+        if found: index[i] = tuple(dict.fromkeys(name.decode() for name in found))
+    return index
+
+def model_nbytes(model):
+    """Ước lượng dung lượng bộ nhớ của model (để giới hạn cache)"""
+    size = len(model["package"]["source"]) + len(model["doc_head"]) + len(model["doc_tail"]) + len(model["body_tail"])
+    size += sum(len(m["raw"]) for m in model["package"]["members"] if "raw" in m)
+    size += sum(len(f) for f in model["fragments"])
+    size += sum(len(t) for t in model["texts"]) + 64 * len(model["media"])
+    size += sum(len(p) for parts in model["templates"].values() for p in parts)
+    for head, tail, close in model["rows"].values():
+        size += sum(len(p) for p in head) + sum(len(p) for p in tail) + len(close)
+    return size
+
+# --- ĐỌC document.xml: CẢ CÂY (DOM) HOẶC STREAMING ---
+# Mặc định document.xml được parse cả cây. File lớn (vd ngân hàng câu hỏi vài trăm trang) được đọc kiểu streaming:
+# giải nén dần từ zip, mỗi block (w:p/w:tbl con của body) đọc xong thì tách đáp án dính, gắn nhãn, serialize
+# thành mảnh bytes rồi bỏ cây; chỉ block cần đổi nhãn (dòng "Câu n.", dòng đáp án) mới được dựng lại cây từ mảnh
+# khi làm template, lần lượt từng block. Bộ nhớ theo block lớn nhất thay vì cả tài liệu. Cả 2 cách cho cùng model.
+# Giới hạn dung lượng document.xml / số block được kiểm tra ngay trong lúc giải nén, không tin kích thước ghi trong zip.
+
+DOCUMENT_PART_NAME = "word/document.xml"
+STREAMING_THRESHOLD = 8 * 1024 * 1024
+MAX_DOCUMENT_XML_BYTES = 256 * 1024 * 1024
+MAX_BODY_BLOCKS = 200_000
+READ_CHUNK_SIZE = 64 * 1024
+# Ký tự vùng riêng U+E000-U+F8FF (dùng làm sentinel) dạng UTF-8
+PRIVATE_USE_RE = re.compile(rb'\xee[\x80-\xbf][\x80-\xbf]|\xef[\x80-\xa3][\x80-\xbf]')
+
+def document_too_large(limit):
+    return ValueError(f"File Word quá lớn: nội dung (document.xml) vượt {limit // (1024 * 1024)} MB")
+
+class LimitedReader:
+    """Luồng đọc document.xml từ zip cho parser: đếm dung lượng đã giải nén (vượt limit thì báo lỗi ngay)
+    và ghi lại các ký tự vùng riêng gặp trong tài liệu (để chọn sentinel mà không phải decode cả file)"""
+
+    def __init__(self, raw, limit=None):
+        self.raw = raw
+        self.limit = MAX_DOCUMENT_XML_BYTES if limit is None else limit
+        self.size = 0
+        self.private_chars = set()
+        self._carry = b""
+
+    def read(self, n=-1):
+        data = self.raw.read(n)
+        self.size += len(data)
+        if self.size > self.limit: raise document_too_large(self.limit)
+        chunk = self._carry + data
+        for m in PRIVATE_USE_RE.finditer(chunk): self.private_chars.add(m.group().decode('utf-8'))
+        self._carry = chunk[-2:]
+        return data
+
+def open_document_xml(zin, limit=None):
+    if limit is None: limit = MAX_DOCUMENT_XML_BYTES
+    info = zin.getinfo(DOCUMENT_PART_NAME)
+    if info.file_size > limit: raise document_too_large(limit)
+    return LimitedReader(zin.open(info), limit)
+
+def read_document_bytes(reader):
+    """Đọc hết document.xml qua LimitedReader theo từng đoạn (vượt giới hạn thì dừng ngay)"""
+    return b"".join(iter(lambda: reader.read(READ_CHUNK_SIZE), b""))
+
+def check_block_count(count):
+    if count > MAX_BODY_BLOCKS:
+        raise ValueError(f"File Word quá lớn: hơn {MAX_BODY_BLOCKS} đoạn văn / bảng")
+
+def read_document(zin, styles):
+    """Parse cả cây document.xml, tách đáp án dính, gắn nhãn + serialize mọi block"""
+    xml = _xml_backend.get()
+    with stage("read_xml"):
+        reader = open_document_xml(zin)
+        doc_bytes = read_document_bytes(reader)
+    with stage("xml_parse", len(doc_bytes)):
+        doc = xml.parse(doc_bytes)
+    del doc_bytes
+    with stage("fix_merged_options"):
+        fixed_count = fix_merged_options(doc)
+
+    with stage("detect_parts"):
+        body = xml.body(doc)
+        blocks = []
+        other_nodes = []
+        for child in xml.children(body):
+            if xml.local_name(child) in ["p", "tbl"]: blocks.append(child)
+            else: other_nodes.append(child)
+        check_block_count(len(blocks))
+        xml.clear_children(body)
+        tags = classify_blocks(blocks, styles)
+    with stage("serialize"):
+        fragments = [xml.to_xml(doc, b).encode('utf-8') for b in blocks]
+    return {"doc": doc, "blocks": blocks, "tags": tags, "fragments": fragments, "other_nodes": other_nodes,
+            "fixed_count": fixed_count, "xml_bytes": reader.size, "private_chars": reader.private_chars}
+
+class FragmentBlocks:
+    """Thay cho list block ở chế độ streaming: blocks[i] dựng lại cây của block i từ mảnh XML (mỗi lần lấy 1 cây mới)"""
+
+    def __init__(self, doc, fragments):
+        self.doc = doc
+        self.fragments = fragments
+
+    def __len__(self):
+        return len(self.fragments)
+
+    def __getitem__(self, i):
+        return _xml_backend.get().parse_fragment(self.doc, self.fragments[i])
+
+def read_document_streaming(zin, styles):
+    """Như read_document nhưng đọc document.xml kiểu streaming (cần backend có iter_parse), không giữ cây của block"""
+    xml = _xml_backend.get()
+    tags = []
+    fragments = []
+    other_nodes = []
+    fixed_count = 0
+    with stage("stream_parse"), text_cache_disabled():
+        reader = open_document_xml(zin)
+        nodes = xml.iter_parse(reader)
+        doc = next(nodes)
+        for node in nodes:
+            if xml.local_name(node) not in ("p", "tbl"):
+                other_nodes.append(node)
+                continue
+            split = split_merged_option(node)
+            fixed_count += len(split)
+            for block in [node] + split:
+                tags.append(classify_block(block, styles))
+                fragments.append(xml.to_xml(doc, block).encode('utf-8'))
+            check_block_count(len(tags))
+        xml.clear_children(xml.body(doc))
+    add_bytes("stream_parse", reader.size)
+    return {"doc": doc, "blocks": FragmentBlocks(doc, fragments), "tags": tags, "fragments": fragments,
+            "other_nodes": other_nodes, "fixed_count": fixed_count, "xml_bytes": reader.size,
+            "private_chars": reader.private_chars}
+
+def analyze_exam(file_bytes, shuffle_mode, streaming=None):
+    """streaming: None = tự chọn theo dung lượng document.xml (chỉ khi backend có iter_parse), True/False = bắt buộc /
+    không; bắt buộc streaming với backend không hỗ trợ (minidom) thì báo lỗi. Cả 2 cách đều đọc document.xml qua
+    LimitedReader nên giới hạn MAX_DOCUMENT_XML_BYTES áp dụng với mọi backend."""
+    xml = _xml_backend.get()
+    can_stream = hasattr(xml, "iter_parse")
+    if streaming and not can_stream:
+        raise ValueError(f"Backend XML '{xml.NAME}' không hỗ trợ đọc streaming, dùng backend 'etree'")
+    with stage("unzip", len(file_bytes)):
+        zin = zipfile.ZipFile(io.BytesIO(file_bytes), 'r')
+        styles = load_styles(zin)
+    if streaming is None: streaming = can_stream and zin.getinfo(DOCUMENT_PART_NAME).file_size > STREAMING_THRESHOLD
+    with zin:
+        if streaming: document = read_document_streaming(zin, styles)
+        else: document = read_document(zin, styles)
+    doc, blocks, tags = document["doc"], document["blocks"], document["tags"]
+    fixed_count = document["fixed_count"]
+
+    with stage("parse_questions"):
+        sections = analyze_sections(blocks, tags, shuffle_mode)
+
+    with stage("package_template", len(file_bytes)):
+        package = build_package_template(
+            file_bytes,
+            patches={"[Content_Types].xml": patch_content_types, "word/_rels/document.xml.rels": patch_document_rels},
+            variable_parts=[DOCUMENT_PART_NAME],
+            new_parts=[FOOTER_PART_NAME],
+        )
+    with stage("validate"):
+        validation = validate_sections(tags, sections, fixed_count)
+    model = {
+        "package": package,
+        "shuffle_mode": shuffle_mode,
+        "source_hash": content_hash(file_bytes),
+        "sections": sections,
+        "fixed_count": fixed_count,
+        "validation": validation,
+        "fragments": document["fragments"],
+    }
+
+    sentinel = pick_sentinel(document["private_chars"])
+    with stage("serialize"):
+        body = xml.body(doc)
+        xml.append_text(body, sentinel)
+        model["doc_head"], model["doc_tail"] = split_template(xml.doc_to_xml(doc), sentinel)
+        model["body_tail"] = build_body_tail(doc, document["other_nodes"])
+    add_bytes("serialize", sum(map(len, model["fragments"])) + len(model["doc_head"]) + len(model["doc_tail"]) + len(model["body_tail"]))
+    # Chữ + ảnh/công thức của từng block cho bản xem trước HTML (preview.py): lấy sẵn lúc phân tích,
+    # xem trước chỉ còn ghép chuỗi
+    with stage("preview_index"):
+        model["texts"] = [tag["text"] for tag in tags]
+        model["media"] = block_media_index(model["fragments"])
+    # Template nhãn câu / nhãn đáp án + dòng gộp đáp án theo bố cục 1/2/4 cột, làm 1 lần cho mọi mã đề
+    with stage("label_templates"), (text_cache_disabled() if streaming else contextlib.nullcontext()):
+        model["templates"], model["rows"] = build_label_templates(model, doc, blocks, sentinel)
+    note(file_bytes=len(file_bytes), document_xml_bytes=document["xml_bytes"], package_parts=len(package["members"]),
+         blocks=len(tags), questions=sum(1 for _ in iter_model_questions(model)), merged_options_fixed=fixed_count,
+         streaming=isinstance(blocks, FragmentBlocks))
+    # Từ đây model chỉ còn bytes + chỉ số, không giữ DOM
+    return model
+
+def render_question(model, question, q_indices, number, part_type):
+    """Ghép các mảnh XML của 1 câu: điền nhãn "Câu n.", nhãn đáp án và gộp dòng theo bố cục"""
+    templates = model["templates"]
+    fragments = model["fragments"]
+    out = [fill_template(templates[q_indices[0]], f"Câu {number}.")]
+    rest = q_indices[1:]
+    relabel = set(question["relabel"])
+    if part_type == "PHAN1": letters = ["A", "B", "C", "D"]
+    elif part_type == "PHAN2": letters = ["a", "b", "c", "d"]
+    else: letters = []
+    opts = [i for i in rest if i in relabel] if letters else []
+
+    if question["layout"] == 1 or len(opts) != 4:
+        count = 0
+        for idx in rest:
+            if idx in relabel and letters:
+                out.append(fill_template(templates[idx], letters[count] if count < 4 else letters[-1]))
+                count += 1
+            else: out.append(fragments[idx])
+        return out
+
+    first, last = rest.index(opts[0]), rest.index(opts[-1])
+    out.extend(fragments[idx] for idx in rest[:first])
+    row_groups = [opts] if question["layout"] == 4 else [opts[:2], opts[2:]]
+    count = 0
+    for group in row_groups:
+        head_parts, _, close_tag = model["rows"][group[0]]
+        out.append(fill_template(head_parts, letters[count]))
+        count += 1
+        for idx in group[1:]:
+            out.append(fill_template(model["rows"][idx][1], letters[count]))
+            count += 1
+        out.append(close_tag)
+    out.extend(fragments[idx] for idx in rest[last + 1:])
+    return out
+
+def shuffle_part(part, global_q_idx_start, plan):
+    """Áp kế hoạch hoán vị của 1 phần (xem permutations.plan_batch): đáp án trong câu, câu trong nhóm,
+    vị trí câu/nhóm; trả về danh sách câu/nhóm theo thứ tự mới (kèm đáp án + số thứ tự gốc trong phần)"""
+    processed_items = []
+    current_q_counter = global_q_idx_start
+    part_type = part["part_type"]
+    option_perms = iter(plan["options"])
+
+    for i, item in enumerate(part["items"]):
+        if item["type"] == "question":
+            q_idx = current_q_counter + 1
+            new_q, key = process_single_question_logic(item["question"], part_type, next(option_perms))
+            processed_items.append({"type": "question", "questions": [(item["question"], new_q)], "keys": [key],
+                                    "origins": [q_idx - global_q_idx_start]})
+            current_q_counter += 1
+        elif item["type"] == "cluster":
+            sub_items_data = []
+            for sub_q in item["questions"]:
+                q_idx = current_q_counter + 1
+                new_q, key = process_single_question_logic(sub_q, part_type, next(option_perms))
+                sub_items_data.append((sub_q, new_q, key, q_idx - global_q_idx_start))
+                current_q_counter += 1
+            if i in plan["sub"]: sub_items_data = [sub_items_data[j] for j in plan["sub"][i]]
+            processed_items.append({
+                "type": "cluster",
+                "header": item["header"],
+                "questions": [(sq, nq) for sq, nq, k, o in sub_items_data],
+                "keys": [k for sq, nq, k, o in sub_items_data],
+                "origins": [o for sq, nq, k, o in sub_items_data],
+            })
+
+    return [processed_items[i] for i in plan["order"]]
+
+def render_part(part, final_item_list, model):
+    """Ghép các mảnh XML của 1 phần theo thứ tự đã trộn, đánh lại số câu + nhãn đáp án"""
+    part_type = part["part_type"]
+    final_pieces = [model["fragments"][i] for i in part["intro"]]
+    final_keys = []
+    final_order = []
+    q_counter = 0
+    for item in final_item_list:
+        final_keys.extend(item["keys"])
+        final_order.extend(item["origins"])
+        if item["type"] == "cluster":
+            final_pieces.extend(model["fragments"][i] for i in item["header"])
+        for question, q_indices in item["questions"]:
+            if not q_indices: continue
+            q_counter += 1
+            final_pieces.extend(render_question(model, question, q_indices, q_counter, part_type))
+    return final_pieces, final_keys, final_order
+
+def process_part(part, global_q_idx_start, model, plan):
+    """Trộn 1 phần đã phân tích sẵn theo kế hoạch hoán vị, trả về các mảnh XML (bytes) theo thứ tự mới + đáp án
+    + số thứ tự gốc (trong phần) của từng câu theo thứ tự mới"""
+    with stage("shuffle"):
+        final_item_list = shuffle_part(part, global_q_idx_start, plan)
+    with stage("relabel"):
+        return render_part(part, final_item_list, model)
+
+def header_fragment(header_info):
+    if not header_info.get("enable", False): return b""
+    try:
+        return create_header_xml(None, header_info).toxml().encode('utf-8')
+    except: return b""
+
+def ma_de_fragment(ma_de_str):
+    return (f'<w:p><w:pPr><w:jc w:val="right"/></w:pPr><w:r><w:rPr><w:b/></w:rPr>'
+            f'<w:t>Mã đề: {escape_xml(ma_de_str)}</w:t></w:r></w:p>').encode('utf-8')
+
+# Khoá cấu hình chỉ ảnh hưởng cách ghi file (không đổi nội dung đề): không tính vào seed,
+# đổi kiểu nén vẫn ra đúng bộ đề cũ
+OUTPUT_ONLY_KEYS = frozenset({"compression"})
+
+def variant_seed(model, ma_de_str, config=None):
+    """Seed riêng cho 1 mã đề, suy ra từ nội dung file + chế độ trộn + mã đề + cấu hình trộn:
+    cùng đầu vào (kèm danh sách mã đề của lượt trộn, xem plan_for_variant) luôn ra cùng đề, nên sinh lại
+    1 mã đề bất kỳ lúc nào cũng được."""
+    settings = {k: v for k, v in (config or {}).items() if k not in OUTPUT_ONLY_KEYS}
+    settings = json.dumps(settings, sort_keys=True, ensure_ascii=False,
+                          default=lambda o: sorted(o) if isinstance(o, (set, frozenset)) else str(o))
+    key = f"{model['source_hash']}|{model['shuffle_mode']}|{ma_de_str}|{settings}"
+    return int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest()[:8], "big")
+
+def plan_variants(model, ma_de_list, config=None, seeds=None):
+    """Kế hoạch hoán vị cho cả lô mã đề, đúng thứ tự ma_de_list (xem permutations.py).
+    Seed mỗi mã đề mặc định là variant_seed(); cùng danh sách mã đề thì luôn ra cùng kế hoạch."""
+    if config is None: config = {}
+    if seeds is None: seeds = [variant_seed(model, ma_de, config) for ma_de in ma_de_list]
+    with stage("plan"):
+        return plan_batch(model["sections"], seeds, config)
+
+def plan_for_variant(model, ma_de, ma_de_list, config=None):
+    """Kế hoạch hoán vị của đúng 1 mã đề trong lô ma_de_list (bắt buộc: chống trùng làm mã đề phụ thuộc các mã đề
+    đứng trước nó, nên thiếu danh sách thì ra đề khác file cùng mã trong zip). Chỉ lập tới mã đề cần lấy."""
+    ma_de_list = list(ma_de_list)
+    if ma_de not in ma_de_list:
+        raise ValueError(f"Mã đề {ma_de} không có trong danh sách mã đề của lượt trộn ({', '.join(ma_de_list)})")
+    return plan_variants(model, ma_de_list[:ma_de_list.index(ma_de) + 1], config)[-1]
+
+def resolve_variant_plan(model, ma_de, config=None, plan=None, ma_de_list=None):
+    """Kế hoạch cho các hàm sinh 1 mã đề: plan có sẵn, hoặc lập từ danh sách mã đề của lượt trộn (bắt buộc 1 trong 2)"""
+    if plan is not None: return plan
+    if ma_de_list is None:
+        raise ValueError("Cần danh sách mã đề của lượt trộn (ma_de_list) hoặc kế hoạch hoán vị (plan): "
+                         "mã đề phụ thuộc các mã đề đứng trước nó trong lượt trộn")
+    return plan_for_variant(model, ma_de, ma_de_list, config)
+
+def render_variant_xml(model, header_info, ma_de_str="", config=None, plan=None, ma_de_list=None):
+    """Sinh document.xml của 1 mã đề dưới dạng danh sách mảnh bytes (chưa nối) + đáp án theo phần
+    (kèm keys_by_part["ORDER"]: {phần: số thứ tự gốc của từng câu theo thứ tự trong mã đề}).
+    plan: kế hoạch hoán vị của mã đề (1 phần tử của plan_variants); không có thì lập từ ma_de_list
+    (danh sách mã đề của lượt trộn, bắt buộc khi thiếu plan, xem resolve_variant_plan)."""
+    if config is None: config = {}
+    plan = resolve_variant_plan(model, ma_de_str, config, plan, ma_de_list)
+    part_plans = iter(plan)
+    keys_by_part = {}
+    pieces = [model["doc_head"], header_fragment(header_info)]
+    if ma_de_str: pieces.append(ma_de_fragment(ma_de_str))
+
+    current_global_q_idx = 0
+    for section in model["sections"]:
+        if section["type"] == "static":
+            pieces.extend(model["fragments"][i] for i in section["blocks"])
+            continue
+        part_pieces, k, order = process_part(section, current_global_q_idx, model, next(part_plans))
+        pieces.extend(part_pieces)
+        keys_by_part[section["key_name"]] = k
+        keys_by_part.setdefault("ORDER", {})[section["key_name"]] = order
+        current_global_q_idx += len(k)
+
+    pieces.append(model["body_tail"])
+    pieces.append(model["doc_tail"])
+    return pieces, keys_by_part
+
+def write_variant(fp, model, header_info, ma_de_str="", config=None, plan=None, ma_de_list=None):
+    """Ghi thẳng 1 mã đề (.docx) ra fp (file / luồng chỉ cần write), trả về đáp án theo phần.
+    config["compression"]: preset nén document.xml + footer (xem compression.py). plan / ma_de_list: như render_variant_xml."""
+    pieces, keys_by_part = render_variant_xml(model, header_info, ma_de_str, config, plan, ma_de_list)
+    with stage("zip_write", sum(map(len, pieces))):
+        write_package(fp, model["package"], {
+            FOOTER_PART_NAME: create_footer_xml_content(ma_de_str).encode('utf-8'),
+            "word/document.xml": pieces,
+        }, (config or {}).get("compression"))
+    return keys_by_part
+
+def render_variant(model, header_info, ma_de_str="", config=None, plan=None, ma_de_list=None):
+    """Sinh 1 mã đề (.docx) từ model: chỉ hoán vị + nối mảnh XML; gói zip chỉ nén document.xml + footer.
+    Kết quả chỉ phụ thuộc file + mã đề + cấu hình + danh sách mã đề của lượt trộn (plan hoặc ma_de_list, bắt buộc)."""
+    output_buffer = io.BytesIO()
+    keys_by_part = write_variant(output_buffer, model, header_info, ma_de_str, config, plan, ma_de_list)
+    return output_buffer.getvalue(), keys_by_part
+
+def shuffle_docx_logic(file_bytes, shuffle_mode, header_info, ma_de_str="", config=None, xml_backend=None, ma_de_list=None):
+    """Trộn 1 mã đề trực tiếp từ file; ma_de_list: danh sách mã đề của lượt trộn (bắt buộc, ra đúng file cùng mã
+    trong zip). Khi sinh nhiều mã đề, dùng build_exam_model + render_variant."""
+    model = build_exam_model(file_bytes, shuffle_mode, xml_backend)
+    return render_variant(model, header_info, ma_de_str, config, ma_de_list=ma_de_list)
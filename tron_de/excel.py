@@ -0,0 +1,70 @@
+import io
+
+from .summary import collect_keys
+
+# ==================== FILE EXCEL ĐÁP ÁN ====================
+# Ghi thẳng bằng xlsxwriter ở chế độ constant_memory (mỗi dòng ghi xong là đẩy xuống file tạm), không qua
+# pandas. Số cột lấy theo số câu thực tế của từng phần nên xuất được cả đề dài lẫn hàng nghìn mã đề.
+
+SHEET_NAME = "Sheet1"
+ORDER_SHEET_NAME = "Thu_tu_cau"
+PART_LABELS = {"PHAN1": "I", "MCQ_ALL": "I", "PHAN2": "II", "TF_ALL": "II", "PHAN3": "III"}
+
+def answer_headers(mcq_keys_map, tf_keys_map, sa_keys_map):
+    """Tiêu đề cột: "Đề \\ Câu", 1..n (Phần I), 1a..nd (Phần II), 1..n (Phần III)
+    cùng số câu / số ý mỗi phần (lấy theo mã đề dài nhất)"""
+    num_mcq = max([len(v) for v in mcq_keys_map.values()], default=0)
+    num_tf = max([len(v) for v in tf_keys_map.values()], default=0)
+    num_items = max([4] + [len(ans) for v in tf_keys_map.values() for ans in v])
+    num_sa = max([len(v) for v in sa_keys_map.values()], default=0)
+    headers = ["Đề \\ Câu"]
+    headers.extend(str(i) for i in range(1, num_mcq + 1))
+    for q in range(1, num_tf + 1):
+        headers.extend(f"{q}{chr(ord('a') + c)}" for c in range(num_items))
+    headers.extend(str(i) for i in range(1, num_sa + 1))
+    return headers, (num_mcq, num_tf, num_items, num_sa)
+
+def _pad(values, n):
+    return (list(values) + [""] * n)[:n]
+
+def write_answer_xlsx(fp, all_answers_dict, question_order=False):
+    """Ghi file Excel đáp án ra fp (đường dẫn hoặc file nhị phân), mỗi mã đề 1 dòng.
+    question_order=True: thêm sheet thứ tự câu (câu trong mã đề -> câu gốc). Trả về False nếu không có mã đề nào."""
+    import xlsxwriter
+    ma_des, mcq_keys_map, tf_keys_map, sa_keys_map = collect_keys(all_answers_dict)
+    if not ma_des: return False
+    headers, (num_mcq, num_tf, num_items, num_sa) = answer_headers(mcq_keys_map, tf_keys_map, sa_keys_map)
+
+    workbook = xlsxwriter.Workbook(fp, {"constant_memory": True})
+    try:
+        header_format = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+        sheet = workbook.add_worksheet(SHEET_NAME)
+        sheet.write_row(0, 0, headers, header_format)
+        sheet.set_column(0, 0, 10)
+        for r, md in enumerate(ma_des, start=1):
+            row = [str(md)]
+            row.extend(_pad(mcq_keys_map.get(md, []), num_mcq))
+            tf_data = tf_keys_map.get(md, [])
+            for i in range(num_tf):
+                row.extend(_pad(tf_data[i] if i < len(tf_data) else [], num_items))
+            row.extend(_pad(sa_keys_map.get(md, []), num_sa))
+            sheet.write_row(r, 0, row)
+
+        if question_order:
+            order_sheet = workbook.add_worksheet(ORDER_SHEET_NAME)
+            order_sheet.write_row(0, 0, ["Mã đề", "Phần", "Câu trong đề", "Câu gốc"], header_format)
+            r = 1
+            for md in ma_des:
+                for key_name, order in all_answers_dict[md].get("ORDER", {}).items():
+                    for new_number, original in enumerate(order, start=1):
+                        order_sheet.write_row(r, 0, [str(md), PART_LABELS.get(key_name, key_name), new_number, original])
+                        r += 1
+    finally:
+        workbook.close()
+    return True
+
+def generate_real_excel_xlsx(all_answers_dict, question_order=False):
+    """File Excel đáp án (bytes); b"" nếu không có mã đề nào"""
+    output = io.BytesIO()
+    if not write_answer_xlsx(output, all_answers_dict, question_order): return b""
+    return output.getvalue()
@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+
+# ==================== CHẠY NỀN: TRỘN ĐỀ KHÔNG KHOÁ GIAO DIỆN ====================
+# Mỗi lượt trộn chạy trong 1 luồng nền (các mã đề vẫn sinh song song bằng pool tiến trình như cũ).
+# Giao diện chỉ đọc tiến độ (số mã đề đã xong), có thể yêu cầu dừng; kết quả giữ lại trong registry
+# theo khoá của lượt trộn (nội dung file + cấu hình), nên rerun hay tải lại trang rồi tải lên đúng file đó
+# vẫn thấy lượt đang chạy / đã xong, không phải trộn lại.
+
+class JobCancelled(BaseException):
+    """Người dùng bấm dừng: ném ra từ hàm báo tiến độ để lượt trộn dừng ở mã đề kế tiếp.
+    Kế thừa BaseException (như KeyboardInterrupt) để các khối except Exception bắt lỗi từng file không nuốt mất."""
+
+class Job:
+    """1 lượt trộn chạy nền. target(progress) chạy trong luồng riêng; progress(done, total) báo tiến độ
+    và ném JobCancelled nếu đã có yêu cầu dừng. status: "running" | "done" | "cancelled" | "failed"."""
+
+    def __init__(self, key, target, total=0):
+        self.key = key
+        self.total = total
+        self.done = 0
+        self.status = "running"
+        self.result = None
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(target,), name=f"tron_de_job_{key[:8]}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self, target):
+        try:
+            self.result = target(self.progress)
+            self.status = "done"
+        except JobCancelled:
+            self.status = "cancelled"
+        except Exception as e:
+            self.error = str(e)
+            self.status = "failed"
+        finally:
+            self.finished = time.time()
+
+    def progress(self, done, total=None):
+        if self._cancel.is_set(): raise JobCancelled()
+        if total is not None: self.total = total
+        self.done = done
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def running(self):
+        return self.status == "running"
+
+    @property
+    def cancelling(self):
+        return self.running and self._cancel.is_set()
+
+    @property
+    def fraction(self):
+        return min(1.0, self.done / self.total) if self.total else 0.0
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        return not self.running
+
+class JobRegistry:
+    """Các lượt trộn theo khoá, dùng chung mọi phiên; an toàn đa luồng.
+    Giữ tối đa max_finished lượt đã kết thúc (bỏ lượt kết thúc sớm nhất), lượt đang chạy luôn được giữ."""
+
+    def __init__(self, max_finished=32):
+        self.max_finished = max_finished
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def submit(self, key, target, total=0):
+        """Chạy target nền với khoá key. Khoá đang chạy thì trả về lượt đó (không chạy trùng);
+        lượt cũ đã kết thúc thì được thay bằng lượt mới."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.running: return job
+            self._jobs.pop(key, None)
+            job = self._jobs[key] = Job(key, target, total)
+            self._evict()
+        return job.start()
+
+    def forget(self, key):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.running: del self._jobs[key]
+
+    def _evict(self):
+        finished = [key for key, job in self._jobs.items() if not job.running]
+        for key in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[key]
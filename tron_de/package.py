@@ -0,0 +1,126 @@
+import io
+import struct
+import time
+import zipfile
+import zlib
+
+from .compression import member_compression
+
+# ==================== PACKAGE TEMPLATE: GHI FILE .DOCX KHÔNG NÉN LẠI PART CŨ ====================
+# File .docx là 1 gói zip. Mỗi mã đề chỉ khác document.xml và footer, nên các part còn lại
+# (ảnh, MathType/OLE, styles...) được chép nguyên luồng đã nén từ file gốc, không giải nén/nén lại.
+# [Content_Types].xml và document.xml.rels được sửa + nén 1 lần cho cả lượt trộn.
+# Part tự nén (mới / sửa / thay theo mã đề) chọn kiểu nén + mức nén theo compression.py.
+
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+END_RECORD = struct.Struct("<4s4H2LH")
+ZIP_LIMIT = 0xFFFFFFFF
+
+def dos_datetime(date_time):
+    y, mo, d, h, mi, s = date_time
+    return (h << 11) | (mi << 5) | (s // 2), ((y - 1980) << 9) | (mo << 5) | d
+
+def compress_member(name, data, date_time=None, compression=None):
+    """Nén 1 part mới (data: bytes hoặc list các mảnh bytes) thành entry sẵn sàng ghi vào gói.
+    compression: preset nén (xem compression.py), ảnh/gói đã nén thì lưu nguyên."""
+    pieces = [data] if isinstance(data, (bytes, bytearray, memoryview)) else data
+    method, level = member_compression(name, compression)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15) if method == zipfile.ZIP_DEFLATED else None
+    crc = 0
+    size = 0
+    out = []
+    for piece in pieces:
+        crc = zlib.crc32(piece, crc)
+        size += len(piece)
+        out.append(compressor.compress(piece) if compressor else piece)
+    if compressor: out.append(compressor.flush())
+    raw = b"".join(out)
+    return {
+        "name": name,
+        "raw": raw,
+        "crc": crc,
+        "compress_size": len(raw),
+        "file_size": size,
+        "method": method,
+        "date_time": date_time or time.localtime(time.time())[:6],
+        "external_attr": 0o600 << 16,
+    }
+
+def raw_member(file_bytes, info):
+    """Entry trỏ vào vùng bytes đã nén của part trong file gốc (không copy, không giải nén)"""
+    fname_len, extra_len = struct.unpack("<2H", file_bytes[info.header_offset + 26:info.header_offset + 30])
+    start = info.header_offset + LOCAL_HEADER.size + fname_len + extra_len
+    return {
+        "name": info.filename,
+        "raw_range": (start, start + info.compress_size),
+        "crc": info.CRC,
+        "compress_size": info.compress_size,
+        "file_size": info.file_size,
+        "method": info.compress_type,
+        "date_time": info.date_time,
+        "external_attr": info.external_attr,
+    }
+
+def build_package_template(file_bytes, patches=None, variable_parts=(), new_parts=()):
+    """Chuẩn bị gói mẫu 1 lần cho mỗi file tải lên.
+    patches: {tên part: hàm(bytes) -> bytes}, áp 1 lần rồi nén sẵn.
+    variable_parts: part có sẵn nhưng thay nội dung theo từng mã đề (vd word/document.xml).
+    new_parts: part mới theo từng mã đề, ghi lên đầu gói (vd footer)."""
+    patches = patches or {}
+    members = [{"name": name, "variable": True} for name in new_parts]
+    with zipfile.ZipFile(io.BytesIO(file_bytes), 'r') as zin:
+        for info in zin.infolist():
+            if info.filename in new_parts: continue
+            if info.filename in variable_parts:
+                members.append({"name": info.filename, "variable": True, "date_time": info.date_time,
+                                "external_attr": info.external_attr})
+            elif info.filename in patches:
+                data = patches[info.filename](zin.read(info))
+                members.append(compress_member(info.filename, data, info.date_time))
+            elif info.flag_bits & 0x1 or info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                # Part mã hoá / kiểu nén lạ: giải nén 1 lần rồi nén lại theo preset mặc định
+                members.append(compress_member(info.filename, zin.read(info), info.date_time))
+            else:
+                members.append(raw_member(file_bytes, info))
+    # Part mới lấy mốc thời gian của part thay theo mã đề (không dùng giờ lúc ghi), để sinh lại
+    # 1 mã đề luôn ra đúng từng byte như lần trước
+    stamp = next((m["date_time"] for m in members if m.get("variable") and "date_time" in m), (1980, 1, 1, 0, 0, 0))
+    for member in members:
+        if member.get("variable"): member.setdefault("date_time", stamp)
+    return {"source": file_bytes, "members": members}
+
+def write_package(fp, template, variable_data, compression=None):
+    """Ghi 1 gói .docx ra fp: part cố định chép nguyên bytes, chỉ nén part trong variable_data
+    ({tên part: bytes hoặc list mảnh bytes}) theo preset compression."""
+    central = []
+    offset = 0
+    for member in template["members"]:
+        if member.get("variable"):
+            entry = compress_member(member["name"], variable_data[member["name"]], member.get("date_time"),
+                                    compression)
+            if "external_attr" in member: entry["external_attr"] = member["external_attr"]
+        else:
+            entry = member
+        name = entry["name"].encode('utf-8')
+        flags = 0x800 if not entry["name"].isascii() else 0
+        dos_time, dos_date = dos_datetime(entry["date_time"])
+        if offset > ZIP_LIMIT or entry["compress_size"] > ZIP_LIMIT or entry["file_size"] > ZIP_LIMIT:
+            raise ValueError("Gói .docx quá lớn (cần ZIP64), không hỗ trợ")
+        fp.write(LOCAL_HEADER.pack(b"PK\003\004", 20, 0, flags, entry["method"], dos_time, dos_date,
+                                   entry["crc"], entry["compress_size"], entry["file_size"], len(name), 0))
+        fp.write(name)
+        if "raw_range" in entry:
+            start, end = entry["raw_range"]
+            fp.write(memoryview(template["source"])[start:end])
+        else:
+            fp.write(entry["raw"])
+        central.append(CENTRAL_HEADER.pack(b"PK\001\002", 20, 3, 20, 0, flags, entry["method"], dos_time, dos_date,
+                                           entry["crc"], entry["compress_size"], entry["file_size"], len(name),
+                                           0, 0, 0, 0, entry["external_attr"], offset) + name)
+        offset += LOCAL_HEADER.size + len(name) + entry["compress_size"]
+    if offset > ZIP_LIMIT or len(central) > 0xFFFF:
+        raise ValueError("Gói .docx quá lớn (cần ZIP64), không hỗ trợ")
+    central_dir = b"".join(central)
+    fp.write(central_dir)
+    fp.write(END_RECORD.pack(b"PK\005\006", 0, 0, len(central), len(central), len(central_dir), offset, 0))
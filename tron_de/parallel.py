@@ -0,0 +1,210 @@
+import os
+import pickle
+import tempfile
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .cache import content_hash
+from .core import render_variant, write_variant, plan_variants
+from .profiling import profile_scope, current_profile, merge_profile, stage
+
+# ==================== SINH NHIỀU MÃ ĐỀ SONG SONG (PROCESS POOL) ====================
+# - Tiến trình con tạo bằng 'forkserver' (không có thì 'spawn'), không 'fork' từ tiến trình chính (nhiều luồng:
+#   streamlit, pool...). Server nạp sẵn WORKER_MODULES + script chính (streamlit_app.py chạy 1 lần ở chế độ
+#   "bare", không có giao diện) nên mỗi tiến trình con fork ra đã "nóng", không chạy lại script.
+# - ProcessPool tự theo dõi pool hỏng (BrokenProcessPool khi submit / lấy kết quả) và dựng pool mới ở lần
+#   submit sau; bên gọi vẫn tự chạy tuần tự phần việc của lô đang dở.
+# - Model chỉ pickle 1 lần mỗi lô, ghi ra file tạm; mỗi tiến trình con đọc 1 lần và giữ lại theo mã băm nội dung
+#   (_worker_model), các đoạn việc chỉ mang mã đề + kế hoạch hoán vị.
+
+WORKER_MODULES = [f"{__package__}.{name}" for name in ("parallel", "batch", "cli")]
+
+def default_workers():
+    return max(1, min(8, os.cpu_count() or 1))
+
+def _init_worker():
+    # Chạy 1 lần khi tiến trình con khởi động: với 'spawn' thì nạp module ở đây, với 'forkserver' đã có sẵn
+    for name in WORKER_MODULES: importlib.import_module(name)
+
+def _ping():
+    return os.getpid()
+
+class ProcessPool(Executor):
+    """ProcessPoolExecutor tự dựng lại khi hỏng (tiến trình con bị kill, hết RAM...): không đọc trạng thái riêng
+    của ProcessPoolExecutor mà tự ghi nhận BrokenProcessPool lúc submit / lúc future kết thúc."""
+
+    def __init__(self, workers, mp_context):
+        self.workers = workers
+        self._mp_context = mp_context
+        self._lock = threading.Lock()
+        self._executor = None
+        self._broken = False
+
+    def _current(self):
+        with self._lock:
+            if self._broken and self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=self._mp_context,
+                                                     initializer=_init_worker)
+                self._broken = False
+            return self._executor
+
+    def _check(self, fut):
+        if not fut.cancelled() and isinstance(fut.exception(), BrokenProcessPool): self._broken = True
+
+    def submit(self, fn, /, *args, **kwargs):
+        try:
+            fut = self._current().submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            self._broken = True
+            raise
+        fut.add_done_callback(self._check)
+        return fut
+
+    def warm_up(self):
+        """Khởi động sẵn đủ tiến trình con (chạy _init_worker), lần sinh mã đề đầu tiên khỏi phải chờ"""
+        for fut in [self.submit(_ping) for _ in range(self.workers)]: fut.result()
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None: executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+def create_process_pool(workers=None, warm=True):
+    """Tạo pool tiến trình để sinh mã đề ('forkserver' nạp sẵn module, không có thì 'spawn');
+    warm: khởi động sẵn mọi tiến trình con ngay (BrokenProcessPool lúc khởi động thì để lần submit sau dựng lại)."""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(WORKER_MODULES)
+    else:
+        ctx = multiprocessing.get_context("spawn")
+    pool = ProcessPool(workers or default_workers(), ctx)
+    if warm:
+        try: pool.warm_up()
+        except BrokenProcessPool: pass
+    return pool
+
+# --- MODEL GỬI 1 LẦN CHO MỖI TIẾN TRÌNH CON ---
+
+_worker_models = {}
+
+def share_model(model, tmp_dir):
+    """Pickle model 1 lần ra file tạm trong tmp_dir; trả về (mã băm, đường dẫn) để gửi kèm từng đoạn việc"""
+    with stage("share_model"):
+        data = pickle.dumps(model, pickle.HIGHEST_PROTOCOL)
+        key = content_hash(data)
+        path = os.path.join(tmp_dir, f"model_{key[:16]}.pickle")
+        with open(path, "wb") as f: f.write(data)
+    return key, path
+
+def _worker_model(model_ref):
+    # Chạy trong tiến trình con: chỉ đọc file model khi chưa có (giữ 1 model, lô sau cùng đề khỏi đọc lại)
+    key, path = model_ref
+    model = _worker_models.get(key)
+    if model is None:
+        with open(path, "rb") as f: model = pickle.load(f)
+        _worker_models.clear()
+        _worker_models[key] = model
+    return model
+
+def _render_chunk(model, header_info, config, chunk):
+    # Mỗi mã đề mang sẵn kế hoạch hoán vị (lập cho cả lô ở tiến trình chính)
+    return [render_variant(model, header_info, ma_de, config, plan) for ma_de, plan in chunk]
+
+def _render_chunk_remote(model_ref, header_info, config, chunk):
+    return _render_chunk(_worker_model(model_ref), header_info, config, chunk)
+
+def split_chunks(tasks, n):
+    """Chia tasks thành n đoạn liên tiếp gần bằng nhau (ghép lại theo thứ tự là ra danh sách gốc)"""
+    n = max(1, min(n, len(tasks)))
+    size, extra = divmod(len(tasks), n)
+    chunks = []
+    start = 0
+    for i in range(n):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(tasks[start:end])
+        start = end
+    return chunks
+
+def generate_variants(model, header_info, ma_de_list, config=None, executor=None, workers=None, seeds=None):
+    """Sinh mọi mã đề từ model, trả về list (out_bytes, keys_by_part) đúng thứ tự ma_de_list.
+    executor=None (hoặc chỉ 1 mã đề) -> chạy tuần tự. Hoán vị của cả lô lập trước (plan_variants, seed mỗi mã đề
+    mặc định là variant_seed()), nên kết quả không phụ thuộc số tiến trình, thứ tự chạy xong hay lần chạy."""
+    if config is None: config = {}
+    tasks = list(zip(ma_de_list, plan_variants(model, ma_de_list, config, seeds)))
+    if executor is None or len(tasks) < 2:
+        return _render_chunk(model, header_info, config, tasks)
+    chunks = split_chunks(tasks, workers or default_workers())
+    with tempfile.TemporaryDirectory(prefix="tron_de_", ignore_cleanup_errors=True) as tmp_dir:
+        model_ref = share_model(model, tmp_dir)
+        try:
+            futures = [executor.submit(_render_chunk_remote, model_ref, header_info, config, chunk) for chunk in chunks]
+            results = []
+            for fut in futures: results.extend(fut.result())
+            return results
+        except BrokenProcessPool:
+            # Pool hỏng (tiến trình con bị kill, hết RAM...) -> chạy tuần tự, cùng kế hoạch nên cùng kết quả
+            return _render_chunk(model, header_info, config, tasks)
+
+# --- GHI TỪNG MÃ ĐỀ RA FILE TẠM (RAM CHỈ CỠ 1 MÃ ĐỀ) ---
+
+# Mỗi tiến trình nhận vài đoạn nhỏ thay vì 1 đoạn lớn: mã đề về tới nơi (báo tiến độ, dừng giữa chừng) đều hơn;
+# đoạn việc chỉ mang mã đề + kế hoạch (model gửi qua share_model) nên chia nhỏ gần như không tốn thêm
+CHUNKS_PER_WORKER = 4
+
+def _write_chunk(model, header_info, config, chunk, tmp_dir):
+    # Ghi từng mã đề ra file tạm, chỉ trả về đường dẫn + đáp án
+    results = []
+    for ma_de, plan in chunk:
+        fd, path = tempfile.mkstemp(suffix=".docx", dir=tmp_dir)
+        with os.fdopen(fd, "wb") as f:
+            keys_by_part = write_variant(f, model, header_info, ma_de, config, plan)
+        results.append((path, keys_by_part))
+    return results
+
+def _write_chunk_remote(model_ref, header_info, config, chunk, tmp_dir, profiled):
+    # Chạy trong tiến trình con; profiled: đo thời gian từng bước, gửi profile về để gộp (None nếu không đo)
+    if not profiled: return _write_chunk(_worker_model(model_ref), header_info, config, chunk, tmp_dir), None
+    with profile_scope() as profile:
+        results = _write_chunk(_worker_model(model_ref), header_info, config, chunk, tmp_dir)
+    return results, profile
+
+def iter_variant_files(model, header_info, ma_de_list, config=None, executor=None, workers=None, seeds=None):
+    """Như generate_variants nhưng không giữ các mã đề trong RAM: lần lượt yield (ma_de, file, keys_by_part)
+    đúng thứ tự ma_de_list, file là file tạm trên đĩa đã mở để đọc, chỉ dùng được tới lần yield kế tiếp."""
+    if config is None: config = {}
+    tasks = list(zip(ma_de_list, plan_variants(model, ma_de_list, config, seeds)))
+    # Dừng giữa chừng thì tiến trình con có thể vẫn đang ghi vào thư mục tạm -> bỏ qua lỗi khi dọn
+    with tempfile.TemporaryDirectory(prefix="tron_de_", ignore_cleanup_errors=True) as tmp_dir:
+        def consume(results, start):
+            for (path, keys_by_part), (ma_de, _) in zip(results, tasks[start:]):
+                try:
+                    with open(path, "rb") as f: yield ma_de, f, keys_by_part
+                finally:
+                    os.remove(path)
+
+        done = 0
+        futures = []
+        if executor is not None and len(tasks) > 1:
+            try:
+                profile = current_profile()
+                model_ref = share_model(model, tmp_dir)
+                futures = [executor.submit(_write_chunk_remote, model_ref, header_info, config, chunk, tmp_dir, profile is not None)
+                           for chunk in split_chunks(tasks, (workers or default_workers()) * CHUNKS_PER_WORKER)]
+                for fut in futures:
+                    results, chunk_profile = fut.result()
+                    if chunk_profile is not None: merge_profile(profile, chunk_profile)
+                    yield from consume(results, done)
+                    done += len(results)
+            except BrokenProcessPool:
+                # Pool hỏng giữa chừng -> các mã đề còn lại chạy tuần tự, cùng kế hoạch nên cùng kết quả
+                pass
+            finally:
+                for fut in futures: fut.cancel()
+        for i in range(done, len(tasks)):
+            yield from consume(_write_chunk(model, header_info, config, [tasks[i]], tmp_dir), i)
@@ -0,0 +1,154 @@
+import numpy as np
+
+# ==================== HOÁN VỊ CẢ LÔ MÃ ĐỀ (NUMPY) ====================
+# Mọi hoán vị của 1 lượt trộn (thứ tự câu/nhóm, thứ tự câu trong nhóm, thứ tự đáp án) được tính trước cho cả lô
+# mã đề bằng mảng NumPy; các hàm trộn trong core.py chỉ áp hoán vị có sẵn.
+# - Ràng buộc cố định (fixed_pos_set, fixed_opt_set, fix_group_pos, tắt trộn) áp ngay khi sinh: câu/nhóm cố định
+#   không nằm trong hoán vị, câu không trộn đáp án giữ hoán vị đơn vị.
+# - Cân bằng đáp án (balance_answers, mặc định bật): trong mỗi mã đề, số câu Phần 1 có đáp án đúng là A/B/C/D
+#   chênh nhau tối đa 1 (tính cả câu không trộn đáp án; trừ khi chính các câu đó đã lệch quá mức).
+# - Chống trùng (max_rank_correlation, mặc định 0.8): tương quan hạng Spearman giữa thứ tự câu của 1 mã đề với mọi
+#   mã đề đứng trước (chỉ tính câu/nhóm di chuyển được) phải không vượt ngưỡng; vượt thì lấy ứng viên khác
+#   (mỗi mã đề có CANDIDATES ứng viên, kiểm tra cùng lúc bằng 1 phép nhân ma trận). Không ứng viên nào đạt (phần
+#   quá ít câu, quá nhiều mã đề) thì lấy ứng viên có tương quan lớn nhất nhỏ nhất.
+# Mỗi mã đề có bộ sinh số ngẫu nhiên riêng theo seed (variant_seed), nên nếu không phải đổi ứng viên thì mã đề
+# chỉ phụ thuộc file + mã đề + cấu hình; mã đề thứ k có thể phụ thuộc các mã đề đứng trước nó trong danh sách.
+
+MAX_RANK_CORRELATION = 0.8
+CANDIDATES = 16
+
+def part_layout(part, global_q_idx_start, config):
+    """Những gì cần hoán vị trong 1 phần: câu/nhóm di chuyển được, nhóm được trộn câu bên trong,
+    và từng câu (theo thứ tự gốc) với số phần tử hoán vị được + có được trộn đáp án không"""
+    shuffle_pos = config.get("shuffle_pos_global", True)
+    shuffle_opt = config.get("shuffle_opt_global", True)
+    fixed_pos_set = config.get("fixed_pos_set", set())
+    fixed_opt_set = config.get("fixed_opt_set", set())
+    fix_group_pos = config.get("fix_group_pos", False)
+    part_type = part["part_type"]
+    movable = []
+    clusters = []
+    questions = []
+    q_idx = global_q_idx_start
+    for i, item in enumerate(part["items"]):
+        sub_questions = [item["question"]] if item["type"] == "question" else item["questions"]
+        first = q_idx + 1
+        for question in sub_questions:
+            q_idx += 1
+            if part_type == "PHAN1":
+                size, correct = len(question["options"]), question["correct"]
+            elif part_type == "PHAN2":
+                size, correct = sum(question["tf_options"].get(k) is not None for k in "abc"), -1
+            else:
+                size, correct = 0, -1
+            allow = shuffle_opt and q_idx not in fixed_opt_set and size >= 2
+            questions.append((size, correct, allow))
+        fixed = not shuffle_pos or first in fixed_pos_set or (fix_group_pos and item["type"] == "cluster")
+        if not fixed: movable.append(i)
+        if item["type"] == "cluster" and shuffle_pos and len(sub_questions) > 1: clusters.append((i, len(sub_questions)))
+    return {"part_type": part_type, "n_items": len(part["items"]), "movable": movable, "clusters": clusters,
+            "questions": questions}
+
+def _ranks(keys):
+    """Hạng (0..m-1) của từng phần tử khi sắp theo keys, theo từng dòng"""
+    return np.argsort(np.argsort(keys, axis=1), axis=1)
+
+def _pick_candidate(centered, accepted, norm, threshold):
+    """Ứng viên đầu tiên có tương quan với mọi mã đề trước không vượt ngưỡng (không có thì ứng viên tốt nhất)"""
+    if not accepted or norm == 0: return 0
+    worst = (centered @ np.asarray(accepted).T).max(axis=1) / norm
+    ok = np.flatnonzero(worst <= threshold)
+    return int(ok[0]) if ok.size else int(worst.argmin())
+
+def _balanced_targets(gen, sizes, correct, allow):
+    """Chữ cái đích (vị trí mới của đáp án đúng) cho các câu được trộn + biết đáp án, sao cho trong mã đề
+    mỗi chữ cái xuất hiện đều nhau (câu không trộn giữ chữ cái cũ và được tính vào)."""
+    targets = np.full(len(sizes), -1)
+    known = correct >= 0
+    for k in np.unique(sizes[known]):
+        group = known & (sizes == k)
+        free = np.flatnonzero(group & allow)
+        if free.size == 0: continue
+        fixed_counts = np.bincount(correct[group & ~allow], minlength=k)
+        base, extra = divmod(int(group.sum()), int(k))
+        quota = np.full(k, base)
+        quota[gen.permutation(k)[:extra]] += 1
+        need = np.clip(quota - fixed_counts, 0, None)
+        while need.sum() > free.size: need[need.argmax()] -= 1
+        targets[free] = gen.permutation(np.repeat(np.arange(k), need))
+    return targets
+
+def _option_perms(gen, layouts, balance):
+    """Hoán vị đáp án của mọi câu trong mã đề: list (theo phần) các list hoán vị (None: giữ nguyên).
+    Hoán vị perm: vị trí mới -> vị trí cũ. Câu cùng số đáp án được sinh chung 1 mảng."""
+    questions = [(p, j, q) for p, layout in enumerate(layouts) for j, q in enumerate(layout["questions"])]
+    perms = [[None] * len(layout["questions"]) for layout in layouts]
+    if not questions: return perms
+    sizes = np.array([q[0] for _, _, q in questions])
+    correct = np.array([q[1] if layouts[p]["part_type"] == "PHAN1" else -1 for p, _, q in questions])
+    allow = np.array([q[2] for _, _, q in questions], dtype=bool)
+    targets = _balanced_targets(gen, sizes, correct, allow) if balance else np.full(len(questions), -1)
+    for k in np.unique(sizes[allow]):
+        rows = np.flatnonzero(allow & (sizes == k))
+        perm = np.argsort(gen.random((rows.size, k)), axis=1)
+        # Đưa đáp án đúng về chữ cái đích: đổi chỗ trong hoán vị ngẫu nhiên, các đáp án còn lại vẫn ngẫu nhiên
+        sel = np.flatnonzero(targets[rows] >= 0)
+        if sel.size:
+            t, c = targets[rows[sel]], correct[rows[sel]]
+            pos = (perm[sel] == c[:, None]).argmax(axis=1)
+            moved = perm[sel, t]
+            perm[sel, t] = c
+            perm[sel, pos] = moved
+        for row, values in zip(rows, perm.tolist()):
+            p, j, _ = questions[row]
+            perms[p][j] = values
+    return perms
+
+def plan_batch(sections, seeds, config=None):
+    """Hoán vị cho cả lô mã đề (mỗi seed 1 mã đề, đúng thứ tự). Mỗi kế hoạch là list (theo phần, đúng thứ tự
+    các phần trong model) các dict {"order": thứ tự câu/nhóm (chỉ số gốc), "sub": {nhóm: thứ tự câu trong nhóm},
+    "options": [hoán vị đáp án từng câu theo thứ tự gốc, None: giữ nguyên]}."""
+    if config is None: config = {}
+    threshold = float(config.get("max_rank_correlation", MAX_RANK_CORRELATION))
+    balance = config.get("balance_answers", True)
+    layouts = []
+    q_start = 0
+    for section in sections:
+        if section["type"] != "part": continue
+        layout = part_layout(section, q_start, config)
+        layouts.append(layout)
+        q_start += len(layout["questions"])
+
+    # Đoạn của từng phần trong vector hạng của cả đề (phần có dưới 2 câu/nhóm di chuyển được thì bỏ qua)
+    segments = []
+    width = 0
+    for layout in layouts:
+        m = len(layout["movable"])
+        segments.append((width, m if m >= 2 else 0))
+        width += m if m >= 2 else 0
+    # Tích vô hướng của vector hạng đã trừ trung bình với chính nó (như nhau với mọi hoán vị): mẫu số Spearman
+    norm = sum(m * (m * m - 1) / 12 for _, m in segments)
+
+    accepted = []
+    plans = []
+    for seed in seeds:
+        gen = np.random.default_rng(seed)
+        keys = gen.random((CANDIDATES, width))
+        ranks = np.empty((CANDIDATES, width))
+        for start, m in segments:
+            if m: ranks[:, start:start + m] = _ranks(keys[:, start:start + m]) - (m - 1) / 2
+        choice = _pick_candidate(ranks, accepted, norm, threshold)
+        accepted.append(ranks[choice])
+
+        option_perms = _option_perms(gen, layouts, balance)
+        plan = []
+        for layout, (start, m), options in zip(layouts, segments, option_perms):
+            order = list(range(layout["n_items"]))
+            movable = layout["movable"]
+            if m:
+                moved = np.argsort(keys[choice, start:start + m]).tolist()
+                for slot, j in zip(movable, moved): order[slot] = movable[j]
+            sub = {i: np.argsort(gen.random(n)).tolist() for i, n in layout["clusters"]}
+            plan.append({"order": order, "sub": sub, "options": options})
+        plans.append(plan)
+    return plans
@@ -0,0 +1,143 @@
+import html
+
+from .core import resolve_variant_plan, shuffle_part, QUESTION_RE, MCQ_OPTION_RE, TF_OPTION_RE
+from .profiling import stage
+from .validation import PART_NUMBERS
+
+# ==================== XEM TRƯỚC 1 MÃ ĐỀ DẠNG HTML (KHÔNG DỰNG .DOCX) ====================
+# Dựng từ model đã phân tích (kế hoạch hoán vị giống hệt lúc xuất zip): đúng thứ tự câu, số câu, nhãn đáp án
+# A-D / a-d sau khi trộn, bố cục đáp án 1/2/4 cột (question["layout"], xem mcq_layout_mode) và tô màu đáp án đúng.
+# Không nối document.xml, không tạo footer / bảng tiêu đề Word, không đóng gói zip, không đọc lại mảnh XML:
+# chữ và ảnh/công thức của từng block đã lấy sẵn lúc phân tích (model["texts"], model["media"]), ở đây chỉ ghép chuỗi.
+# Ảnh, công thức, đối tượng nhúng chỉ hiện ô giữ chỗ; bảng hiện dạng 1 đoạn chữ.
+
+MEDIA_NAMES = {"w:drawing": "hình", "w:pict": "hình", "w:object": "đối tượng nhúng", "m:oMath": "công thức"}
+
+PREVIEW_CSS = """
+body { font-family: "Times New Roman", serif; font-size: 15px; line-height: 1.45; margin: 12px 20px; color: #111; }
+p { margin: 3px 0; }
+.header { text-align: center; margin-bottom: 6px; }
+.ma-de { text-align: right; font-weight: bold; }
+.q { margin-top: 8px; }
+.q b { color: #0645ad; }
+.opts { display: grid; column-gap: 16px; margin: 2px 0 2px 18px; }
+.opt b { color: #0645ad; }
+.correct { background: #fff3a0; color: #b00000; font-weight: bold; }
+.key { margin-left: 18px; }
+.cluster { border-left: 3px solid #bbb; padding-left: 8px; margin-top: 8px; }
+.table { border: 1px dashed #bbb; padding: 2px 6px; }
+.media { color: #777; font-style: italic; font-size: 13px; }
+.answers { margin-top: 16px; border-top: 1px solid #ccc; padding-top: 6px; font-size: 14px; }
+"""
+
+def _esc(text):
+    return html.escape(text, quote=False)
+
+def _media_html(kinds):
+    names = dict.fromkeys(MEDIA_NAMES.get(kind, kind) for kind in kinds)
+    return "".join(f' <span class="media">[{name}]</span>' for name in names)
+
+def _paragraph(blocks, idx):
+    texts, media, fragments = blocks
+    text, extra = texts[idx], media.get(idx, "")
+    if fragments[idx].startswith(b"<w:tbl"): return f'<p class="table">{_esc(text)}{extra}</p>'
+    if not text and not extra: return "<p>&nbsp;</p>"
+    return f"<p>{_esc(text)}{extra}</p>"
+
+def _question_html(blocks, question, q_indices, number, part_type, key):
+    """1 câu theo thứ tự đã trộn: giống render_question nhưng ra HTML"""
+    texts, media, _ = blocks
+    head = q_indices[0]
+    text = QUESTION_RE.sub("", texts[head], count=1).lstrip(" .:")
+    out = [f'<p class="q"><b>Câu {number}.</b> {_esc(text)}{media.get(head, "")}</p>']
+    rest = q_indices[1:]
+    relabel = question["relabel"]
+    original = question["blocks"]
+    if part_type == "PHAN1":
+        letters, suffix, label_re = "ABCD", ".", MCQ_OPTION_RE
+        correct = {original[question["options"][question["correct"]]]} if question["correct"] >= 0 else ()
+    elif part_type == "PHAN2":
+        letters, suffix, label_re = "abcd", ")", TF_OPTION_RE
+        correct = {original[pos] for pos, ok in question["tf_correct"].items() if ok}
+    else:
+        letters, suffix, label_re, correct = "", "", None, ()
+    opts = [i for i in rest if i in relabel] if letters else []
+    columns = question.get("layout", 1) if len(opts) == 4 else 1
+
+    count = 0
+    grid = []
+    for idx in rest:
+        if not letters or idx not in relabel:
+            out.append(_paragraph(blocks, idx))
+            continue
+        label = letters[min(count, 3)] + suffix
+        count += 1
+        text = label_re.sub("", texts[idx], count=1).strip()
+        css = "opt correct" if idx in correct else "opt"
+        option = f'<span class="{css}"><b>{label}</b> {_esc(text)}{media.get(idx, "")}</span>'
+        if columns == 1:
+            out.append(f"<p>{option}</p>")
+            continue
+        grid.append(option)
+        if len(grid) == len(opts):
+            out.append(f'<div class="opts" style="grid-template-columns: repeat({columns}, 1fr)">{"".join(grid)}</div>')
+    if part_type == "PHAN3" and key:
+        out.append(f'<p class="key"><span class="correct">Đáp án: {_esc(str(key))}</span></p>')
+    return out
+
+def _header_html(header_info, ma_de_str):
+    out = []
+    if header_info and header_info.get("enable", False):
+        lines = [header_info.get("so_gd", "").upper(), header_info.get("truong", ""),
+                 header_info.get("ky_thi", "").upper(), header_info.get("mon_thi", "").upper(),
+                 header_info.get("thoi_gian", ""), header_info.get("nam_hoc", "")]
+        out.append('<div class="header">' + "<br>".join(f"<b>{_esc(line)}</b>" for line in lines if line) + "</div>")
+    if ma_de_str: out.append(f'<p class="ma-de">Mã đề: {_esc(ma_de_str)}</p>')
+    return out
+
+def _answers_html(keys_by_part):
+    out = ['<div class="answers"><b>Đáp án</b>']
+    for key_name, keys in keys_by_part.items():
+        cells = ", ".join(f"{i}.{''.join(k) if isinstance(k, list) else k}" for i, k in enumerate(keys, 1))
+        part_no = PART_NUMBERS.get(key_name)
+        out.append(f"<p><b>{f'Phần {part_no}' if part_no else _esc(key_name)}:</b> {_esc(cells)}</p>")
+    out.append("</div>")
+    return out
+
+def preview_variant_html(model, header_info, ma_de, config=None, ma_de_list=None, plan=None):
+    """Trang HTML xem trước 1 mã đề (đúng thứ tự câu, nhãn đáp án, bố cục và đáp án như file cùng mã trong zip
+    kết quả sinh với ma_de_list, xem regenerate_variant). plan: dùng kế hoạch có sẵn, khỏi lập lại;
+    không có plan thì bắt buộc có ma_de_list."""
+    plan = resolve_variant_plan(model, ma_de, config, plan, ma_de_list)
+    with stage("preview"):
+        # (chữ, ô giữ chỗ ảnh/công thức, mảnh XML) theo chỉ số block; mảnh XML chỉ dùng để biết block là bảng
+        blocks = (model["texts"], {i: _media_html(kinds) for i, kinds in model["media"].items()}, model["fragments"])
+        body = _header_html(header_info, ma_de)
+        keys_by_part = {}
+        part_plans = iter(plan)
+        current_global_q_idx = 0
+        for section in model["sections"]:
+            if section["type"] == "static":
+                body.extend(_paragraph(blocks, i) for i in section["blocks"])
+                continue
+            part_type = section["part_type"]
+            items = shuffle_part(section, current_global_q_idx, next(part_plans))
+            body.extend(_paragraph(blocks, i) for i in section["intro"])
+            part_keys = []
+            q_counter = 0
+            for item in items:
+                if item["type"] == "cluster":
+                    body.append('<div class="cluster">')
+                    body.extend(_paragraph(blocks, i) for i in item["header"])
+                for (question, q_indices), key in zip(item["questions"], item["keys"]):
+                    part_keys.append(key)
+                    if not q_indices: continue
+                    q_counter += 1
+                    body.extend(_question_html(blocks, question, q_indices, q_counter, part_type, key))
+                if item["type"] == "cluster": body.append("</div>")
+            keys_by_part[section["key_name"]] = part_keys
+            current_global_q_idx += len(part_keys)
+        body.extend(_answers_html(keys_by_part))
+        title = f"Mã đề {ma_de}" if ma_de else "Xem trước đề"
+        return (f'<!DOCTYPE html><html lang="vi"><head><meta charset="utf-8"><title>{_esc(title)}</title>'
+                f"<style>{PREVIEW_CSS}</style></head><body>{''.join(body)}</body></html>")
@@ -0,0 +1,117 @@
+import contextlib
+import contextvars
+import json
+import time
+
+# ==================== ĐO THỜI GIAN TỪNG BƯỚC (CHẨN ĐOÁN "TRỘN ĐỀ CHẠY CHẬM") ====================
+# Các bước của quy trình (giải nén, parse XML, tách đáp án dính, chia phần, tách câu, trộn, đổi nhãn,
+# ghi zip, file đáp án...) được bọc bằng stage("tên bước"). Chỉ trong profile_scope() mới thực sự đo:
+# ngoài scope, stage() trả về 1 context rỗng dùng chung, add_bytes()/note() không làm gì (gần như không tốn).
+# Các bước chỉ đo ở mức cả phần / cả mã đề, không đo trong vòng lặp từng block.
+# Mã đề sinh ở tiến trình con được đo riêng rồi gộp về (merge_profile), nên tổng thời gian các bước
+# có thể lớn hơn thời gian thực (wall) khi chạy song song, và bước lồng nhau thì thời gian tính cả bước con.
+
+_profile = contextvars.ContextVar("profile", default=None)
+_NO_STAGE = contextlib.nullcontext()
+
+def new_profile():
+    return {"stages": {}, "document": {}, "wall_s": 0.0}
+
+@contextlib.contextmanager
+def profile_scope(profile=None):
+    """Bật đo thời gian trong khối lệnh, trả về profile (dict) được ghi dần; wall_s cộng thêm thời gian của khối"""
+    if profile is None: profile = new_profile()
+    token = _profile.set(profile)
+    start = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile["wall_s"] += time.perf_counter() - start
+        _profile.reset(token)
+
+def current_profile():
+    """Profile đang đo (None nếu không trong profile_scope)"""
+    return _profile.get()
+
+def _stage_stats(profile, name):
+    stats = profile["stages"].get(name)
+    if stats is None:
+        stats = profile["stages"][name] = {"calls": 0, "total_s": 0.0, "max_s": 0.0, "bytes": 0}
+    return stats
+
+class _Stage:
+    __slots__ = ("stats", "nbytes", "start")
+
+    def __init__(self, stats, nbytes):
+        self.stats = stats
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stats = self.stats
+        stats["calls"] += 1
+        stats["total_s"] += elapsed
+        if elapsed > stats["max_s"]: stats["max_s"] = elapsed
+        stats["bytes"] += self.nbytes
+        return False
+
+def stage(name, nbytes=0):
+    """with stage("xml_parse", len(data)): ... — đo 1 lần chạy của bước name (nbytes: dung lượng dữ liệu xử lý)"""
+    profile = _profile.get()
+    if profile is None: return _NO_STAGE
+    return _Stage(_stage_stats(profile, name), nbytes)
+
+def add_bytes(name, nbytes):
+    """Cộng dung lượng dữ liệu cho bước name khi chỉ biết sau khi chạy xong (vd kích thước file ghi ra)"""
+    profile = _profile.get()
+    if profile is not None: _stage_stats(profile, name)["bytes"] += nbytes
+
+def note(**info):
+    """Ghi thông tin về tài liệu đang xử lý (số block, số câu, dung lượng document.xml...)"""
+    profile = _profile.get()
+    if profile is not None: profile["document"].update(info)
+
+def merge_profile(dest, src):
+    """Gộp profile đo ở tiến trình con vào dest (cộng số lần, thời gian, dung lượng; max lấy lớn nhất)"""
+    for name, stats in src["stages"].items():
+        total = _stage_stats(dest, name)
+        total["calls"] += stats["calls"]
+        total["total_s"] += stats["total_s"]
+        total["max_s"] = max(total["max_s"], stats["max_s"])
+        total["bytes"] += stats["bytes"]
+    for key, value in src["document"].items(): dest["document"].setdefault(key, value)
+    return dest
+
+def profile_report(profile):
+    """Bảng kết quả (JSON được): các bước xếp theo tổng thời gian giảm dần, kèm tỉ lệ so với wall"""
+    wall = profile["wall_s"]
+    stages = []
+    for name, stats in sorted(profile["stages"].items(), key=lambda kv: -kv[1]["total_s"]):
+        stages.append({
+            "stage": name,
+            "calls": stats["calls"],
+            "total_ms": round(stats["total_s"] * 1000, 3),
+            "mean_ms": round(stats["total_s"] * 1000 / stats["calls"], 3) if stats["calls"] else 0.0,
+            "max_ms": round(stats["max_s"] * 1000, 3),
+            "bytes": stats["bytes"],
+            "share": round(stats["total_s"] / wall, 4) if wall else 0.0,
+        })
+    return {"wall_ms": round(wall * 1000, 3), "stages": stages, "document": dict(profile["document"])}
+
+def report_json(report):
+    return json.dumps(report, ensure_ascii=False, indent=2)
+
+def format_report(report):
+    """Bảng kết quả dạng text (dòng lệnh)"""
+    lines = [f"{'bước':<22}{'lần':>7}{'tổng ms':>12}{'tb ms':>10}{'max ms':>10}{'KB':>10}{'%':>7}"]
+    for row in report["stages"]:
+        lines.append(f"{row['stage']:<22}{row['calls']:>7}{row['total_ms']:>12.1f}{row['mean_ms']:>10.2f}"
+                     f"{row['max_ms']:>10.2f}{row['bytes'] / 1024:>10.1f}{row['share'] * 100:>7.1f}")
+    lines.append(f"wall: {report['wall_ms']:.1f} ms")
+    if report["document"]:
+        lines.append("tài liệu: " + ", ".join(f"{k}={v}" for k, v in report["document"].items()))
+    return lines
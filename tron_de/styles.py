@@ -0,0 +1,78 @@
+import xml.etree.ElementTree as ET
+
+# ==================== ĐỊNH DẠNG KẾ THỪA TỪ STYLES.XML ====================
+# Gạch chân / màu chữ của 1 run có thể đến từ định dạng trực tiếp (rPr của run), character style (w:rStyle),
+# paragraph style (w:pStyle, không có thì là style đoạn mặc định) hoặc docDefaults, theo thứ tự ưu tiên đó.
+# styles.xml được đọc 1 lần thành bảng style -> (gạch chân, màu) đã gộp cả chuỗi basedOn,
+# nên mỗi run chỉ cần tra bảng, không phải lần lại styles.xml.
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MARK_PROPS = ("u", "color")
+NO_MARKS = (None, None)
+
+EMPTY_STYLES = {"styles": {}, "paragraph": {}, "default_paragraph": NO_MARKS}
+
+def merge_marks(*levels):
+    """Gộp (u, color) từ cấp ưu tiên cao xuống thấp: mỗi thuộc tính lấy giá trị khai báo đầu tiên
+    (None = cấp đó không khai báo)"""
+    u = color = None
+    for level_u, level_color in levels:
+        if u is None: u = level_u
+        if color is None: color = level_color
+    return u, color
+
+def rpr_marks(rpr):
+    """(u, color) khai báo trong 1 phần tử rPr (ElementTree)"""
+    if rpr is None: return NO_MARKS
+    marks = []
+    for name in MARK_PROPS:
+        el = rpr.find(W + name)
+        marks.append(None if el is None else el.get(W + "val", ""))
+    return tuple(marks)
+
+def parse_styles(data):
+    """styles.xml (bytes) -> bảng định dạng hiệu lực:
+    "styles": {styleId: (u, color)} đã gộp chuỗi basedOn (dùng cho rStyle),
+    "paragraph": {styleId: (u, color)} của paragraph style đã gộp thêm docDefaults,
+    "default_paragraph": (u, color) cho đoạn không có pStyle."""
+    root = ET.fromstring(data)
+    defaults = rpr_marks(root.find(f"{W}docDefaults/{W}rPrDefault/{W}rPr"))
+    own = {}
+    based_on = {}
+    types = {}
+    default_paragraph_id = None
+    for style in root.iter(W + "style"):
+        style_id = style.get(W + "styleId")
+        if style_id is None: continue
+        own[style_id] = rpr_marks(style.find(W + "rPr"))
+        types[style_id] = style.get(W + "type", "paragraph")
+        parent = style.find(W + "basedOn")
+        if parent is not None: based_on[style_id] = parent.get(W + "val")
+        if types[style_id] == "paragraph" and style.get(W + "default") in ("1", "true", "on"):
+            default_paragraph_id = style_id
+
+    resolved = {}
+    def resolve(style_id, seen=()):
+        if style_id in resolved: return resolved[style_id]
+        if style_id not in own or style_id in seen: return NO_MARKS
+        parent = based_on.get(style_id)
+        marks = merge_marks(own[style_id], resolve(parent, seen + (style_id,)) if parent else NO_MARKS)
+        resolved[style_id] = marks
+        return marks
+
+    styles = {style_id: resolve(style_id) for style_id in own}
+    paragraph = {style_id: merge_marks(marks, defaults) for style_id, marks in styles.items()
+                 if types[style_id] == "paragraph"}
+    return {
+        "styles": styles,
+        "paragraph": paragraph,
+        "default_paragraph": paragraph.get(default_paragraph_id, defaults),
+    }
+
+def load_styles(zin):
+    """Bảng định dạng từ word/styles.xml của gói .docx đang mở (zipfile); thiếu hoặc hỏng thì bảng rỗng
+    (chỉ xét định dạng trực tiếp như trước)"""
+    try:
+        return parse_styles(zin.read("word/styles.xml"))
+    except (KeyError, ET.ParseError):
+        return EMPTY_STYLES
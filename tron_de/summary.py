@@ -0,0 +1,175 @@
+import io
+
+from .package import compress_member, write_package
+
+# ==================== FILE WORD ĐÁP ÁN TỔNG HỢP ====================
+# Gói .docx tối giản dựng riêng (chỉ document.xml + styles.xml + các part bắt buộc), không chép lại ảnh/OLE
+# của đề gốc nên chỉ vài KB. document.xml được ghi từng dòng bảng thẳng vào bộ nén, không ghép chuỗi lớn.
+# Số câu mỗi phần lấy theo đáp án thực tế; nhiều mã đề thì bảng được chia thành nhiều bảng nhỏ vừa khổ giấy.
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+# Số mã đề tối đa trên 1 bảng (theo chiều ngang) của Phần I và Phần III
+MCQ_CODES_PER_TABLE = 10
+SA_CODES_PER_TABLE = 6
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '</Types>'
+)
+
+PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+DOCUMENT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    f'<w:styles xmlns:w="{W_NS}">'
+    '<w:docDefaults><w:rPrDefault><w:rPr><w:rFonts w:ascii="Times New Roman" w:hAnsi="Times New Roman" w:cs="Times New Roman" w:eastAsia="Times New Roman"/>'
+    '<w:sz w:val="26"/><w:szCs w:val="26"/><w:lang w:val="vi-VN"/></w:rPr></w:rPrDefault>'
+    '<w:pPrDefault><w:pPr><w:spacing w:after="0" w:line="240" w:lineRule="auto"/></w:pPr></w:pPrDefault></w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    '<w:style w:type="paragraph" w:styleId="Heading1"><w:name w:val="heading 1"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/>'
+    '<w:qFormat/><w:pPr><w:keepNext/><w:spacing w:before="120" w:after="240"/><w:outlineLvl w:val="0"/></w:pPr></w:style>'
+    '<w:style w:type="table" w:default="1" w:styleId="TableNormal"><w:name w:val="Normal Table"/>'
+    '<w:tblPr><w:tblInd w:w="0" w:type="dxa"/><w:tblCellMar><w:top w:w="0" w:type="dxa"/><w:left w:w="108" w:type="dxa"/>'
+    '<w:bottom w:w="0" w:type="dxa"/><w:right w:w="108" w:type="dxa"/></w:tblCellMar></w:tblPr></w:style>'
+    '<w:style w:type="table" w:styleId="TableGrid"><w:name w:val="Table Grid"/><w:basedOn w:val="TableNormal"/>'
+    '<w:tblPr><w:tblBorders><w:top w:val="single" w:sz="4" w:space="0" w:color="auto"/><w:left w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '<w:bottom w:val="single" w:sz="4" w:space="0" w:color="auto"/><w:right w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '<w:insideH w:val="single" w:sz="4" w:space="0" w:color="auto"/><w:insideV w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '</w:tblBorders></w:tblPr></w:style>'
+    '</w:styles>'
+)
+
+TABLE_PROPS = (
+    '<w:tblPr><w:tblStyle w:val="TableGrid"/><w:tblW w:w="0" w:type="auto"/><w:tblBorders><w:top w:val="single" w:sz="4"/>'
+    '<w:left w:val="single" w:sz="4"/><w:bottom w:val="single" w:sz="4"/><w:right w:val="single" w:sz="4"/>'
+    '<w:insideH w:val="single" w:sz="4"/><w:insideV w:val="single" w:sz="4"/></w:tblBorders></w:tblPr>'
+)
+
+# Khổ A4 dọc, lề 2cm
+SECT_PR = ('<w:sectPr><w:pgSz w:w="11906" w:h="16838"/>'
+           '<w:pgMar w:top="1134" w:right="1134" w:bottom="1134" w:left="1134" w:header="709" w:footer="709" w:gutter="0"/></w:sectPr>')
+
+def _escape(text):
+    return str(text).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def make_p(text, bold=False, align='center', size=None):
+    sz_tag = f'<w:sz w:val="{size}"/>' if size else ''
+    b_tag = '<w:b/>' if bold else ''
+    return f'<w:p><w:pPr><w:jc w:val="{align}"/></w:pPr><w:r><w:rPr>{b_tag}{sz_tag}</w:rPr><w:t>{_escape(text)}</w:t></w:r></w:p>'
+
+def make_tc(content, width=None):
+    w_tag = f'<w:tcW w:w="{width}" w:type="dxa"/>' if width else '<w:tcW w:w="0" w:type="auto"/>'
+    return f'<w:tc><w:tcPr>{w_tag}</w:tcPr>{content}</w:tc>'
+
+def make_row(cells):
+    return '<w:tr>' + ''.join(cells) + '</w:tr>'
+
+def collect_keys(all_answers_dict):
+    """Tách đáp án theo phần: (mã đề đã sắp xếp, {mã: PHẦN I}, {mã: PHẦN II}, {mã: PHẦN III})"""
+    ma_des = sorted(all_answers_dict.keys())
+    mcq_keys_map = {}
+    tf_keys_map = {}
+    sa_keys_map = {}
+    for md in ma_des:
+        k = all_answers_dict[md]
+        if 'PHAN1' in k: mcq_keys_map[md] = k['PHAN1']
+        elif 'MCQ_ALL' in k: mcq_keys_map[md] = k['MCQ_ALL']
+        if 'PHAN2' in k: tf_keys_map[md] = k['PHAN2']
+        elif 'TF_ALL' in k: tf_keys_map[md] = k['TF_ALL']
+        if 'PHAN3' in k: sa_keys_map[md] = k['PHAN3']
+    return ma_des, mcq_keys_map, tf_keys_map, sa_keys_map
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)] or [items]
+
+def _question_by_code_tables(keys_map, ma_des, code_width, codes_per_table):
+    """Bảng câu (dòng) x mã đề (cột), mỗi bảng tối đa codes_per_table mã đề; sinh từng dòng"""
+    codes = [md for md in ma_des if md in keys_map]
+    num_questions = max(len(keys_map[md]) for md in codes)
+    for k, group in enumerate(_chunks(codes, codes_per_table)):
+        if k: yield '<w:p/>'
+        yield '<w:tbl>' + TABLE_PROPS
+        yield make_row([make_tc(make_p("Câu \\ Mã", bold=True), width=1200)] +
+                       [make_tc(make_p(str(md), bold=True), width=code_width) for md in group])
+        for i in range(num_questions):
+            cells = [make_tc(make_p(str(i + 1), bold=True))]
+            for md in group:
+                keys = keys_map[md]
+                cells.append(make_tc(make_p(keys[i] if i < len(keys) else "")))
+            yield make_row(cells)
+        yield '</w:tbl>'
+
+def _true_false_table(tf_keys_map, ma_des):
+    """Bảng Phần II: mỗi dòng 1 câu của 1 mã đề, cột là các ý"""
+    codes = [md for md in ma_des if md in tf_keys_map]
+    num_items = max([4] + [len(ans) for md in codes for ans in tf_keys_map[md]])
+    headers = ["Mã đề", "Câu"] + [f"Ý {chr(ord('a') + c)}" for c in range(num_items)]
+    widths = [1000] + [800] * (num_items + 1)
+    yield '<w:tbl>' + TABLE_PROPS
+    yield make_row([make_tc(make_p(h, bold=True), width=w) for h, w in zip(headers, widths)])
+    for md in codes:
+        for i, ans_list in enumerate(tf_keys_map[md]):
+            cells = [make_tc(make_p(str(md))), make_tc(make_p(str(i + 1), bold=True))]
+            cells += [make_tc(make_p(ans_list[c] if c < len(ans_list) else "")) for c in range(num_items)]
+            yield make_row(cells)
+    yield '</w:tbl>'
+
+def iter_summary_document(all_answers_dict):
+    """document.xml của file đáp án tổng hợp, sinh dần từng mảnh bytes (không ghép thành 1 chuỗi lớn)"""
+    ma_des, mcq_keys_map, tf_keys_map, sa_keys_map = collect_keys(all_answers_dict)
+    parts = []
+    if mcq_keys_map:
+        parts.append(("PHẦN I: TRẮC NGHIỆM", _question_by_code_tables(mcq_keys_map, ma_des, 800, MCQ_CODES_PER_TABLE)))
+    if tf_keys_map:
+        parts.append(("PHẦN II: ĐÚNG SAI", _true_false_table(tf_keys_map, ma_des)))
+    if sa_keys_map:
+        parts.append(("PHẦN III: TRẢ LỜI NGẮN", _question_by_code_tables(sa_keys_map, ma_des, 1500, SA_CODES_PER_TABLE)))
+
+    yield ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+           f'<w:document xmlns:w="{W_NS}"><w:body>'
+           '<w:p><w:pPr><w:pStyle w:val="Heading1"/><w:jc w:val="center"/></w:pPr><w:r><w:rPr><w:b/><w:sz w:val="32"/></w:rPr>'
+           '<w:t>BẢNG ĐÁP ÁN TỔNG HỢP</w:t></w:r></w:p>').encode('utf-8')
+    for k, (title, table) in enumerate(parts):
+        if k: yield b'<w:p/>'
+        yield make_p(title, bold=True, align='left', size='28').encode('utf-8')
+        for piece in table: yield piece.encode('utf-8')
+    yield (SECT_PR + '</w:body></w:document>').encode('utf-8')
+
+def write_summary_docx(fp, all_answers_dict, compression=None):
+    """Ghi file Word đáp án tổng hợp ra fp (nén theo preset compression). Trả về False nếu không có mã đề nào."""
+    if not all_answers_dict: return False
+    members = [
+        compress_member("[Content_Types].xml", CONTENT_TYPES.encode('utf-8'), compression=compression),
+        compress_member("_rels/.rels", PACKAGE_RELS.encode('utf-8'), compression=compression),
+        {"name": "word/document.xml", "variable": True},
+        compress_member("word/_rels/document.xml.rels", DOCUMENT_RELS.encode('utf-8'), compression=compression),
+        compress_member("word/styles.xml", STYLES.encode('utf-8'), compression=compression),
+    ]
+    write_package(fp, {"source": b"", "members": members},
+                  {"word/document.xml": iter_summary_document(all_answers_dict)}, compression)
+    return True
+
+def generate_summary_docx(file_bytes, all_answers_dict, compression=None):
+    """File Word đáp án tổng hợp (bytes); b"" nếu không có mã đề nào.
+    file_bytes: đề gốc, không còn dùng (giữ tham số để không đổi cách gọi cũ generate_summary_docx(file_bytes, answers))"""
+    output_buffer = io.BytesIO()
+    if not write_summary_docx(output_buffer, all_answers_dict, compression): return b""
+    return output_buffer.getvalue()
@@ -0,0 +1,153 @@
+# ==================== KIỂM TRA CẤU TRÚC ĐỀ: MỌI PHẦN, MỌI NHÓM CÂU, 1 LƯỢT ====================
+# Chạy trên nhãn block (classify_blocks) + các phần đã phân tích (analyze_part) nên không parse lại XML:
+# mỗi block chỉ được xét 1-2 lần, đề 100 câu mất cỡ 1 ms (chưa tính đọc file).
+# Kết quả là list các lỗi dạng dict (không phải chuỗi hiển thị):
+#   {"code", "severity": "error" | "warning" | "info", "part": 1/2/3, "question": câu thứ mấy trong phần,
+#    "number": câu thứ mấy trong cả đề gốc (đếm liên tục qua các phần, như ô "Câu hỏi KHÔNG trộn vị trí"),
+#    "block": chỉ số đoạn văn/bảng trong body, "snippet": trích đoạn text, "message": câu mô tả}
+# Có lỗi mức "error" thì đề không hợp lệ. format_diagnostic() đổi 1 lỗi thành dòng chữ cho giao diện / CLI.
+
+SNIPPET_LENGTH = 40
+
+DIAGNOSTICS = {
+    "read_error": ("error", "Lỗi khi đọc file: {error}"),
+    "auto_split": ("info", "Đã tự động tách {count} dòng đáp án bị dính liền."),
+    "no_questions": ("error", "Không tìm thấy câu hỏi nào bắt đầu bằng 'Câu ...'."),
+    "part_empty": ("error", "Không tìm thấy câu hỏi nào trong phần này. Hãy kiểm tra lại từ khóa 'Câu ...'."),
+    "option_outside_question": ("warning", "Dòng đáp án nằm ngoài câu hỏi (thiếu dòng 'Câu ...' phía trước?), "
+                                           "dòng này không được trộn."),
+    "option_gap": ("error", "Có dòng khác xen giữa các đáp án, dòng này sẽ bị mất khi trộn "
+                            "(hãy gộp vào dòng đáp án phía trên)."),
+    "mcq_too_few_options": ("error", "Chỉ tìm thấy {count} đáp án (A,B,C,D). Có thể do định dạng tab chưa chuẩn."),
+    "mcq_too_many_options": ("warning", "Có {count} dòng đáp án A-D (trùng nhãn đáp án?)."),
+    "mcq_no_correct": ("error", "Chưa chọn đáp án đúng (Chưa gạch chân hoặc tô đỏ)."),
+    "mcq_multiple_correct": ("error", "Có {count} đáp án được đánh dấu đúng (Chỉ được phép có 1)."),
+    "tf_missing_options": ("error", "Thiếu ý {labels} (câu đúng/sai cần đủ 4 ý a), b), c), d))."),
+    "tf_duplicate_option": ("error", "Ý {label}) xuất hiện {count} lần."),
+    "tf_no_marked": ("warning", "Không ý nào được đánh dấu đúng (gạch chân hoặc tô đỏ): đáp án sẽ là S cả 4 ý."),
+    "sa_no_answer": ("warning", "Chưa có dòng 'Đáp án: ...', file đáp án sẽ để trống câu này."),
+    "sa_empty_answer": ("warning", "Dòng đáp án để trống."),
+    "sa_multiple_answers": ("warning", "Có {count} dòng đáp án, chỉ lấy dòng cuối cùng."),
+    "cluster_unclosed": ("error", "Nhóm câu dùng chung chưa có dòng @KẾT THÚC DÙNG CHUNG@ để đóng nhóm."),
+    "cluster_nested": ("error", "Gặp @BẮT ĐẦU DÙNG CHUNG@ khi nhóm câu dùng chung trước chưa đóng."),
+    "cluster_stray_end": ("warning", "Dòng @KẾT THÚC DÙNG CHUNG@ không có dòng @BẮT ĐẦU DÙNG CHUNG@ tương ứng."),
+    "cluster_empty": ("warning", "Nhóm câu dùng chung không có câu hỏi nào."),
+    "bank_notes_skipped": ("warning", "Câu có chú thích {kind}, ngân hàng không chép được phần chú thích: "
+                                      "không nhập câu này (bỏ chú thích rồi nhập lại nếu cần)."),
+}
+SEVERITY_ICONS = {"error": "❌", "warning": "⚠️", "info": "✅"}
+PART_NUMBERS = {"PHAN1": 1, "PHAN2": 2, "PHAN3": 3}
+
+def snippet_text(text):
+    text = " ".join(text.split())
+    return text if len(text) <= SNIPPET_LENGTH else text[:SNIPPET_LENGTH - 1] + "…"
+
+def diagnostic(code, part=None, question=None, block=None, snippet="", **params):
+    """1 lỗi / lưu ý kiểm tra cấu trúc (xem DIAGNOSTICS). question: (câu trong phần, câu trong cả đề) hoặc None"""
+    severity, template = DIAGNOSTICS[code]
+    return {"code": code, "severity": severity, "part": part,
+            "question": question[0] if question else None, "number": question[1] if question else None,
+            "block": block, "snippet": snippet, "message": template.format(**params)}
+
+def is_valid(diagnostics):
+    return not any(d["severity"] == "error" for d in diagnostics)
+
+def format_diagnostic(d):
+    """Dòng chữ hiển thị cho 1 lỗi, vd: ❌ Phần 1, Câu 3 ("Câu 3. Cho hàm số…"): Chưa chọn đáp án đúng..."""
+    where = []
+    if d["part"] is not None: where.append(f"Phần {d['part']}")
+    if d["question"] is not None: where.append(f"Câu {d['question']}")
+    location = ", ".join(where)
+    if d["snippet"]: location = f'{location} ("{d["snippet"]}")' if location else f'"{d["snippet"]}"'
+    return f"{SEVERITY_ICONS[d['severity']]} {location + ': ' if location else ''}{d['message']}"
+
+def _check_clusters(tags, part, part_no, out):
+    # Cặp dòng mở/đóng nhóm dùng chung trong phần (parse_questions_in_range không báo thiếu / thừa)
+    open_at = None
+    for i in range(part["start"], part["end"]):
+        tag = tags[i]
+        if tag["cluster_start"]:
+            if open_at is not None:
+                out.append(diagnostic("cluster_nested", part_no, block=i, snippet=snippet_text(tag["text"])))
+            open_at = i
+        elif tag["cluster_end"]:
+            if open_at is None:
+                out.append(diagnostic("cluster_stray_end", part_no, block=i, snippet=snippet_text(tag["text"])))
+            open_at = None
+    if open_at is not None:
+        out.append(diagnostic("cluster_unclosed", part_no, block=open_at, snippet=snippet_text(tags[open_at]["text"])))
+
+def _check_gap(tags, blocks, option_positions, part_no, position, out):
+    # Các dòng nằm giữa đáp án đầu và đáp án cuối mà không phải đáp án bị bỏ khi trộn (xem shuffle_*_options)
+    if not option_positions: return
+    first, last = min(option_positions), max(option_positions)
+    if last - first + 1 == len(option_positions): return
+    options = set(option_positions)
+    gap = next(pos for pos in range(first, last + 1) if pos not in options)
+    out.append(diagnostic("option_gap", part_no, position, blocks[gap], snippet_text(tags[blocks[gap]]["text"])))
+
+def _check_question(tags, question, part_type, part_no, position, out):
+    # position: (câu thứ mấy trong phần, câu thứ mấy trong cả đề)
+    blocks = question["blocks"]
+    at = (part_no, position, blocks[0], snippet_text(tags[blocks[0]]["text"]))
+    if part_type == "PHAN1":
+        options = question["options"]
+        if len(options) < 4: out.append(diagnostic("mcq_too_few_options", *at, count=len(options)))
+        elif len(options) > 4: out.append(diagnostic("mcq_too_many_options", *at, count=len(options)))
+        correct = sum(1 for pos in options if tags[blocks[pos]]["correct"])
+        if correct == 0: out.append(diagnostic("mcq_no_correct", *at))
+        elif correct > 1: out.append(diagnostic("mcq_multiple_correct", *at, count=correct))
+        _check_gap(tags, blocks, options, part_no, position, out)
+    elif part_type == "PHAN2":
+        positions = [pos for pos, b in enumerate(blocks) if tags[b]["tf"]]
+        seen = {}
+        for pos in positions:
+            seen.setdefault(tags[blocks[pos]]["tf"], []).append(blocks[pos])
+        for label, found in seen.items():
+            if len(found) > 1:
+                out.append(diagnostic("tf_duplicate_option", part_no, position, found[1], snippet_text(tags[found[1]]["text"]),
+                                      label=label, count=len(found)))
+        missing = [label for label in "abcd" if label not in seen]
+        if missing: out.append(diagnostic("tf_missing_options", *at, labels=", ".join(f"{m})" for m in missing)))
+        if positions and not any(tags[blocks[pos]]["correct"] for pos in positions):
+            out.append(diagnostic("tf_no_marked", *at))
+        _check_gap(tags, blocks, positions, part_no, position, out)
+    elif part_type == "PHAN3":
+        answers = [b for b in blocks if tags[b]["answer"] is not None]
+        if not answers: out.append(diagnostic("sa_no_answer", *at))
+        elif len(answers) > 1: out.append(diagnostic("sa_multiple_answers", *at, count=len(answers)))
+        if answers and not tags[answers[-1]]["answer"]:
+            out.append(diagnostic("sa_empty_answer", part_no, position, answers[-1], snippet_text(tags[answers[-1]]["text"])))
+
+def validate_sections(tags, sections, fixed_count=0):
+    """Kiểm tra mọi phần cần trộn (sections: như model["sections"], part có "start"/"end").
+    Trả về (hợp lệ?, list lỗi dạng dict)."""
+    out = []
+    if fixed_count > 0: out.append(diagnostic("auto_split", count=fixed_count))
+    number = 0
+    for part in sections:
+        if part["type"] != "part": continue
+        in_part = 0
+        part_type = part["part_type"]
+        part_no = PART_NUMBERS.get(part_type)
+        option_key = "mcq" if part_type == "PHAN1" else "tf" if part_type == "PHAN2" else None
+        if option_key:
+            for i in part["intro"]:
+                if tags[i][option_key]:
+                    out.append(diagnostic("option_outside_question", part_no, block=i, snippet=snippet_text(tags[i]["text"])))
+        _check_clusters(tags, part, part_no, out)
+        if not part["items"] and part["end"] > part["start"]:
+            out.append(diagnostic("part_empty", part_no))
+        for item in part["items"]:
+            questions = [item["question"]] if item["type"] == "question" else item["questions"]
+            if item["type"] == "cluster" and not questions:
+                first = item["header"][0] if item["header"] else None
+                out.append(diagnostic("cluster_empty", part_no, block=first,
+                                      snippet=snippet_text(tags[first]["text"]) if first is not None else ""))
+            for question in questions:
+                number += 1
+                in_part += 1
+                _check_question(tags, question, part_type, part_no, (in_part, number), out)
+    if number == 0 and not any(d["code"] == "part_empty" for d in out):
+        out.append(diagnostic("no_questions"))
+    return is_valid(out), out
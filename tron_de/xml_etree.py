@@ -0,0 +1,264 @@
+import io
+import copy
+import xml.etree.ElementTree as ET
+
+# ==================== XML BACKEND: ELEMENTTREE ====================
+# Cùng bộ hàm với xml_minidom.py nhưng dựng cây bằng ElementTree (C): ít bộ nhớ hơn nhiều và parse nhanh hơn.
+# ElementTree không giữ prefix namespace, nên khai báo xmlns được ghi lại thành thuộc tính "xmlns:..." ngay
+# khi parse và có bộ serialize riêng, cho ra đúng chuỗi XML như minidom.toxml() (cùng prefix, cùng thứ tự
+# thuộc tính, cùng cách escape). Comment/PI nằm ngoài phần tử gốc không được giữ lại.
+
+NAME = "etree"
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+
+# Prefix cho namespace của node tạo mới mà file gốc không khai báo (ghi theo qname lúc tạo, như minidom)
+_fallback_prefixes = {XML_NS: "xml"}
+
+def _events(source, extra=()):
+    """iterparse, khai báo xmlns được ghi thành thuộc tính ngay trên phần tử khai báo (minidom đặt chúng lên đầu
+    danh sách thuộc tính); yield (event, phần tử) cho "start" và các event trong extra"""
+    parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True, insert_pis=True))
+    pending = []
+    for event, item in ET.iterparse(source, events=("start-ns", "start") + tuple(extra), parser=parser):
+        if event == "start-ns":
+            pending.append(item)
+            continue
+        if event == "start" and pending:
+            attrib = {("xmlns:" + prefix if prefix else "xmlns"): uri for prefix, uri in pending}
+            attrib.update(item.attrib)
+            item.attrib.clear()
+            item.attrib.update(attrib)
+            pending = []
+        yield event, item
+
+def _new_doc(root, body_elem):
+    doc = {"root": root, "nsmap": {}}
+    doc["nsmap"] = _scope(_scope({XML_NS: "xml"}, root), body_elem)
+    return doc
+
+def parse(data):
+    root = None
+    for _, item in _events(io.BytesIO(data)):
+        if root is None: root = item
+    return _new_doc(root, next(root.iter("{%s}body" % W_NS)))
+
+def iter_parse(source):
+    """Đọc document.xml kiểu streaming từ luồng source (chỉ cần read()): yield doc ngay khi gặp w:body (khung tài
+    liệu, body chưa có gì), rồi lần lượt từng phần tử con của body khi đã đọc trọn. Phần tử đã yield được gỡ khỏi
+    body, nên cây chỉ giữ phần ngoài body + block đang xử lý. Hết luồng thì doc giống parse() với body rỗng."""
+    body_tag = "{%s}body" % W_NS
+    root = body_elem = None
+    in_body = False
+    depth = 0
+    for event, item in _events(source, ("end",)):
+        if event == "start":
+            depth += 1
+            if root is None: root = item
+            elif depth == 2 and item.tag == body_tag and body_elem is None:
+                body_elem = item
+                in_body = True
+                yield _new_doc(root, body_elem)
+            continue
+        depth -= 1
+        if item is body_elem: in_body = False
+        elif in_body and depth == 2:
+            yield item
+            body_elem.remove(item)
+
+def parse_fragment(doc, data):
+    """Dựng lại cây của 1 block từ mảnh XML (bytes) do to_xml(doc, block) tạo ra"""
+    nsmap = dict(_fallback_prefixes)
+    nsmap.update(doc["nsmap"])
+    decls = " ".join(('xmlns:%s="%s"' % (prefix, _escape(uri)) if prefix else 'xmlns="%s"' % _escape(uri))
+                     for uri, prefix in nsmap.items() if uri != XML_NS)
+    source = b"<fragment " + decls.encode('utf-8') + b">" + data + b"</fragment>"
+    if b"xmlns" in data:
+        wrapper = None
+        for _, item in _events(io.BytesIO(source)):
+            if wrapper is None: wrapper = item
+    else:
+        # Mảnh không tự khai báo namespace (hầu hết): parse thẳng bằng C, không cần duyệt event
+        parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True, insert_pis=True))
+        parser.feed(source)
+        wrapper = parser.close()
+    node = wrapper[0]
+    node.tail = None
+    return node
+
+def _scope(nsmap, elem):
+    """Bảng uri -> prefix cho phần tử con của elem"""
+    decls = [(k, v) for k, v in elem.attrib.items() if k.startswith("xmlns")]
+    if not decls: return nsmap
+    nsmap = dict(nsmap)
+    for key, uri in reversed(decls): nsmap[uri] = key[6:]
+    return nsmap
+
+def body(doc):
+    return next(doc["root"].iter("{%s}body" % W_NS))
+
+def children(node):
+    return [child for child in node if isinstance(child.tag, str)]
+
+def local_name(node):
+    tag = node.tag
+    if not isinstance(tag, str): return None
+    return tag.rpartition("}")[2]
+
+def namespace(node):
+    tag = node.tag
+    if not isinstance(tag, str) or tag[0] != "{": return None
+    return tag[1:].partition("}")[0]
+
+def _add_text(parent, text, after=None):
+    if not text: return
+    if after is not None: after.tail = (after.tail or "") + text
+    else: parent.text = (parent.text or "") + text
+
+def clear_children(node):
+    del node[:]
+    node.text = None
+
+def append(parent, node):
+    parent.append(node)
+
+def prepend(parent, node):
+    # minidom chèn trước cả node text đứng đầu
+    node.tail = parent.text
+    parent.text = None
+    parent.insert(0, node)
+
+def insert_before(parent, node, ref):
+    if ref is None: parent.append(node)
+    else: parent.insert(list(parent).index(ref), node)
+
+def insert_after(parent, ref, node):
+    # Node text ngay sau ref vẫn nằm sau node mới (như insertBefore(node, ref.nextSibling))
+    node.tail = ref.tail
+    ref.tail = None
+    parent.insert(list(parent).index(ref) + 1, node)
+
+def remove(parent, node):
+    # Giữ lại node text đứng sau node bị xoá
+    siblings = list(parent)
+    pos = siblings.index(node)
+    _add_text(parent, node.tail, siblings[pos - 1] if pos > 0 else None)
+    node.tail = None
+    parent.remove(node)
+
+def append_text(parent, text):
+    _add_text(parent, text, parent[-1] if len(parent) else None)
+
+def clone(node):
+    new = copy.deepcopy(node)
+    new.tail = None
+    return new
+
+def shallow_clone(node):
+    """Bản sao node cùng thuộc tính, không có node con"""
+    return ET.Element(node.tag, dict(node.attrib))
+
+def replace_children(node, new_children):
+    """Thay toàn bộ nội dung của node bằng new_children (node text cũ bị bỏ)"""
+    for child in new_children: child.tail = None
+    node[:] = new_children
+    node.text = None
+
+def descendants(node, ns, local):
+    return [el for el in node.iter("{%s}%s" % (ns, local)) if el is not node]
+
+def get_attr(node, ns, local):
+    return node.get("{%s}%s" % (ns, local), "")
+
+def set_attr(node, ns, qname, value):
+    prefix, _, local = qname.rpartition(":")
+    _fallback_prefixes.setdefault(ns, prefix)
+    node.set("{%s}%s" % (ns, local), value)
+
+def new_element(near, ns, qname):
+    prefix, _, local = qname.rpartition(":")
+    _fallback_prefixes.setdefault(ns, prefix)
+    return ET.Element("{%s}%s" % (ns, local))
+
+def text(t):
+    """Nội dung của w:t, None nếu không có node text"""
+    return t.text
+
+def set_text(t, value):
+    t.text = value
+
+def text_nodes(node, ns):
+    """Các w:t theo thứ tự tài liệu kèm node cha"""
+    tag = "{%s}t" % ns
+    pairs = []
+    def walk(el):
+        for child in el:
+            if child.tag == tag: pairs.append((child, el))
+            walk(child)
+    walk(node)
+    return pairs
+
+def move_children(dest, src, skip):
+    """Chuyển các node con của src (trừ localName trong skip) sang cuối dest, kể cả node text"""
+    append_text(dest, src.text)
+    src.text = None
+    for child in list(src):
+        tail = child.tail
+        child.tail = None
+        if local_name(child) not in skip:
+            src.remove(child)
+            dest.append(child)
+        append_text(dest, tail)
+
+# --- SERIALIZE GIỐNG minidom.toxml() ---
+
+def _escape(data):
+    if "&" in data: data = data.replace("&", "&amp;")
+    if "<" in data: data = data.replace("<", "&lt;")
+    if '"' in data: data = data.replace('"', "&quot;")
+    if ">" in data: data = data.replace(">", "&gt;")
+    return data
+
+def _qname(tag, nsmap):
+    if tag[0] != "{": return tag
+    uri, _, local = tag[1:].partition("}")
+    prefix = nsmap.get(uri)
+    if prefix is None: prefix = _fallback_prefixes.get(uri, "")
+    return prefix + ":" + local if prefix else local
+
+def _write(elem, nsmap, out):
+    tag = elem.tag
+    if tag is ET.Comment:
+        out.append("<!--%s-->" % elem.text)
+        return
+    if tag is ET.ProcessingInstruction:
+        target, _, data = elem.text.partition(" ")
+        out.append("<?%s %s?>" % (target, data))
+        return
+    attrib = elem.attrib
+    if attrib and next(iter(attrib)).startswith("xmlns"): nsmap = _scope(nsmap, elem)
+    name = _qname(tag, nsmap)
+    out.append("<" + name)
+    for key, value in attrib.items():
+        if key[0] == "{": key = _qname(key, nsmap)
+        out.append(' %s="%s"' % (key, _escape(value)))
+    if elem.text is None and not len(elem):
+        out.append("/>")
+        return
+    out.append(">")
+    if elem.text: out.append(_escape(elem.text))
+    for child in elem:
+        _write(child, nsmap, out)
+        if child.tail: out.append(_escape(child.tail))
+    out.append("</%s>" % name)
+
+def to_xml(doc, node):
+    out = []
+    _write(node, doc["nsmap"], out)
+    return "".join(out)
+
+def doc_to_xml(doc):
+    out = ['<?xml version="1.0" ?>']
+    _write(doc["root"], {XML_NS: "xml"}, out)
+    return "".join(out)
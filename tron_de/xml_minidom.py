@@ -0,0 +1,90 @@
+from xml.dom import minidom
+
+# ==================== XML BACKEND: MINIDOM ====================
+# Cài đặt gốc (thư viện chuẩn). Mọi backend cung cấp cùng bộ hàm dưới đây; core.py chỉ thao tác
+# XML qua bộ hàm này (xem xml_backend_scope trong core.py).
+
+NAME = "minidom"
+
+def parse(data):
+    return minidom.parseString(data.decode('utf-8'))
+
+def body(doc):
+    return doc.getElementsByTagNameNS("http://schemas.openxmlformats.org/wordprocessingml/2006/main", "body")[0]
+
+def children(node):
+    return [child for child in node.childNodes if child.nodeType == child.ELEMENT_NODE]
+
+def local_name(node):
+    return node.localName
+
+def namespace(node):
+    return node.namespaceURI
+
+def clear_children(node):
+    for child in list(node.childNodes): node.removeChild(child)
+
+def append(parent, node):
+    parent.appendChild(node)
+
+def prepend(parent, node):
+    parent.insertBefore(node, parent.firstChild)
+
+def insert_before(parent, node, ref):
+    parent.insertBefore(node, ref)
+
+def insert_after(parent, ref, node):
+    parent.insertBefore(node, ref.nextSibling)
+
+def remove(parent, node):
+    parent.removeChild(node)
+
+def append_text(parent, text):
+    parent.appendChild(parent.ownerDocument.createTextNode(text))
+
+def clone(node):
+    return node.cloneNode(True)
+
+def shallow_clone(node):
+    """Bản sao node cùng thuộc tính, không có node con"""
+    return node.cloneNode(False)
+
+def replace_children(node, new_children):
+    """Thay toàn bộ nội dung của node bằng new_children (node text cũ bị bỏ)"""
+    clear_children(node)
+    for child in new_children: node.appendChild(child)
+
+def descendants(node, ns, local):
+    return node.getElementsByTagNameNS(ns, local)
+
+def get_attr(node, ns, local):
+    return node.getAttributeNS(ns, local)
+
+def set_attr(node, ns, qname, value):
+    node.setAttributeNS(ns, qname, value)
+
+def new_element(near, ns, qname):
+    doc = near if near.nodeType == near.DOCUMENT_NODE else near.ownerDocument
+    return doc.createElementNS(ns, qname)
+
+def text(t):
+    """Nội dung của w:t, None nếu không có node text"""
+    return t.firstChild.nodeValue if t.firstChild else None
+
+def set_text(t, value):
+    t.firstChild.nodeValue = value
+
+def text_nodes(node, ns):
+    """Các w:t theo thứ tự tài liệu kèm node cha"""
+    return [(t, t.parentNode) for t in node.getElementsByTagNameNS(ns, "t")]
+
+def move_children(dest, src, skip):
+    """Chuyển các node con của src (trừ localName trong skip) sang cuối dest"""
+    moved = [child for child in src.childNodes if child.localName not in skip]
+    for child in moved: dest.appendChild(child)
+
+def to_xml(doc, node):
+    return node.toxml()
+
+def doc_to_xml(doc):
+    return doc.toxml()